@@ -1,4 +1,11 @@
-from substring_matcher import substring_matcher_cli
+import sys
+
+from substring_matcher import headless_cli, substring_matcher_cli
 
 if __name__ == '__main__':
-    substring_matcher_cli.main()
+    if sys.argv[1:] == ['--stream']:
+        substring_matcher_cli.main_streaming()
+    elif sys.argv[1:]:
+        sys.exit(headless_cli.main(sys.argv[1:]))
+    else:
+        substring_matcher_cli.main()
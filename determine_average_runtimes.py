@@ -1,123 +1,73 @@
-import datetime
+import argparse
+import json
+import os
 
+from substring_matcher.benchmark import run_benchmarks
 from substring_matcher.constants import (
+    DEFAULT_KEYWORDS_FILE,
     NUMBER_OF_DESIRED_RUNS,
-    SHORTEST_URL,
-    THREE_HUNDRED_CHARS_URL,
-    TWO_THOUSAND_CHARS_URL,
-    ELEVEN_THOUSAND_CHARS_URL
+    NUMBER_OF_SCALING_RUNS,
+    NUMBER_OF_WARMUP_RUNS,
+    RUNTIME_TEST_KEYWORDS_FILE,
+    SUBSTRING_MATCHER_DATA_PATH
 )
-from substring_matcher.trie_builder import TrieBuilder
+from substring_matcher.utils.file_paths import resource_path
 
 
-def determine_average_runtime_for_matching_keywords(url: str) -> int:
+def find_keywords_file_name() -> str:
     """
-    Determines the average time it takes (in milliseconds)
-    to iterate through a url and retrieve the matching
-    keywords using the find_matching_substrings method.
+    Uses the large runtime test keywords file when it is present
+    and falls back to the default keywords file otherwise.
     """
-    trie_builder = TrieBuilder()
-    trie_builder.file_name = 'runtime_test_keywords.txt'
-    # build the trie
-    new_trie = trie_builder.build_trie_from_file()[0]
-    # print(new_trie.find_matching_substrings(url))
-
-    # run the method a specified number of times.
-    # collect the runtime from each method call.
-    # calculate and return the average runtime.
-    runtimes = []
-
-    for _ in range(NUMBER_OF_DESIRED_RUNS):
-        start_time = datetime.datetime.now()
-        new_trie.find_matching_substrings(url)
-        end_time = datetime.datetime.now()
-
-        runtime = (end_time - start_time).total_seconds() * 1000
-        runtimes.append(runtime)
-
-    average_runtime = sum(runtimes)/(len(runtimes))
-
-    return average_runtime
-
-
-def print_average_runtimes():
-    average_runtime_short = determine_average_runtime_for_matching_keywords(
-        SHORTEST_URL)
-
-    average_runtime_medium = determine_average_runtime_for_matching_keywords(
-        THREE_HUNDRED_CHARS_URL)
-
-    average_runtime_long = determine_average_runtime_for_matching_keywords(
-        TWO_THOUSAND_CHARS_URL)
-
-    average_runtime_super_long = determine_average_runtime_for_matching_keywords(
-        ELEVEN_THOUSAND_CHARS_URL)
-
-    print(
-        f"The Average Runtime for a short url is: {average_runtime_short} ms")
-    print(
-        f"The Average Runtime for a medium url is: {average_runtime_medium} ms")
-    print(f"The Average Runtime for a long url is: {average_runtime_long} ms")
-    print(
-        f"The Average Runtime for a super long url is: {average_runtime_super_long} ms")
-
-
-print_average_runtimes()
-print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
-
-# print_average_runtimes()
-# print("\n-------------------------------------\n")
+    if os.path.exists(resource_path(f"{SUBSTRING_MATCHER_DATA_PATH}/{RUNTIME_TEST_KEYWORDS_FILE}")):
+        return RUNTIME_TEST_KEYWORDS_FILE
+
+    return DEFAULT_KEYWORDS_FILE
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the substring matcher and prints the results as JSON.")
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument('--keywords-file', default=find_keywords_file_name(),
+                        help="Keywords file in the data folder used for the fixed URLs.")
+    parser.add_argument('--runs', type=int, default=NUMBER_OF_DESIRED_RUNS)
+    parser.add_argument('--warmup-runs', type=int, default=NUMBER_OF_WARMUP_RUNS)
+    parser.add_argument('--scaling-runs', type=int, default=NUMBER_OF_SCALING_RUNS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true',
+                        help="Use small scaling curves for a fast smoke test.")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    scaling_options: dict = {}
+
+    if arguments.quick:
+        scaling_options = {
+            'keyword_counts': [100, 1000],
+            'url_lengths': [32, 256],
+            'match_densities': [0.0, 0.1],
+            'prefilter_keyword_counts': [10, 1000]
+        }
+
+    results: dict = run_benchmarks(
+        keywords_file_name=arguments.keywords_file,
+        runs=arguments.runs,
+        warmup_runs=arguments.warmup_runs,
+        scaling_runs=arguments.scaling_runs,
+        seed=arguments.seed,
+        **scaling_options
+    )
+    json_results: str = json.dumps(results, indent=3)
+
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(json_results)
+    else:
+        print(json_results)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,12 +22,14 @@ setup(
     },
     import_package_data=True,
     python_requires=">=3.9",
+    extras_require={"columnar": ["pyarrow"]},
     classifiers=[
         "Natural Language :: English",
         "Intended Audience :: Developers",
         "License :: OSI Approved :: AGPL-3.0 License",
         "Programming Language :: Python :: 3.9",
-    ]
+    ],
     entry_points={"console_scripts": [
-        "substring_matcher_cli=substring_matcher.substrin_matcher_cli:main"]},
+        "substring_matcher_cli=substring_matcher.substring_matcher_cli:main",
+        "substring_matcher=substring_matcher.headless_cli:main"]},
 )
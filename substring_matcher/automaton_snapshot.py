@@ -0,0 +1,264 @@
+import mmap
+import struct
+import sys
+from array import array
+
+from substring_matcher.compact_trie import NO_NODE, CompactTrie
+from substring_matcher.constants import (
+    AHO_CORASICK_ENGINE,
+    AUTOMATON_SNAPSHOT_MAGIC,
+    AUTOMATON_SNAPSHOT_VERSION,
+    COMPACT_BACKEND
+)
+from substring_matcher.trie_builder import TrieBuilder
+
+# magic, format version, node count, edge count, keyword count
+SNAPSHOT_HEADER: struct.Struct = struct.Struct('<4sIIII')
+
+READ_ONLY_MESSAGE: str = "Snapshots are read-only. Compile a new snapshot instead."
+
+# mmap.find needs a bytes object, so one is made for each byte up front.
+SINGLE_BYTES: list = [bytes([byte_value]) for byte_value in range(256)]
+
+
+def compile_keywords_file(keywords_file_name: str, snapshot_path: str) -> set:
+    """
+    Builds the automaton for a keywords file in the data folder and
+    writes it to snapshot_path. Returns the invalid keywords.
+    """
+    trie_builder = TrieBuilder(engine=AHO_CORASICK_ENGINE, backend=COMPACT_BACKEND)
+    trie_builder.file_name = keywords_file_name
+    compact_trie, invalid_keywords = trie_builder.build_trie_from_file()
+    write_automaton_snapshot(compact_trie, snapshot_path)
+
+    return invalid_keywords
+
+
+def compile_keywords_file_path(keywords_file_path: str, snapshot_path: str) -> set:
+    """Same as compile_keywords_file, but for a keywords file anywhere on disk."""
+    trie_builder = TrieBuilder(engine=AHO_CORASICK_ENGINE, backend=COMPACT_BACKEND)
+    compact_trie, invalid_keywords = trie_builder.build_trie_from_file_path(keywords_file_path)
+    write_automaton_snapshot(compact_trie, snapshot_path)
+
+    return invalid_keywords
+
+
+def write_automaton_snapshot(compact_trie: CompactTrie, snapshot_path: str):
+    """
+    Writes the packed arrays and Aho-Corasick links of the trie to a
+    little-endian binary file. The 32-bit sections come first, so
+    each one starts on a four byte boundary.
+    """
+    if not isinstance(compact_trie, CompactTrie):
+        raise TypeError
+
+    if not compact_trie.is_automaton_built:
+        compact_trie.build_automaton()
+
+    encoded_keywords: list = [keyword.encode('utf-8') for keyword in compact_trie.keywords]
+    keyword_offsets: array = array('I', [0])
+    for encoded_keyword in encoded_keywords:
+        keyword_offsets.append(keyword_offsets[-1] + len(encoded_keyword))
+
+    sections: list = [
+        compact_trie.child_offsets,
+        compact_trie.child_nodes,
+        compact_trie.failure_links,
+        compact_trie.output_links,
+        compact_trie.depths,
+        compact_trie.keyword_ids,
+        keyword_offsets
+    ]
+
+    with open(snapshot_path, 'wb') as snapshot_file:
+        snapshot_file.write(SNAPSHOT_HEADER.pack(
+            AUTOMATON_SNAPSHOT_MAGIC,
+            AUTOMATON_SNAPSHOT_VERSION,
+            compact_trie.node_count,
+            len(compact_trie.child_nodes),
+            len(compact_trie.keywords)
+        ))
+
+        for section in sections:
+            if sys.byteorder != 'little':
+                section = array(section.typecode, section)
+                section.byteswap()
+            snapshot_file.write(section.tobytes())
+
+        snapshot_file.write(compact_trie.is_end_of_word)
+        snapshot_file.write(compact_trie.child_labels)
+        snapshot_file.write(b''.join(encoded_keywords))
+
+
+class AutomatonSnapshot(CompactTrie):
+    """
+    A read-only CompactTrie that matches directly against a snapshot
+    file mapped into memory. Loading only reads the header, and every
+    process that opens the same file shares its pages through the OS
+    page cache.
+    """
+
+    def __init__(self, snapshot_path: str):
+        if not isinstance(snapshot_path, str):
+            raise TypeError
+
+        super().__init__(engine=AHO_CORASICK_ENGINE)
+        self.snapshot_path: str = snapshot_path
+        self.mapped_file: mmap.mmap = None
+        self.buffer: memoryview = None
+        self.keyword_offsets: array = array('I', [0])
+        self.snapshot_file = open(snapshot_path, 'rb')
+
+        # The mapping can fail (an empty file, or an OSError such as
+        # ENOMEM) as well as the checks of its contents, and the file
+        # must be closed whatever goes wrong.
+        try:
+            self.mapped_file = mmap.mmap(self.snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.map_sections()
+        except BaseException:
+            self.close()
+            raise
+
+    def map_sections(self):
+        """
+        Checks the header and points the arrays used by CompactTrie
+        at the matching sections of the mapped file.
+        """
+        if len(self.mapped_file) < SNAPSHOT_HEADER.size:
+            raise ValueError("The snapshot file is too small")
+
+        magic, version, node_count, edge_count, keyword_count = SNAPSHOT_HEADER.unpack_from(
+            self.mapped_file)
+
+        if magic != AUTOMATON_SNAPSHOT_MAGIC:
+            raise ValueError("The file is not an automaton snapshot")
+
+        if version != AUTOMATON_SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Snapshot version {version} is not supported "
+                f"(expected {AUTOMATON_SNAPSHOT_VERSION})")
+
+        section_lengths: list = [
+            ('I', node_count + 1), ('I', edge_count), ('I', node_count), ('i', node_count),
+            ('I', node_count), ('i', node_count), ('I', keyword_count + 1)
+        ]
+        minimum_size: int = SNAPSHOT_HEADER.size + node_count + edge_count + \
+            4 * sum(length for _, length in section_lengths)
+
+        if len(self.mapped_file) < minimum_size:
+            raise ValueError("The snapshot file is truncated or corrupted")
+
+        self.buffer = memoryview(self.mapped_file)
+        offset: int = SNAPSHOT_HEADER.size
+        sections: list = []
+
+        for typecode, length in section_lengths:
+            section = self.buffer[offset:offset + 4 * length].cast(typecode)
+            if sys.byteorder != 'little':
+                section = array(typecode, section)
+                section.byteswap()
+            sections.append(section)
+            offset += 4 * length
+
+        (self.child_offsets, self.child_nodes, self.failure_links, self.output_links,
+         self.depths, self.keyword_ids, self.keyword_offsets) = sections
+
+        self.is_end_of_word = self.buffer[offset:offset + node_count]
+        self.labels_offset: int = offset + node_count
+        self.keywords_offset: int = self.labels_offset + edge_count
+        self.stored_node_count: int = node_count
+        self.stored_keyword_count: int = keyword_count
+
+        if len(self.mapped_file) != self.keywords_offset + self.keyword_offsets[keyword_count]:
+            raise ValueError("The snapshot file is truncated or corrupted")
+        self.is_packed = True
+        self.is_automaton_built = True
+
+    @property
+    def node_count(self) -> int:
+        return self.stored_node_count
+
+    @property
+    def keyword_count(self) -> int:
+        return self.stored_keyword_count
+
+    def get_keyword(self, keyword_id: int) -> str:
+        """Decodes the keyword for the id straight from the mapped file."""
+        if not 0 <= keyword_id < self.stored_keyword_count:
+            raise IndexError("Keyword id out of range")
+
+        return self.mapped_file[
+            self.keywords_offset + self.keyword_offsets[keyword_id]:
+            self.keywords_offset + self.keyword_offsets[keyword_id + 1]
+        ].decode('utf-8')
+
+    def add_keyword(self, keyword: str):
+        raise ValueError(READ_ONLY_MESSAGE)
+
+    def add_sorted_keywords(self, keywords: list):
+        raise ValueError(READ_ONLY_MESSAGE)
+
+    def shift_ids(self, node_offset: int, keyword_offset: int):
+        raise ValueError(READ_ONLY_MESSAGE)
+
+    def graft(self, other: CompactTrie):
+        raise ValueError(READ_ONLY_MESSAGE)
+
+    def find_child(self, node: int, byte_value: int) -> int:
+        """Looks up the child for the byte in the mapped labels."""
+        index: int = self.mapped_file.find(
+            SINGLE_BYTES[byte_value],
+            self.labels_offset + self.child_offsets[node],
+            self.labels_offset + self.child_offsets[node + 1]
+        )
+
+        return NO_NODE if index == -1 else self.child_nodes[index - self.labels_offset]
+
+    def does_word_exist(self, word: str) -> bool:
+        """Checks is the desired word exists inside the snapshot."""
+        if not isinstance(word, str):
+            raise TypeError
+
+        if word == "":
+            return True
+
+        current_node: int = 0
+
+        for byte_value in word.encode('utf-8'):
+            current_node = self.find_child(current_node, byte_value)
+            if current_node == NO_NODE:
+                return False
+
+        return bool(self.is_end_of_word[current_node])
+
+    def memory_usage_in_bytes(self) -> int:
+        """Returns the size of the mapped file."""
+        return len(self.mapped_file)
+
+    def close(self):
+        """Releases the views into the file before unmapping it."""
+        if self.snapshot_file.closed:
+            return
+
+        for section in [self.child_offsets, self.child_nodes, self.failure_links,
+                        self.output_links, self.depths, self.keyword_ids, self.keyword_offsets,
+                        self.is_end_of_word, self.buffer]:
+            if isinstance(section, memoryview):
+                section.release()
+
+        if self.mapped_file is not None:
+            self.mapped_file.close()
+        self.snapshot_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self) -> dict:
+        # Worker processes map the file again instead of copying it.
+        return {'snapshot_path': self.snapshot_path}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state['snapshot_path'])
@@ -0,0 +1,341 @@
+import os
+import platform
+import random
+import time
+from typing import Callable, Dict, List, Tuple
+
+from substring_matcher.constants import (
+    AHO_CORASICK_ENGINE,
+    COMPACT_BACKEND,
+    DAWG_BACKEND,
+    ELEVEN_THOUSAND_CHARS_URL,
+    NODE_BACKEND,
+    NUMBER_OF_DESIRED_RUNS,
+    NUMBER_OF_SCALING_RUNS,
+    NUMBER_OF_WARMUP_RUNS,
+    SHORTEST_URL,
+    THREE_HUNDRED_CHARS_URL,
+    TRIE_WALK_ENGINE,
+    TWO_THOUSAND_CHARS_URL
+)
+from substring_matcher.keyword_prefilter import KeywordPrefilter
+from substring_matcher.trie_builder import TrieBuilder
+
+KEYWORD_CHARACTERS: str = 'abcdefghijklmnopqrstuvwxyz-_'
+URL_FILLER_CHARACTERS: str = 'abcdefghijklmnopqrstuvwxyz0123456789/.?=&'
+
+FIXED_URLS: Dict[str, str] = {
+    'short': SHORTEST_URL,
+    'medium': THREE_HUNDRED_CHARS_URL,
+    'long': TWO_THOUSAND_CHARS_URL,
+    'super_long': ELEVEN_THOUSAND_CHARS_URL
+}
+
+# (engine, backend) pairs that get benchmarked side by side
+BENCHMARK_CONFIGURATIONS: List[Tuple[str, str]] = [
+    (TRIE_WALK_ENGINE, NODE_BACKEND),
+    (AHO_CORASICK_ENGINE, NODE_BACKEND),
+    (TRIE_WALK_ENGINE, COMPACT_BACKEND),
+    (AHO_CORASICK_ENGINE, COMPACT_BACKEND),
+    (TRIE_WALK_ENGINE, DAWG_BACKEND)
+]
+
+DEFAULT_KEYWORD_COUNTS: List[int] = [1000, 10000, 100000]
+DEFAULT_URL_LENGTHS: List[int] = [32, 256, 2048, 16384]
+DEFAULT_MATCH_DENSITIES: List[float] = [0.0, 0.01, 0.1, 0.5]
+DEFAULT_PREFILTER_KEYWORD_COUNTS: List[int] = [10, 100, 1000, 10000, 50000]
+DEFAULT_KEYWORD_COUNT: int = 10000
+DEFAULT_URL_LENGTH: int = 2048
+DEFAULT_MATCH_DENSITY: float = 0.01
+
+
+def generate_keywords(count: int, generator: random.Random,
+                      min_length: int = 3, max_length: int = 12) -> List[str]:
+    """Generates a list of unique, valid keywords."""
+    keywords: set = set()
+
+    while len(keywords) < count:
+        keywords.add(''.join(
+            generator.choice(KEYWORD_CHARACTERS)
+            for _ in range(generator.randint(min_length, max_length))
+        ))
+
+    return sorted(keywords)
+
+
+def generate_url(length: int, keywords: List[str], match_density: float,
+                 generator: random.Random) -> str:
+    """
+    Generates a URL of the given length where roughly match_density
+    of the characters belong to keywords planted in random filler.
+    """
+    if not 0 <= match_density <= 1:
+        raise ValueError("The match density must be between 0 and 1")
+
+    url_parts: List[str] = []
+    current_length: int = 0
+    planted_length: int = 0
+
+    while current_length < length:
+        if keywords and planted_length < match_density * (current_length + 1):
+            part: str = generator.choice(keywords)
+            planted_length += len(part)
+        else:
+            part = generator.choice(URL_FILLER_CHARACTERS)
+
+        url_parts.append(part)
+        current_length += len(part)
+
+    return ''.join(url_parts)[:length]
+
+
+def calculate_percentile(sorted_values: list, percentile: float) -> float:
+    """
+    Returns the percentile of an already sorted list
+    using linear interpolation between the closest ranks.
+    """
+    if not sorted_values:
+        raise ValueError("Cannot calculate a percentile of an empty list")
+
+    rank: float = (len(sorted_values) - 1) * percentile / 100
+    lower_index: int = int(rank)
+    upper_index: int = min(lower_index + 1, len(sorted_values) - 1)
+    fraction: float = rank - lower_index
+
+    return sorted_values[lower_index] + \
+        (sorted_values[upper_index] - sorted_values[lower_index]) * fraction
+
+
+def summarize_runtimes(runtimes_in_ns: List[int], number_of_urls: int,
+                       number_of_bytes: int) -> dict:
+    """
+    Summarizes the runtimes of a benchmark. Each runtime covers one
+    pass over number_of_urls URLs totalling number_of_bytes bytes.
+    """
+    sorted_runtimes: list = sorted(runtimes_in_ns)
+    total_seconds: float = sum(sorted_runtimes) / 1e9
+    runs: int = len(sorted_runtimes)
+
+    return {
+        'runs': runs,
+        'mean_ms': sum(sorted_runtimes) / runs / 1e6,
+        'min_ms': sorted_runtimes[0] / 1e6,
+        'p50_ms': calculate_percentile(sorted_runtimes, 50) / 1e6,
+        'p95_ms': calculate_percentile(sorted_runtimes, 95) / 1e6,
+        'p99_ms': calculate_percentile(sorted_runtimes, 99) / 1e6,
+        'max_ms': sorted_runtimes[-1] / 1e6,
+        'urls_per_second': runs * number_of_urls / total_seconds if total_seconds else None,
+        'megabytes_per_second':
+            runs * number_of_bytes / 1e6 / total_seconds if total_seconds else None
+    }
+
+
+def time_function(function: Callable, runs: int, warmup_runs: int) -> List[int]:
+    """Calls the function warmup_runs times, then times each of the remaining runs."""
+    for _ in range(warmup_runs):
+        function()
+
+    runtimes_in_ns: List[int] = []
+
+    for _ in range(runs):
+        start_time: int = time.perf_counter_ns()
+        function()
+        runtimes_in_ns.append(time.perf_counter_ns() - start_time)
+
+    return runtimes_in_ns
+
+
+def benchmark_matching(trie, urls: List[str], runs: int, warmup_runs: int) -> dict:
+    """Times find_matching_substrings over every URL in the list."""
+    def match_all_urls():
+        for url in urls:
+            trie.find_matching_substrings(url)
+
+    return summarize_runtimes(
+        time_function(match_all_urls, runs, warmup_runs),
+        len(urls),
+        sum(len(url.encode('utf-8')) for url in urls)
+    )
+
+
+def build_trie(keywords: List[str], engine: str, backend: str) -> Tuple[object, float]:
+    """
+    Builds a trie from the keywords and returns it along with
+    the build time in milliseconds. For the Aho-Corasick engine (and
+    the DAWG, which is built from all of the keywords at once), the
+    automaton is built here too, so it is not timed as matching.
+    """
+    start_time: int = time.perf_counter_ns()
+    trie_builder = TrieBuilder(engine=engine, backend=backend)
+    trie_builder.user_keywords = set(keywords)
+    trie = trie_builder.build_trie_from_list()[0]
+
+    if engine == AHO_CORASICK_ENGINE or backend == DAWG_BACKEND:
+        trie.build_automaton()
+
+    return (trie, (time.perf_counter_ns() - start_time) / 1e6)
+
+
+def build_trie_from_file(keywords_file_name: str, engine: str, backend: str) -> Tuple[object, float]:
+    """Same as build_trie, but reads the keywords from a file in the data folder."""
+    start_time: int = time.perf_counter_ns()
+    trie_builder = TrieBuilder(engine=engine, backend=backend)
+    trie_builder.file_name = keywords_file_name
+    trie = trie_builder.build_trie_from_file()[0]
+
+    if engine == AHO_CORASICK_ENGINE or backend == DAWG_BACKEND:
+        trie.build_automaton()
+
+    return (trie, (time.perf_counter_ns() - start_time) / 1e6)
+
+
+def configuration_name(engine: str, backend: str) -> str:
+    return f"{engine}/{backend}"
+
+
+def benchmark_fixed_urls(keywords_file_name: str, configurations: list,
+                         runs: int, warmup_runs: int) -> dict:
+    """Benchmarks the four URLs from constants.py against a keywords file."""
+    results: dict = {}
+
+    for engine, backend in configurations:
+        trie, build_runtime = build_trie_from_file(keywords_file_name, engine, backend)
+        results[configuration_name(engine, backend)] = {
+            'build_ms': build_runtime,
+            'urls': {
+                url_name: benchmark_matching(trie, [url], runs, warmup_runs)
+                for url_name, url in FIXED_URLS.items()
+            }
+        }
+
+    return results
+
+
+def benchmark_scaling_curve(parameter_name: str, parameter_values: list, configurations: list,
+                            runs: int, warmup_runs: int, seed: int, number_of_urls: int) -> list:
+    """
+    Varies one of keyword_count, url_length, or match_density
+    while keeping the other two at their defaults.
+    """
+    curve: list = []
+
+    for parameter_value in parameter_values:
+        settings: dict = {
+            'keyword_count': DEFAULT_KEYWORD_COUNT,
+            'url_length': DEFAULT_URL_LENGTH,
+            'match_density': DEFAULT_MATCH_DENSITY,
+            parameter_name: parameter_value
+        }
+        generator = random.Random(seed)
+        keywords: List[str] = generate_keywords(settings['keyword_count'], generator)
+        urls: List[str] = [
+            generate_url(settings['url_length'], keywords, settings['match_density'], generator)
+            for _ in range(number_of_urls)
+        ]
+        point: dict = {'value': parameter_value, 'results': {}}
+
+        for engine, backend in configurations:
+            trie, build_runtime = build_trie(keywords, engine, backend)
+            point['results'][configuration_name(engine, backend)] = {
+                'build_ms': build_runtime,
+                **benchmark_matching(trie, urls, runs, warmup_runs)
+            }
+
+        curve.append(point)
+
+    return curve
+
+
+def benchmark_prefilter(keyword_counts: list, configurations: list, runs: int, warmup_runs: int,
+                        seed: int, number_of_urls: int) -> list:
+    """
+    Times each configuration with and without a KeywordPrefilter over
+    URLs that contain no planted keywords, for each keyword count.
+    The more keywords there are, the fewer URLs the pre-filter can
+    reject, so this shows where it stops paying for itself.
+    """
+    curve: list = []
+
+    for keyword_count in keyword_counts:
+        generator = random.Random(seed)
+        keywords: List[str] = generate_keywords(keyword_count, generator)
+        urls: List[str] = [
+            generate_url(DEFAULT_URL_LENGTH, keywords, 0.0, generator) for _ in range(number_of_urls)]
+        point: dict = {'value': keyword_count, 'results': {}}
+
+        for engine, backend in configurations:
+            trie = build_trie(keywords, engine, backend)[0]
+
+            start_time: int = time.perf_counter_ns()
+            keyword_prefilter = KeywordPrefilter(trie)
+            keyword_prefilter.get_prefix_pattern()
+            compile_runtime: float = (time.perf_counter_ns() - start_time) / 1e6
+
+            without_prefilter: dict = benchmark_matching(trie, urls, runs, warmup_runs)
+            with_prefilter: dict = benchmark_matching(keyword_prefilter, urls, runs, warmup_runs)
+
+            point['results'][configuration_name(engine, backend)] = {
+                'compile_ms': compile_runtime,
+                'selectivity': keyword_prefilter.selectivity,
+                'without_prefilter_mean_ms': without_prefilter['mean_ms'],
+                'with_prefilter_mean_ms': with_prefilter['mean_ms'],
+                'speedup': without_prefilter['mean_ms'] / with_prefilter['mean_ms']
+                if with_prefilter['mean_ms'] else None
+            }
+
+        curve.append(point)
+
+    return curve
+
+
+def run_benchmarks(keywords_file_name: str = None,
+                   configurations: list = BENCHMARK_CONFIGURATIONS,
+                   runs: int = NUMBER_OF_DESIRED_RUNS,
+                   warmup_runs: int = NUMBER_OF_WARMUP_RUNS,
+                   scaling_runs: int = NUMBER_OF_SCALING_RUNS,
+                   keyword_counts: list = DEFAULT_KEYWORD_COUNTS,
+                   url_lengths: list = DEFAULT_URL_LENGTHS,
+                   match_densities: list = DEFAULT_MATCH_DENSITIES,
+                   prefilter_keyword_counts: list = DEFAULT_PREFILTER_KEYWORD_COUNTS,
+                   number_of_urls: int = 10,
+                   seed: int = 0) -> dict:
+    """
+    Runs every benchmark and returns the results as a dictionary
+    that can be dumped to JSON and compared between releases.
+    """
+    results: dict = {
+        'environment': {
+            'python_version': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count()
+        },
+        'settings': {
+            'runs': runs,
+            'warmup_runs': warmup_runs,
+            'scaling_runs': scaling_runs,
+            'keywords_file': keywords_file_name,
+            'number_of_urls': number_of_urls,
+            'seed': seed
+        },
+        'scaling': {}
+    }
+
+    if keywords_file_name:
+        results['fixed_urls'] = benchmark_fixed_urls(
+            keywords_file_name, configurations, runs, warmup_runs)
+
+    for parameter_name, parameter_values in [('keyword_count', keyword_counts),
+                                             ('url_length', url_lengths),
+                                             ('match_density', match_densities)]:
+        # The synthetic URLs are much longer than the fixed ones,
+        # so the scaling curves warm up for a tenth of their runs.
+        results['scaling'][parameter_name] = benchmark_scaling_curve(
+            parameter_name, parameter_values, configurations,
+            scaling_runs, max(1, scaling_runs // 10), seed, number_of_urls)
+
+    results['prefilter'] = benchmark_prefilter(
+        prefilter_keyword_counts, configurations,
+        scaling_runs, max(1, scaling_runs // 10), seed, number_of_urls)
+
+    return results
@@ -0,0 +1,99 @@
+from array import array
+from itertools import accumulate
+from typing import BinaryIO, Iterator, List, Tuple
+
+from substring_matcher.constants import BINARY_READ_SIZE_IN_BYTES
+from substring_matcher.transition_table import URL_SEPARATOR, TransitionTable
+
+
+def get_transition_table(trie) -> TransitionTable:
+    """
+    Returns the trie's dense transition table. Tries that do not
+    keep one (the compact trie and snapshots) get a new table built
+    from their keywords, with the same keyword ids.
+    """
+    if hasattr(trie, 'get_transition_table'):
+        return trie.get_transition_table()
+
+    return TransitionTable([trie.get_keyword(keyword_id) for keyword_id in range(trie.keyword_count)])
+
+
+def read_line_aligned_chunks(
+        binary_file: BinaryIO,
+        read_size_in_bytes: int = BINARY_READ_SIZE_IN_BYTES) -> Iterator[bytes]:
+    """
+    Reads the binary file (or sys.stdin.buffer) in large blocks and
+    yields chunks that end right after a newline, so no URL is split
+    across two chunks. The last chunk may not end with a newline.
+    """
+    if not isinstance(read_size_in_bytes, int):
+        raise TypeError
+
+    if read_size_in_bytes < 1:
+        raise ValueError("The read size must be at least one byte")
+
+    remainder: bytes = b''
+
+    while True:
+        block: bytes = binary_file.read(read_size_in_bytes)
+
+        if not block:
+            if remainder:
+                yield remainder
+            return
+
+        last_newline: int = block.rfind(URL_SEPARATOR)
+
+        if last_newline == -1:
+            remainder += block
+            continue
+
+        yield remainder + block[:last_newline + 1]
+        remainder = block[last_newline + 1:]
+
+
+def match_line_aligned_chunk(
+        transition_table: TransitionTable,
+        chunk: bytes,
+        keyword_count: int) -> Iterator[Tuple[bytes, List[int]]]:
+    """
+    Runs the transition table over the whole chunk at once and yields
+    (line, keyword_ids) for every line in it. The chunk is matched as
+    it was read: case is folded by the table's byte classes, so the
+    URLs are never decoded or lowercased to be searched. Bytes that
+    are not in any keyword (including every non-ASCII byte when the
+    keywords are ASCII) send the automaton back to its start.
+    """
+    lines: List[bytes] = chunk.split(URL_SEPARATOR)
+    if chunk.endswith(URL_SEPARATOR):
+        lines.pop()
+
+    line_offsets: array = array('Q', accumulate(
+        (len(line) + len(URL_SEPARATOR) for line in lines[:-1]), initial=0))
+    url_indexes, keyword_ids = transition_table.match_buffer(chunk, line_offsets, keyword_count)
+
+    keyword_ids_by_line: dict = {}
+    for url_index, keyword_id in zip(url_indexes, keyword_ids):
+        keyword_ids_by_line.setdefault(url_index, []).append(keyword_id)
+
+    for line_index, line in enumerate(lines):
+        yield (line, keyword_ids_by_line.get(line_index, []))
+
+
+def match_binary_urls(
+        trie,
+        binary_file: BinaryIO,
+        read_size_in_bytes: int = BINARY_READ_SIZE_IN_BYTES) -> Iterator[Tuple[str, List[int]]]:
+    """
+    Matches every URL (one per line) in a file opened in binary mode
+    and yields (url, keyword_ids) in file order. Each URL is only
+    decoded once it is handed back, for the results. Bytes that are
+    not valid UTF-8 cannot match anything, and are replaced by U+FFFD
+    in the URL handed back, so one bad line does not stop the stream.
+    """
+    transition_table: TransitionTable = get_transition_table(trie)
+    keyword_count: int = trie.keyword_count
+
+    for chunk in read_line_aligned_chunks(binary_file, read_size_in_bytes):
+        for line, keyword_ids in match_line_aligned_chunk(transition_table, chunk, keyword_count):
+            yield (line.decode('utf-8', errors='replace').strip(), keyword_ids)
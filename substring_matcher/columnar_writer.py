@@ -0,0 +1,176 @@
+from array import array
+import os
+from typing import Dict, List
+
+from substring_matcher.constants import (
+    COLUMNAR_BATCH_SIZE,
+    COLUMNAR_KEYWORDS_TABLE,
+    COLUMNAR_MATCHES_TABLE,
+    COLUMNAR_TABLE_FORMATS,
+    COLUMNAR_URLS_TABLE
+)
+
+# pyarrow is optional. It is only needed for the columnar output,
+# so everything else keeps working without it.
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class ColumnarResultWriter:
+    """
+    Writes the search results as three tables in a directory, so
+    that analytics tools can load them without parsing JSON:
+
+    - urls: url_id, url, runtime_ns (null when not recorded)
+    - keywords: keyword_id, keyword
+    - matches: url_id, keyword_id (one row per match)
+
+    Ids are handed out in the order the URLs and keywords are first
+    seen. The urls and matches tables are written in record batches
+    of batch_size URLs as the results arrive, so memory use does not
+    grow with the number of URLs. The keywords table is written on
+    close. table_format is 'arrow' (Arrow IPC files) or 'parquet',
+    and compression is any codec pyarrow supports for that format
+    (e.g. 'zstd' or 'lz4'), or None.
+
+    It has the same write_result and close methods as ResultWriter,
+    and needs pyarrow to be installed.
+    """
+
+    def __init__(self, directory_path: str, *, table_format: str = 'arrow',
+                 compression: str = None, batch_size: int = COLUMNAR_BATCH_SIZE):
+        if not isinstance(directory_path, str) or not isinstance(batch_size, int):
+            raise TypeError
+
+        if pyarrow is None:
+            raise ImportError("The columnar output needs pyarrow (pip install pyarrow)")
+
+        if directory_path == '-':
+            raise ValueError("The columnar output is a directory, so it cannot go to stdout")
+
+        if table_format not in COLUMNAR_TABLE_FORMATS:
+            raise ValueError(f"Table format must be one of {COLUMNAR_TABLE_FORMATS}")
+
+        if batch_size < 1:
+            raise ValueError("The batch size must be at least 1")
+
+        os.makedirs(directory_path, exist_ok=True)
+        self.directory_path: str = directory_path
+        self.table_format: str = table_format
+        self.compression: str = compression
+        self.batch_size: int = batch_size
+        self.is_closed: bool = False
+
+        self.urls_schema = pyarrow.schema([
+            ('url_id', pyarrow.uint64()), ('url', pyarrow.string()), ('runtime_ns', pyarrow.int64())])
+        self.keywords_schema = pyarrow.schema([
+            ('keyword_id', pyarrow.uint32()), ('keyword', pyarrow.string())])
+        self.matches_schema = pyarrow.schema([
+            ('url_id', pyarrow.uint64()), ('keyword_id', pyarrow.uint32())])
+
+        self.keyword_ids: Dict[str, int] = {}
+        self.number_of_urls: int = 0
+        self.reset_batch()
+
+        self.urls_table_writer = self.open_table_writer(COLUMNAR_URLS_TABLE, self.urls_schema)
+        self.matches_table_writer = self.open_table_writer(COLUMNAR_MATCHES_TABLE, self.matches_schema)
+
+    def get_table_path(self, table_name: str) -> str:
+        extension: str = 'arrow' if self.table_format == 'arrow' else 'parquet'
+        return os.path.join(self.directory_path, f"{table_name}.{extension}")
+
+    def open_table_writer(self, table_name: str, schema):
+        if self.table_format == 'parquet':
+            return pyarrow.parquet.ParquetWriter(
+                self.get_table_path(table_name), schema, compression=self.compression or 'none')
+
+        return pyarrow.ipc.new_file(
+            self.get_table_path(table_name), schema,
+            options=pyarrow.ipc.IpcWriteOptions(compression=self.compression))
+
+    def reset_batch(self):
+        self.batch_url_ids: array = array('Q')
+        self.batch_urls: List[str] = []
+        self.batch_runtimes: List[int] = []
+        self.batch_match_url_ids: array = array('Q')
+        self.batch_match_keyword_ids: array = array('I')
+
+    def get_keyword_id(self, keyword: str) -> int:
+        keyword_id: int = self.keyword_ids.get(keyword)
+
+        if keyword_id is None:
+            keyword_id = len(self.keyword_ids)
+            self.keyword_ids[keyword] = keyword_id
+
+        return keyword_id
+
+    def write_result(self, url: str, match_data: dict):
+        url_id: int = self.number_of_urls
+        self.number_of_urls += 1
+
+        self.batch_url_ids.append(url_id)
+        self.batch_urls.append(url)
+        self.batch_runtimes.append(match_data.get('runtime_ns'))
+
+        for keyword in match_data.get('matches', []):
+            self.batch_match_url_ids.append(url_id)
+            self.batch_match_keyword_ids.append(self.get_keyword_id(keyword))
+
+        if len(self.batch_urls) >= self.batch_size:
+            self.write_batch()
+
+    def write_batch(self):
+        """Writes the URLs and matches collected so far as one record batch each."""
+        if not self.batch_urls:
+            return
+
+        self.urls_table_writer.write_batch(pyarrow.record_batch([
+            pyarrow.array(self.batch_url_ids, pyarrow.uint64()),
+            pyarrow.array(self.batch_urls, pyarrow.string()),
+            pyarrow.array(self.batch_runtimes, pyarrow.int64())
+        ], schema=self.urls_schema))
+
+        self.matches_table_writer.write_batch(pyarrow.record_batch([
+            pyarrow.array(self.batch_match_url_ids, pyarrow.uint64()),
+            pyarrow.array(self.batch_match_keyword_ids, pyarrow.uint32())
+        ], schema=self.matches_schema))
+
+        self.reset_batch()
+
+    def close(self):
+        if self.is_closed:
+            return
+
+        self.is_closed = True
+        self.write_batch()
+        self.urls_table_writer.close()
+        self.matches_table_writer.close()
+
+        keywords_table_writer = self.open_table_writer(COLUMNAR_KEYWORDS_TABLE, self.keywords_schema)
+        keywords_table_writer.write_batch(pyarrow.record_batch([
+            pyarrow.array(range(len(self.keyword_ids)), pyarrow.uint32()),
+            pyarrow.array(list(self.keyword_ids), pyarrow.string())
+        ], schema=self.keywords_schema))
+        keywords_table_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_columnar_table(table_path: str):
+    """Reads one of the tables written by ColumnarResultWriter back as a pyarrow.Table."""
+    if pyarrow is None:
+        raise ImportError("The columnar output needs pyarrow (pip install pyarrow)")
+
+    if table_path.endswith('.parquet'):
+        return pyarrow.parquet.read_table(table_path)
+
+    with pyarrow.memory_map(table_path) as table_file:
+        return pyarrow.ipc.open_file(table_file).read_all()
@@ -0,0 +1,562 @@
+from array import array
+from collections import deque
+from typing import Iterator, List, Set, Tuple
+
+from substring_matcher.constants import (
+    AHO_CORASICK_ENGINE,
+    ALL_MATCHES,
+    MATCHING_ENGINES,
+    TRIE_WALK_ENGINE
+)
+from substring_matcher.match_spans import (
+    Span,
+    convert_byte_spans_to_character_spans,
+    select_matching_spans
+)
+
+NO_NODE: int = -1
+NO_KEYWORD: int = -1
+
+
+class CompactTrie:
+    """
+    A trie that stores its nodes in flat arrays instead of TrieNode
+    objects. Node 0 is the root and every edge is keyed by a byte
+    of the UTF-8 encoded keyword.
+
+    While keywords are being added, the children of a node are kept
+    as a linked list (first child / next sibling). Before the first
+    search, they get packed into CSR-style arrays, where the children
+    of node n sit between child_offsets[n] and child_offsets[n + 1].
+    """
+
+    def __init__(self, *, engine: str = TRIE_WALK_ENGINE):
+        if not isinstance(engine, str):
+            raise TypeError
+
+        if engine not in MATCHING_ENGINES:
+            raise ValueError(f"Engine must be one of {MATCHING_ENGINES}")
+
+        self.engine: str = engine
+
+        # one entry per node, filled in by add_keyword
+        self.labels: bytearray = bytearray(b'\0')
+        self.first_child: array = array('i', [NO_NODE])
+        self.next_sibling: array = array('i', [NO_NODE])
+        self.depths: array = array('I', [0])
+        self.is_end_of_word: bytearray = bytearray(b'\0')
+        self.keyword_ids: array = array('i', [NO_KEYWORD])
+        self.keywords: List[str] = []
+
+        # packed children, filled in by pack_children
+        self.child_offsets: array = array('I')
+        self.child_labels: bytes = b''
+        self.child_nodes: array = array('I')
+        self.is_packed: bool = False
+
+        # Aho-Corasick links, filled in by build_automaton
+        self.failure_links: array = array('I')
+        self.output_links: array = array('i')
+        self.is_automaton_built: bool = False
+
+        # bumped whenever a keyword is added (see Trie)
+        self.keyword_set_version: int = 0
+
+        # set by shift_ids before the trie gets grafted onto another
+        self.id_offsets: tuple = (0, 0)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.labels)
+
+    @property
+    def keyword_count(self) -> int:
+        """The number of keyword ids handed out so far."""
+        return len(self.keywords)
+
+    def add_keyword(self, keyword: str):
+        """
+        Adds the substring/keyword to the trie by appending
+        a node to the arrays for each new byte.
+        """
+        if not isinstance(keyword, str):
+            raise TypeError
+
+        current_node: int = 0
+
+        for byte_value in keyword.lower().encode('utf-8'):
+            child_node: int = self.find_unpacked_child(current_node, byte_value)
+
+            if child_node == NO_NODE:
+                child_node = self.node_count
+                self.labels.append(byte_value)
+                self.first_child.append(NO_NODE)
+                self.next_sibling.append(self.first_child[current_node])
+                self.depths.append(self.depths[current_node] + 1)
+                self.is_end_of_word.append(0)
+                self.keyword_ids.append(NO_KEYWORD)
+                self.first_child[current_node] = child_node
+
+            current_node = child_node
+
+        if not self.is_end_of_word[current_node]:
+            self.keyword_ids[current_node] = len(self.keywords)
+            self.keywords.append(keyword.lower())
+            self.keyword_set_version += 1
+
+        self.is_end_of_word[current_node] = 1
+        self.is_packed = False
+        self.is_automaton_built = False
+
+    def add_sorted_keywords(self, keywords: List[str]):
+        """
+        Adds many lowercase keywords at once (see Trie.add_sorted_keywords).
+        When the trie starts out empty and the keywords are sorted, every
+        byte past the prefix shared with the previous keyword needs a new
+        node, so the sibling lists never have to be searched.
+        """
+        if not isinstance(keywords, list):
+            raise TypeError
+
+        path: List[int] = [0]
+        previous_keyword: bytes = b''
+        creates_new_nodes: bool = self.node_count == 1
+
+        for keyword in keywords:
+            if not isinstance(keyword, str):
+                raise TypeError
+
+            keyword_bytes: bytes = keyword.encode('utf-8')
+            creates_new_nodes = creates_new_nodes and keyword_bytes >= previous_keyword
+
+            shared_length: int = 0
+            shortest_length: int = min(len(keyword_bytes), len(previous_keyword))
+            while (shared_length < shortest_length
+                   and keyword_bytes[shared_length] == previous_keyword[shared_length]):
+                shared_length += 1
+
+            del path[shared_length + 1:]
+            current_node: int = path[shared_length]
+
+            for byte_value in keyword_bytes[shared_length:]:
+                child_node: int = (
+                    NO_NODE if creates_new_nodes else self.find_unpacked_child(current_node, byte_value))
+
+                if child_node == NO_NODE:
+                    child_node = self.node_count
+                    self.labels.append(byte_value)
+                    self.first_child.append(NO_NODE)
+                    self.next_sibling.append(self.first_child[current_node])
+                    self.depths.append(self.depths[current_node] + 1)
+                    self.is_end_of_word.append(0)
+                    self.keyword_ids.append(NO_KEYWORD)
+                    self.first_child[current_node] = child_node
+
+                current_node = child_node
+                path.append(current_node)
+
+            if not self.is_end_of_word[current_node]:
+                self.is_end_of_word[current_node] = 1
+                self.keyword_ids[current_node] = len(self.keywords)
+                self.keywords.append(keyword)
+                self.keyword_set_version += 1
+
+            previous_keyword = keyword_bytes
+
+        self.is_packed = False
+        self.is_automaton_built = False
+
+    def shift_ids(self, node_offset: int, keyword_offset: int):
+        """
+        Adds the offsets to every node id and keyword id in the arrays,
+        so that they line up with the trie this one gets grafted onto
+        (see graft). The trie cannot be searched on its own afterwards.
+        """
+        if self.id_offsets != (0, 0):
+            raise ValueError("The ids have already been shifted")
+
+        self.first_child = array('i', (
+            NO_NODE if node == NO_NODE else node + node_offset for node in self.first_child))
+        self.next_sibling = array('i', (
+            NO_NODE if node == NO_NODE else node + node_offset for node in self.next_sibling))
+        self.keyword_ids = array('i', (
+            NO_KEYWORD if keyword_id == NO_KEYWORD else keyword_id + keyword_offset
+            for keyword_id in self.keyword_ids))
+        self.id_offsets = (node_offset, keyword_offset)
+
+    def graft(self, other: 'CompactTrie'):
+        """
+        Hangs the nodes below the root of the other trie under this
+        trie's root, and appends the other trie's keywords (and ids)
+        after this trie's. Since nothing is merged, the two tries must
+        not have any first byte in common.
+
+        The other trie's ids get shifted first, unless shift_ids was
+        already called with this trie's offsets (e.g. in a worker
+        process). Either way, the other trie is used up.
+        """
+        if not isinstance(other, CompactTrie):
+            raise TypeError
+
+        if other.is_end_of_word[0]:
+            raise ValueError("Cannot graft a trie that has the empty keyword")
+
+        # node n of the other trie becomes node n + node_offset here
+        node_offset: int = self.node_count - 1
+        keyword_offset: int = len(self.keywords)
+
+        if other.id_offsets == (0, 0):
+            other.shift_ids(node_offset, keyword_offset)
+        elif other.id_offsets != (node_offset, keyword_offset):
+            raise ValueError("The ids were shifted for a different trie")
+
+        grafted_children: List[int] = []
+        child_node: int = other.first_child[0]
+
+        while child_node != NO_NODE:
+            if self.find_unpacked_child(0, other.labels[child_node - node_offset]) != NO_NODE:
+                raise ValueError("Cannot graft tries that share a first byte")
+            grafted_children.append(child_node)
+            child_node = other.next_sibling[child_node - node_offset]
+
+        self.labels += other.labels[1:]
+        self.depths += other.depths[1:]
+        self.is_end_of_word += other.is_end_of_word[1:]
+        self.first_child += other.first_child[1:]
+        self.next_sibling += other.next_sibling[1:]
+        self.keyword_ids += other.keyword_ids[1:]
+        self.keywords += other.keywords
+
+        for child_node in grafted_children:
+            self.next_sibling[child_node] = self.first_child[0]
+            self.first_child[0] = child_node
+
+        if other.keywords:
+            self.keyword_set_version += 1
+
+        self.is_packed = False
+        self.is_automaton_built = False
+
+    def find_unpacked_child(self, node: int, byte_value: int) -> int:
+        """Walks the sibling list of the node to find the child for the byte."""
+        child_node: int = self.first_child[node]
+
+        while child_node != NO_NODE and self.labels[child_node] != byte_value:
+            child_node = self.next_sibling[child_node]
+
+        return child_node
+
+    def find_child(self, node: int, byte_value: int) -> int:
+        """Looks up the child for the byte in the packed arrays."""
+        index: int = self.child_labels.find(
+            byte_value, self.child_offsets[node], self.child_offsets[node + 1])
+
+        return NO_NODE if index == -1 else self.child_nodes[index]
+
+    def pack_children(self):
+        """
+        Copies the sibling lists into the CSR arrays, so that all
+        of the children of a node sit next to each other.
+        """
+        child_offsets: array = array('I', [0])
+        child_labels: bytearray = bytearray()
+        child_nodes: array = array('I')
+
+        for node in range(self.node_count):
+            child_node: int = self.first_child[node]
+
+            while child_node != NO_NODE:
+                child_labels.append(self.labels[child_node])
+                child_nodes.append(child_node)
+                child_node = self.next_sibling[child_node]
+
+            child_offsets.append(len(child_nodes))
+
+        self.child_offsets = child_offsets
+        self.child_labels = bytes(child_labels)
+        self.child_nodes = child_nodes
+        self.is_packed = True
+
+    def does_word_exist(self, word: str) -> bool:
+        """
+        Checks is the desired word exists inside the trie.
+        This is used promarily for a list of strings, not a url.
+        """
+        if not isinstance(word, str):
+            raise TypeError
+
+        if word == "":
+            return True
+
+        current_node: int = 0
+
+        for byte_value in word.encode('utf-8'):
+            current_node = self.find_unpacked_child(current_node, byte_value)
+            if current_node == NO_NODE:
+                return False
+
+        return bool(self.is_end_of_word[current_node])
+
+    def find_matching_substrings(self, url: str, *, search_steps: List[int] = None) -> Set[str]:
+        """
+        Creates a set to determine all of the matching substrings
+        from the URL that is passed to it.
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if url == "":
+            return {}
+
+        return {
+            self.get_keyword(self.keyword_ids[node])
+            for node, _ in self.iterate_matching_nodes(url.lower().encode('utf-8'), search_steps)
+        }
+
+    def find_matching_keyword_ids(self, url: str, *, url_is_lowercase: bool = False,
+                                  search_steps: List[int] = None) -> Set[int]:
+        """
+        Works like find_matching_substrings, but returns the ids of the
+        matching keywords, so no strings get built while matching (see
+        Trie.find_matching_keyword_ids for url_is_lowercase and search_steps).
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if url == "":
+            return set()
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        keyword_ids: array = self.keyword_ids
+
+        return {keyword_ids[node] for node, _ in self.iterate_matching_nodes(url.encode('utf-8'), search_steps)}
+
+    def get_keyword(self, keyword_id: int) -> str:
+        """Returns the keyword that was given the id."""
+        return self.keywords[keyword_id]
+
+    def find_matching_spans(self, url: str, match_kind: str = ALL_MATCHES, *,
+                            url_is_lowercase: bool = False, search_steps: List[int] = None) -> List[Span]:
+        """
+        Returns a (start, end, keyword_id) span for every match in the
+        (lowercase) URL (see Trie.find_matching_spans). The search runs
+        over bytes, so the spans are turned back into character
+        positions afterwards.
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        depths: array = self.depths
+        keyword_ids: array = self.keyword_ids
+        spans: List[Span] = select_matching_spans([
+            (end - depths[node], end, keyword_ids[node])
+            for node, end in self.iterate_matching_nodes(url.encode('utf-8'), search_steps)
+        ], match_kind)
+
+        return convert_byte_spans_to_character_spans(url, spans)
+
+    def has_any_match(self, url: str, *, url_is_lowercase: bool = False,
+                      search_steps: List[int] = None) -> bool:
+        """
+        Checks whether any keyword is in the URL, and stops
+        searching at the first one it finds.
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        matching_nodes: Iterator[Tuple[int, int]] = self.iterate_matching_nodes(url.encode('utf-8'), search_steps)
+        any_match: bool = next(matching_nodes, None) is not None
+        matching_nodes.close()
+
+        return any_match
+
+    def find_matching_nodes(self, url_bytes: bytes) -> Set[int]:
+        """
+        Returns the end-of-word nodes of every keyword found
+        in the (lowercase) URL using the trie's engine.
+        """
+        return {node for node, _ in self.iterate_matching_nodes(url_bytes)}
+
+    def iterate_matching_nodes(self, url_bytes: bytes,
+                               search_steps: List[int] = None) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (node, end) over the bytes of the URL for every keyword
+        as the engine finds it, and only counts the search steps when
+        given search_steps (see Trie.iterate_matching_nodes).
+        """
+        if not self.is_packed:
+            self.pack_children()
+
+        if not self.is_automaton_built and self.engine == AHO_CORASICK_ENGINE:
+            self.build_automaton()
+
+        if search_steps is not None:
+            return self.walk_matching_nodes_counting_steps(url_bytes, search_steps)
+
+        return self.walk_matching_nodes(url_bytes)
+
+    def walk_matching_nodes(self, url_bytes: bytes) -> Iterator[Tuple[int, int]]:
+        """Walks the packed arrays the way the engine does (see Trie.walk_matching_nodes)."""
+        is_end_of_word: bytearray = self.is_end_of_word
+        url_length: int = len(url_bytes)
+
+        if self.engine != AHO_CORASICK_ENGINE:
+            root_labels: bytes = self.child_labels[self.child_offsets[0]:self.child_offsets[1]]
+
+            for start in range(url_length):
+                # most walks end right at the root
+                if url_bytes[start] not in root_labels:
+                    continue
+
+                current_node: int = 0
+
+                for position in range(start, url_length):
+                    current_node = self.find_child(current_node, url_bytes[position])
+                    if current_node == NO_NODE:
+                        break
+
+                    if is_end_of_word[current_node]:
+                        yield (current_node, position + 1)
+            return
+
+        failure_links: array = self.failure_links
+        output_links: array = self.output_links
+        current_node = 0
+
+        for position, byte_value in enumerate(url_bytes):
+            child_node: int = self.find_child(current_node, byte_value)
+            while child_node == NO_NODE and current_node != 0:
+                current_node = failure_links[current_node]
+                child_node = self.find_child(current_node, byte_value)
+
+            current_node = 0 if child_node == NO_NODE else child_node
+            if current_node == 0:
+                continue
+
+            matched_node: int = (
+                current_node if is_end_of_word[current_node] else output_links[current_node])
+
+            # every keyword on the output chain ends here
+            while matched_node > 0:
+                yield (matched_node, position + 1)
+                matched_node = output_links[matched_node]
+
+    def walk_matching_nodes_counting_steps(self, url_bytes: bytes,
+                                           search_steps: List[int]) -> Iterator[Tuple[int, int]]:
+        """
+        Works like walk_matching_nodes, but also counts the search steps
+        (see Trie.walk_matching_nodes_counting_steps).
+        """
+        is_end_of_word: bytearray = self.is_end_of_word
+        url_length: int = len(url_bytes)
+        transitions: int = 0
+        root_restarts: int = 0
+
+        try:
+            if self.engine != AHO_CORASICK_ENGINE:
+                for start in range(url_length):
+                    root_restarts += 1
+                    current_node: int = 0
+
+                    for position in range(start, url_length):
+                        current_node = self.find_child(current_node, url_bytes[position])
+                        if current_node == NO_NODE:
+                            break
+                        transitions += 1
+
+                        if is_end_of_word[current_node]:
+                            yield (current_node, position + 1)
+                return
+
+            current_node = 0
+
+            for position, byte_value in enumerate(url_bytes):
+                child_node: int = self.find_child(current_node, byte_value)
+                while child_node == NO_NODE and current_node != 0:
+                    current_node = self.failure_links[current_node]
+                    child_node = self.find_child(current_node, byte_value)
+                    transitions += 1
+
+                current_node = 0 if child_node == NO_NODE else child_node
+                if current_node == 0:
+                    root_restarts += 1
+                    continue
+                transitions += 1
+
+                matched_node: int = (
+                    current_node if is_end_of_word[current_node] else self.output_links[current_node])
+
+                while matched_node > 0:
+                    yield (matched_node, position + 1)
+                    matched_node = self.output_links[matched_node]
+        finally:
+            search_steps[0] += transitions
+            search_steps[1] += root_restarts
+
+    def build_automaton(self):
+        """
+        Computes the failure and output links for every node
+        with a breadth-first pass over the packed arrays.
+        """
+        if not self.is_packed:
+            self.pack_children()
+
+        failure_links: array = array('I', [0]) * self.node_count
+        output_links: array = array('i', [NO_NODE]) * self.node_count
+        queue: deque = deque(
+            self.child_nodes[self.child_offsets[0]:self.child_offsets[1]])
+
+        while queue:
+            current_node: int = queue.popleft()
+
+            for index in range(self.child_offsets[current_node], self.child_offsets[current_node + 1]):
+                byte_value: int = self.child_labels[index]
+                child_node: int = self.child_nodes[index]
+
+                fallback_node: int = failure_links[current_node]
+                failure_node: int = self.find_child(fallback_node, byte_value)
+                while failure_node == NO_NODE and fallback_node != 0:
+                    fallback_node = failure_links[fallback_node]
+                    failure_node = self.find_child(fallback_node, byte_value)
+
+                failure_node = 0 if failure_node == NO_NODE else failure_node
+                failure_links[child_node] = failure_node
+
+                if failure_node != 0 and self.is_end_of_word[failure_node]:
+                    output_links[child_node] = failure_node
+                else:
+                    output_links[child_node] = output_links[failure_node]
+
+                queue.append(child_node)
+
+        self.failure_links = failure_links
+        self.output_links = output_links
+        self.is_automaton_built = True
+
+    def memory_usage_in_bytes(self) -> int:
+        """
+        Returns the number of bytes held by the arrays
+        (not counting the small fixed object overhead).
+        """
+        buffers: list = [
+            self.labels, self.first_child, self.next_sibling, self.depths,
+            self.is_end_of_word, self.keyword_ids, self.child_offsets, self.child_labels,
+            self.child_nodes, self.failure_links, self.output_links
+        ]
+
+        return sum(
+            len(buffer) * (buffer.itemsize if isinstance(buffer, array) else 1)
+            for buffer in buffers
+        )
+
+    def memory_usage_per_node(self) -> float:
+        """Returns the average number of bytes used for each node."""
+        return self.memory_usage_in_bytes() / self.node_count
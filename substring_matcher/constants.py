@@ -2,10 +2,75 @@ VALID_RESPONSES_FOR_NO: list[str] = ['n', 'no']
 VALID_RESPONSES_FOR_YES: list[str] = ['y', 'yes']
 
 SUBSTRING_MATCHER_DATA_PATH: str = 'substring_matcher/data'
+SUBSTRING_MATCHER_RESULTS_PATH: str = 'substring_matcher/results'
+STREAMED_RESULTS_JSON_LINES_FILE: str = 'keyword_search_results.jsonl'
+STREAMED_RESULTS_TEXT_FILE: str = 'keyword_search_results.txt'
 DEFAULT_KEYWORDS_FILE: str = 'keywords.txt'
 DEFAULT_URLS_FILE: str = 'urls.txt'
 
+TRIE_WALK_ENGINE: str = 'trie_walk'
+AHO_CORASICK_ENGINE: str = 'aho_corasick'
+MATCHING_ENGINES: list[str] = [TRIE_WALK_ENGINE, AHO_CORASICK_ENGINE]
+
+NODE_BACKEND: str = 'nodes'
+COMPACT_BACKEND: str = 'compact'
+DAWG_BACKEND: str = 'dawg'
+TRIE_BACKENDS: list[str] = [NODE_BACKEND, COMPACT_BACKEND, DAWG_BACKEND]
+
+URL_COMPONENTS: list[str] = ['scheme', 'host', 'path', 'query', 'fragment']
+
+MATCHING_SERVER_HOST: str = '127.0.0.1'
+MATCHING_SERVER_PORT: int = 8765
+MATCHING_SERVER_BATCH_SIZE: int = 256
+MATCHING_SERVER_MAX_PENDING_URLS: int = 10000
+MATCHING_SERVER_MAX_PENDING_RESPONSES: int = 1000
+MATCHING_SERVER_MAX_LINE_LENGTH: int = 1024 * 1024
+
+AUTOMATON_SNAPSHOT_MAGIC: bytes = b'SMAC'
+AUTOMATON_SNAPSHOT_VERSION: int = 2
+
+# compile and serve have no matches to report, so they exit with 0 on success
+EXIT_CODE_SUCCESS: int = 0
+EXIT_CODE_MATCHES_FOUND: int = 0
+EXIT_CODE_NO_MATCHES: int = 1
+EXIT_CODE_ERROR: int = 2
+
+PARALLEL_CHUNK_SIZE_IN_BYTES: int = 4 * 1024 * 1024
+BINARY_READ_SIZE_IN_BYTES: int = 1024 * 1024
+RESULT_WRITE_BUFFER_SIZE_IN_BYTES: int = 1024 * 1024
+BACKGROUND_WRITER_BATCH_SIZE: int = 1000
+BACKGROUND_WRITER_MAX_PENDING_BATCHES: int = 16
+
+COLUMNAR_TABLE_FORMATS: list[str] = ['arrow', 'parquet']
+COLUMNAR_URLS_TABLE: str = 'urls'
+COLUMNAR_KEYWORDS_TABLE: str = 'keywords'
+COLUMNAR_MATCHES_TABLE: str = 'matches'
+COLUMNAR_BATCH_SIZE: int = 65536
+
+ALL_MATCHES: str = 'all'
+LEFTMOST_LONGEST_MATCHES: str = 'leftmost_longest'
+LEFTMOST_FIRST_MATCHES: str = 'leftmost_first'
+MATCH_KINDS: list[str] = [ALL_MATCHES, LEFTMOST_LONGEST_MATCHES, LEFTMOST_FIRST_MATCHES]
+
+JSON_METRICS_FORMAT: str = 'json'
+PROMETHEUS_METRICS_FORMAT: str = 'prometheus'
+METRICS_FORMATS: list[str] = [JSON_METRICS_FORMAT, PROMETHEUS_METRICS_FORMAT]
+METRICS_DUMP_INTERVAL_IN_SECONDS: float = 10.0
+METRICS_COUNTERS: list[str] = [
+    'urls_processed', 'bytes_scanned', 'trie_transitions', 'root_restarts', 'matches_emitted']
+METRICS_PHASES: list[str] = ['build', 'match', 'write']
+# upper bounds of the timing histogram buckets (the last one catches the rest)
+METRICS_HISTOGRAM_BUCKETS_IN_SECONDS: list[float] = [
+    0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0, 100.0]
+
+TRIE_CACHE_SIZE: int = 4
+MATCH_CACHE_SIZE: int = 100000
+PREFILTER_PREFIX_LENGTH: int = 4
+
 NUMBER_OF_DESIRED_RUNS: int = 1000
+NUMBER_OF_WARMUP_RUNS: int = 100
+NUMBER_OF_SCALING_RUNS: int = 100
+RUNTIME_TEST_KEYWORDS_FILE: str = 'runtime_test_keywords.txt'
 
 SHORTEST_URL: str = ('abakaszwitterionic.com').lower()
 
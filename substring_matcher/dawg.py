@@ -0,0 +1,441 @@
+from array import array
+from typing import Dict, Iterator, List, Set, Tuple
+
+from substring_matcher.constants import ALL_MATCHES, TRIE_WALK_ENGINE
+from substring_matcher.match_spans import (
+    Span,
+    convert_byte_spans_to_character_spans,
+    select_matching_spans
+)
+
+NO_EDGE: int = -1
+
+
+class Dawg:
+    """
+    A minimal acyclic automaton (DAWG) of the keywords. It is a trie
+    where every group of nodes that lead to the same set of endings
+    is merged into one state, so keyword lists with shared suffixes
+    (e.g. "-cabins", "-lodges") store each suffix only once.
+
+    The states are stored in flat arrays like the CompactTrie: the
+    edges of state s sit between edge_offsets[s] and
+    edge_offsets[s + 1], sorted by their byte. Since a state can be
+    reached by many keywords, it cannot hold a keyword id. Instead,
+    each edge stores how many keywords sort before the ones reached
+    through it (edge_ranks), and adding these up along the way gives
+    the keyword's position in sorted order, which is its id.
+
+    A DAWG is built in one go from the sorted keywords, so the
+    keywords from add_keyword are collected and the automaton is
+    (re)built before the next search. Keyword ids follow the sorted
+    order and are handed out again when keywords are added. Only the
+    trie walk engine is supported, since merged states have no single
+    failure link for Aho-Corasick.
+    """
+
+    def __init__(self, *, engine: str = TRIE_WALK_ENGINE):
+        if not isinstance(engine, str):
+            raise TypeError
+
+        if engine != TRIE_WALK_ENGINE:
+            raise ValueError(f"The DAWG backend only supports the {TRIE_WALK_ENGINE} engine")
+
+        self.engine: str = engine
+
+        # state 0 is the start state, filled in by build
+        self.edge_offsets: array = array('I', [0, 0])
+        self.edge_labels: bytes = b''
+        self.edge_targets: array = array('I')
+        self.edge_ranks: array = array('I')
+        self.is_final: bytearray = bytearray(b'\0')
+        self.number_of_keywords: int = 0
+
+        # keywords waiting for the next build
+        self.pending_keywords: Set[str] = set()
+        self.is_automaton_built: bool = True
+
+        # bumped whenever a keyword is added (see Trie)
+        self.keyword_set_version: int = 0
+
+    @property
+    def node_count(self) -> int:
+        if not self.is_automaton_built:
+            self.build_automaton()
+        return len(self.is_final)
+
+    @property
+    def edge_count(self) -> int:
+        if not self.is_automaton_built:
+            self.build_automaton()
+        return len(self.edge_targets)
+
+    @property
+    def keyword_count(self) -> int:
+        """The number of keywords, which are numbered 0 to keyword_count - 1."""
+        if not self.is_automaton_built:
+            self.build_automaton()
+        return self.number_of_keywords
+
+    def add_keyword(self, keyword: str):
+        """
+        Adds the keyword to the ones the automaton
+        gets built from before the next search.
+        """
+        if not isinstance(keyword, str):
+            raise TypeError
+
+        keyword = keyword.lower()
+
+        if keyword in self.pending_keywords:
+            return
+
+        if self.is_automaton_built:
+            state: int = self.find_state(keyword)
+            if state != NO_EDGE and self.is_final[state]:
+                return
+
+            self.pending_keywords.update(self.iterate_keywords())
+            self.is_automaton_built = False
+
+        self.pending_keywords.add(keyword)
+        self.keyword_set_version += 1
+
+    def add_sorted_keywords(self, keywords: List[str]):
+        """Adds many lowercase keywords at once (see Trie.add_sorted_keywords)."""
+        if not isinstance(keywords, list):
+            raise TypeError
+
+        for keyword in keywords:
+            self.add_keyword(keyword)
+
+    def build_automaton(self):
+        """
+        Builds the automaton from the keywords added so far. It runs
+        before the first search and again only if more keywords are
+        added later.
+        """
+        self.build_from_sorted_keywords(sorted(keyword.encode('utf-8') for keyword in self.pending_keywords))
+        self.pending_keywords = set()
+        self.is_automaton_built = True
+
+    def build_from_sorted_keywords(self, sorted_keywords: List[bytes]):
+        """
+        Builds the minimal automaton from the sorted, unique keywords
+        in a single pass (Daciuk et al.'s incremental algorithm).
+
+        Only the path of the last keyword is kept as open nodes. When
+        the next keyword leaves that path, the nodes below the branch
+        point can no longer change, so each of them is either matched
+        to an equivalent state in the register (same finality and the
+        same edges to the same states) or added as a new state.
+        """
+        register: Dict[tuple, int] = {}
+        state_edges: List[Tuple[Tuple[int, int], ...]] = []
+        state_finals: bytearray = bytearray()
+        state_counts: array = array('I')
+
+        # open nodes are [is_final, [(byte, target), ...]], where the
+        # target of the last edge is the next open node until it is frozen
+        path: List[list] = [[False, []]]
+        previous_keyword: bytes = b''
+
+        def freeze_path_down_to(depth: int):
+            while len(path) > depth + 1:
+                is_final, edges = path.pop()
+                signature: tuple = (is_final, tuple(edges))
+                state: int = register.get(signature, NO_EDGE)
+
+                if state == NO_EDGE:
+                    state = len(state_edges)
+                    register[signature] = state
+                    state_edges.append(signature[1])
+                    state_finals.append(is_final)
+                    state_counts.append(is_final + sum(state_counts[target] for _, target in edges))
+
+                parent_edges: list = path[-1][1]
+                parent_edges[-1] = (parent_edges[-1][0], state)
+
+        for keyword in sorted_keywords:
+            shared_length: int = 0
+            shortest_length: int = min(len(keyword), len(previous_keyword))
+            while shared_length < shortest_length and keyword[shared_length] == previous_keyword[shared_length]:
+                shared_length += 1
+
+            freeze_path_down_to(shared_length)
+
+            for byte_value in keyword[shared_length:]:
+                path[-1][1].append((byte_value, NO_EDGE))
+                path.append([False, []])
+
+            path[-1][0] = True
+            previous_keyword = keyword
+
+        freeze_path_down_to(0)
+        self.pack_states(path[0], state_edges, state_finals, state_counts)
+        self.number_of_keywords = len(sorted_keywords)
+
+    def pack_states(self, start_node: list, state_edges: list, state_finals: bytearray, state_counts: array):
+        """
+        Copies the frozen states into the flat arrays. The start state
+        becomes state 0, so every other state moves up by one.
+        """
+        start_is_final, start_edges = start_node
+        edge_offsets: array = array('I', [0])
+        edge_labels: bytearray = bytearray()
+        edge_targets: array = array('I')
+        edge_ranks: array = array('I')
+
+        for is_final, edges in [(start_is_final, start_edges)] + list(zip(state_finals, state_edges)):
+            # a keyword that ends at the state sorts before the ones that go on
+            rank: int = int(is_final)
+
+            for byte_value, target in edges:
+                edge_labels.append(byte_value)
+                edge_targets.append(target + 1)
+                edge_ranks.append(rank)
+                rank += state_counts[target]
+
+            edge_offsets.append(len(edge_targets))
+
+        self.edge_offsets = edge_offsets
+        self.edge_labels = bytes(edge_labels)
+        self.edge_targets = edge_targets
+        self.edge_ranks = edge_ranks
+        self.is_final = bytearray([start_is_final]) + state_finals
+
+    def find_edge(self, state: int, byte_value: int) -> int:
+        """Returns the index of the state's edge for the byte, or NO_EDGE."""
+        return self.edge_labels.find(byte_value, self.edge_offsets[state], self.edge_offsets[state + 1])
+
+    def find_state(self, word: str) -> int:
+        """Returns the state the word leads to, or NO_EDGE if it leaves the automaton."""
+        state: int = 0
+
+        for byte_value in word.encode('utf-8'):
+            edge: int = self.find_edge(state, byte_value)
+            if edge == NO_EDGE:
+                return NO_EDGE
+            state = self.edge_targets[edge]
+
+        return state
+
+    def does_word_exist(self, word: str) -> bool:
+        """
+        Checks is the desired word exists inside the DAWG.
+        This is used promarily for a list of strings, not a url.
+        """
+        if not isinstance(word, str):
+            raise TypeError
+
+        if word == "":
+            return True
+
+        if not self.is_automaton_built:
+            self.build_automaton()
+        state: int = self.find_state(word)
+
+        return state != NO_EDGE and bool(self.is_final[state])
+
+    def find_matching_substrings(self, url: str, *, search_steps: List[int] = None) -> Set[str]:
+        """
+        Creates a set to determine all of the matching substrings
+        from the URL that is passed to it.
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if url == "":
+            return {}
+
+        url_bytes: bytes = url.lower().encode('utf-8')
+
+        # the matched keyword is the part of the URL that was walked
+        return {
+            url_bytes[start:end].decode('utf-8')
+            for start, end, _ in self.iterate_matching_spans(url_bytes, search_steps)
+        }
+
+    def find_matching_keyword_ids(self, url: str, *, url_is_lowercase: bool = False,
+                                  search_steps: List[int] = None) -> Set[int]:
+        """
+        Works like find_matching_substrings, but returns the ids of the
+        matching keywords, so no strings get built while matching (see
+        Trie.find_matching_keyword_ids for url_is_lowercase and search_steps).
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if url == "":
+            return set()
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        return {
+            keyword_id
+            for _, _, keyword_id in self.iterate_matching_spans(url.encode('utf-8'), search_steps)
+        }
+
+    def find_matching_spans(self, url: str, match_kind: str = ALL_MATCHES, *,
+                            url_is_lowercase: bool = False, search_steps: List[int] = None) -> List[Span]:
+        """
+        Returns a (start, end, keyword_id) span for every match in the
+        (lowercase) URL (see Trie.find_matching_spans). Since the ids
+        follow the sorted order, leftmost_first keeps the keyword that
+        sorts first rather than the one added first.
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        spans: List[Span] = select_matching_spans(
+            list(self.iterate_matching_spans(url.encode('utf-8'), search_steps)), match_kind)
+
+        return convert_byte_spans_to_character_spans(url, spans)
+
+    def has_any_match(self, url: str, *, url_is_lowercase: bool = False,
+                      search_steps: List[int] = None) -> bool:
+        """
+        Checks whether any keyword is in the URL, and stops
+        searching at the first one it finds.
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        spans: Iterator[Span] = self.iterate_matching_spans(url.encode('utf-8'), search_steps)
+        any_match: bool = next(spans, None) is not None
+        spans.close()
+
+        return any_match
+
+    def iterate_matching_spans(self, url_bytes: bytes, search_steps: List[int] = None) -> Iterator[Span]:
+        """
+        Yields (start, end, keyword_id) over the bytes of the URL for
+        every keyword found, and only counts the search steps when
+        given search_steps (see Trie.iterate_matching_nodes).
+        """
+        if not self.is_automaton_built:
+            self.build_automaton()
+
+        if search_steps is not None:
+            return self.search_with_trie_walks_counting_steps(url_bytes, search_steps)
+
+        return self.search_with_trie_walks(url_bytes)
+
+    def search_with_trie_walks(self, url_bytes: bytes) -> Iterator[Span]:
+        """
+        Walks the automaton from the start state at every byte of the
+        URL and yields (start, end, keyword_id) for each keyword found.
+        """
+        edge_labels: bytes = self.edge_labels
+        edge_offsets: array = self.edge_offsets
+        edge_targets: array = self.edge_targets
+        edge_ranks: array = self.edge_ranks
+        is_final: bytearray = self.is_final
+        url_length: int = len(url_bytes)
+        root_labels: bytes = edge_labels[edge_offsets[0]:edge_offsets[1]]
+
+        for start in range(url_length):
+            # most walks end right at the start state
+            if url_bytes[start] not in root_labels:
+                continue
+
+            state: int = 0
+            keyword_id: int = 0
+
+            for position in range(start, url_length):
+                edge: int = edge_labels.find(url_bytes[position], edge_offsets[state], edge_offsets[state + 1])
+                if edge == NO_EDGE:
+                    break
+
+                keyword_id += edge_ranks[edge]
+                state = edge_targets[edge]
+
+                if is_final[state]:
+                    yield (start, position + 1, keyword_id)
+
+    def search_with_trie_walks_counting_steps(self, url_bytes: bytes, search_steps: List[int]) -> Iterator[Span]:
+        """
+        Works like search_with_trie_walks, but also counts the search
+        steps (see Trie.walk_matching_nodes_counting_steps).
+        """
+        url_length: int = len(url_bytes)
+        transitions: int = 0
+        root_restarts: int = 0
+
+        try:
+            for start in range(url_length):
+                root_restarts += 1
+                state: int = 0
+                keyword_id: int = 0
+
+                for position in range(start, url_length):
+                    edge: int = self.find_edge(state, url_bytes[position])
+                    if edge == NO_EDGE:
+                        break
+                    transitions += 1
+
+                    keyword_id += self.edge_ranks[edge]
+                    state = self.edge_targets[edge]
+
+                    if self.is_final[state]:
+                        yield (start, position + 1, keyword_id)
+        finally:
+            search_steps[0] += transitions
+            search_steps[1] += root_restarts
+
+    def get_keyword(self, keyword_id: int) -> str:
+        """
+        Returns the keyword that was given the id by walking down the
+        edges whose ranks add up to it.
+        """
+        if not self.is_automaton_built:
+            self.build_automaton()
+
+        if not 0 <= keyword_id < self.number_of_keywords:
+            raise IndexError("Keyword id out of range")
+
+        keyword: bytearray = bytearray()
+        state: int = 0
+        remaining_rank: int = keyword_id
+
+        while not (remaining_rank == 0 and self.is_final[state]):
+            first_edge: int = self.edge_offsets[state]
+            edge: int = self.edge_offsets[state + 1] - 1
+
+            # the last edge that does not skip past the keyword
+            while edge > first_edge and self.edge_ranks[edge] > remaining_rank:
+                edge -= 1
+
+            keyword.append(self.edge_labels[edge])
+            remaining_rank -= self.edge_ranks[edge]
+            state = self.edge_targets[edge]
+
+        return keyword.decode('utf-8')
+
+    def iterate_keywords(self) -> Iterator[str]:
+        """Yields every keyword in id (sorted) order."""
+        for keyword_id in range(self.keyword_count):
+            yield self.get_keyword(keyword_id)
+
+    def memory_usage_in_bytes(self) -> int:
+        """
+        Returns the number of bytes held by the arrays
+        (not counting the small fixed object overhead).
+        """
+        buffers: list = [self.edge_offsets, self.edge_labels, self.edge_targets, self.edge_ranks, self.is_final]
+
+        return sum(
+            len(buffer) * (buffer.itemsize if isinstance(buffer, array) else 1)
+            for buffer in buffers
+        )
+
+    def memory_usage_per_node(self) -> float:
+        """Returns the average number of bytes used for each state."""
+        return self.memory_usage_in_bytes() / self.node_count
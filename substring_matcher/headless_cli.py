@@ -0,0 +1,351 @@
+import argparse
+import json
+import sys
+import time
+from typing import List
+
+from substring_matcher.automaton_snapshot import AutomatonSnapshot, compile_keywords_file_path
+from substring_matcher.constants import (
+    AHO_CORASICK_ENGINE,
+    COMPACT_BACKEND,
+    DAWG_BACKEND,
+    EXIT_CODE_ERROR,
+    EXIT_CODE_MATCHES_FOUND,
+    EXIT_CODE_NO_MATCHES,
+    EXIT_CODE_SUCCESS,
+    JSON_METRICS_FORMAT,
+    MATCH_KINDS,
+    MATCHING_ENGINES,
+    MATCHING_SERVER_HOST,
+    MATCHING_SERVER_PORT,
+    METRICS_DUMP_INTERVAL_IN_SECONDS,
+    METRICS_FORMATS,
+    NODE_BACKEND,
+    PARALLEL_CHUNK_SIZE_IN_BYTES,
+    PREFILTER_PREFIX_LENGTH,
+    TRIE_BACKENDS,
+    TRIE_WALK_ENGINE
+)
+from substring_matcher.instrumentation import (
+    InstrumentedResultWriter,
+    InstrumentedTrie,
+    Instrumentation,
+    capture_run
+)
+from substring_matcher.keyword_prefilter import KeywordPrefilter
+from substring_matcher.match_cache import MatchCache
+from substring_matcher.matching_server import run_matching_server
+from substring_matcher.parallel_matcher import match_urls_file_in_parallel
+from substring_matcher.result_writers import MATCH_DATA_FORMATS, RESULT_WRITER_FORMATS, BackgroundResultWriter
+from substring_matcher.substring_matcher_cli import SubstringMatcherCli
+from substring_matcher.trie_builder import TrieBuilder
+from substring_matcher.url_tokenizer import UrlTokenMatcher
+
+
+def parse_arguments(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='substring_matcher',
+        description="Finds keywords inside of URLs without any prompts.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    match_parser = subparsers.add_parser(
+        'match', help="Match URLs from a file or stdin and write the results.")
+    keywords_source = match_parser.add_mutually_exclusive_group(required=True)
+    keywords_source.add_argument('--keywords', help="Path to a keywords file (one per line).")
+    keywords_source.add_argument('--snapshot', help="Path to a compiled automaton snapshot.")
+    match_parser.add_argument('--urls', default='-',
+                              help="Path to a URLs file (one per line), or '-' for stdin.")
+    match_parser.add_argument('--output', default='-', help="Results file, or '-' for stdout.")
+    match_parser.add_argument('--format', default='jsonl', choices=sorted(RESULT_WRITER_FORMATS))
+    match_parser.add_argument('--background-writer', action='store_true',
+                              help="Encode and write the results on a separate thread.")
+    match_parser.add_argument('--bulk-load', action='store_true',
+                              help="Read, deduplicate and sort the whole keywords file before "
+                                   "building the trie (faster for huge files).")
+    match_parser.add_argument('--build-workers', type=int, default=1,
+                              help="Build the trie with this many worker processes "
+                                   "(needs --backend compact; loads the keywords like --bulk-load).")
+    match_parser.add_argument('--engine', choices=MATCHING_ENGINES,
+                              help=f"Defaults to {AHO_CORASICK_ENGINE} ({TRIE_WALK_ENGINE} "
+                                   f"for the {DAWG_BACKEND} backend, which only supports that). "
+                                   "Snapshots are always compact Aho-Corasick automatons.")
+    match_parser.add_argument('--backend', choices=TRIE_BACKENDS, help=f"Defaults to {NODE_BACKEND}.")
+    match_parser.add_argument('--bytes', action='store_true',
+                              help="Match the raw bytes of the URLs in large blocks "
+                                   "(ASCII case folding only).")
+    match_parser.add_argument('--tokenize', action='store_true',
+                              help="Only search the runs of letters, '_' and '-' in each URL.")
+    match_parser.add_argument('--prefilter', action='store_true',
+                              help="Skip URLs without any keyword prefix before searching them "
+                                   "(only faster for small keyword lists).")
+    match_parser.add_argument('--prefilter-length', type=int, default=PREFILTER_PREFIX_LENGTH,
+                              help="Characters of each keyword the pre-filter looks for.")
+    match_parser.add_argument('--workers', type=int, default=1,
+                              help="Number of worker processes (needs a URLs file).")
+    match_parser.add_argument('--chunk-size', type=int, default=PARALLEL_CHUNK_SIZE_IN_BYTES,
+                              help="Bytes of the URLs file handed to a worker at a time.")
+    match_parser.add_argument('--record-runtimes', action='store_true',
+                              help="Time each search and add its runtime to the results.")
+    match_parser.add_argument('--cache-size', type=int, default=0,
+                              help="Remember the results of this many recent URLs, per worker "
+                                   "(0 turns it off).")
+    match_parser.add_argument('--cache-bytes', type=int,
+                              help="Also cap the result cache at about this many bytes.")
+    match_parser.add_argument('--match-kind', choices=MATCH_KINDS,
+                              help="Add the [start, end, keyword] spans of the matches to the results, "
+                                   "keeping all of them or only the leftmost non-overlapping ones "
+                                   "(needs --format json or jsonl).")
+    match_parser.add_argument('--any-match', action='store_true',
+                              help="Only report whether each URL matches, stopping at the first keyword "
+                                   "(needs --format json or jsonl).")
+    match_parser.add_argument('--stats', action='store_true',
+                              help="Print timing stats as JSON to stderr when done.")
+    match_parser.add_argument('--metrics', help="Write counters, phase timing histograms and peak "
+                                                "memory to this file while matching.")
+    match_parser.add_argument('--metrics-format', default=JSON_METRICS_FORMAT, choices=METRICS_FORMATS)
+    match_parser.add_argument('--metrics-interval', type=float, default=METRICS_DUMP_INTERVAL_IN_SECONDS,
+                              help="Seconds between the rewrites of the metrics file.")
+    match_parser.add_argument('--count-search-steps', action='store_true',
+                              help="Also count the trie transitions and root restarts "
+                                   "(counted during each search; needs --metrics, and cannot be "
+                                   "combined with --workers or --bytes).")
+    match_parser.add_argument('--profile', help="Profile the run with cProfile and save the stats here.")
+    match_parser.add_argument('--trace-memory', action='store_true',
+                              help="Trace allocations with tracemalloc and print the top ones to stderr.")
+
+    compile_parser = subparsers.add_parser(
+        'compile', help="Compile a keywords file into an automaton snapshot.")
+    compile_parser.add_argument('--keywords', required=True)
+    compile_parser.add_argument('--output', required=True)
+
+    serve_parser = subparsers.add_parser(
+        'serve', help="Keep the keywords loaded and match URLs sent over a socket.")
+    serve_parser.add_argument('--keywords', required=True)
+    serve_parser.add_argument('--host', default=MATCHING_SERVER_HOST)
+    serve_parser.add_argument('--port', type=int, default=MATCHING_SERVER_PORT)
+    serve_parser.add_argument('--socket', help="Listen on this Unix socket instead of TCP.")
+
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == 'match':
+        if arguments.workers < 1:
+            parser.error("--workers must be at least 1")
+        if arguments.workers > 1 and arguments.urls == '-':
+            parser.error("--workers needs a URLs file, since stdin cannot be split into chunks")
+        if arguments.chunk_size < 1:
+            parser.error("--chunk-size must be at least 1")
+        if arguments.bytes and (arguments.workers > 1 or arguments.record_runtimes or arguments.tokenize
+                                or arguments.prefilter or arguments.cache_size):
+            parser.error("--bytes cannot be combined with --workers, --record-runtimes, "
+                         "--tokenize, --prefilter or --cache-size")
+        if arguments.prefilter_length < 1:
+            parser.error("--prefilter-length must be at least 1")
+        if arguments.cache_size < 0:
+            parser.error("--cache-size cannot be negative")
+        if arguments.cache_bytes is not None and arguments.cache_bytes < 1:
+            parser.error("--cache-bytes must be at least 1")
+        if arguments.cache_bytes is not None and not arguments.cache_size:
+            parser.error("--cache-bytes needs --cache-size")
+        if arguments.snapshot and (arguments.backend or arguments.engine):
+            parser.error("--snapshot cannot be combined with --backend or --engine, "
+                         f"since snapshots always use the {COMPACT_BACKEND} {AHO_CORASICK_ENGINE} automaton")
+        if arguments.backend is None:
+            arguments.backend = NODE_BACKEND
+        if arguments.engine is None:
+            arguments.engine = TRIE_WALK_ENGINE if arguments.backend == DAWG_BACKEND else AHO_CORASICK_ENGINE
+        if arguments.backend == DAWG_BACKEND and arguments.engine != TRIE_WALK_ENGINE:
+            parser.error(f"--backend {DAWG_BACKEND} only supports --engine {TRIE_WALK_ENGINE}")
+        if arguments.bulk_load and arguments.snapshot:
+            parser.error("--bulk-load needs --keywords, since a snapshot is already built")
+        if arguments.build_workers < 1:
+            parser.error("--build-workers must be at least 1")
+        if arguments.build_workers > 1 and (arguments.snapshot or arguments.backend != COMPACT_BACKEND):
+            parser.error(f"--build-workers needs --keywords and --backend {COMPACT_BACKEND}")
+        if (arguments.match_kind or arguments.any_match) and (
+                arguments.workers > 1 or arguments.bytes or arguments.cache_size):
+            parser.error("--match-kind and --any-match cannot be combined with --workers, --bytes "
+                         "or --cache-size")
+        if arguments.match_kind and arguments.any_match:
+            parser.error("--match-kind and --any-match cannot be combined")
+        if (arguments.match_kind or arguments.any_match) and arguments.format not in MATCH_DATA_FORMATS:
+            parser.error(f"--match-kind and --any-match need --format {' or '.join(MATCH_DATA_FORMATS)}, "
+                         "since the other formats only write the matching keywords")
+        if arguments.metrics_interval <= 0:
+            parser.error("--metrics-interval must be more than 0")
+        if arguments.count_search_steps and not arguments.metrics:
+            parser.error("--count-search-steps needs --metrics")
+        if arguments.count_search_steps and (arguments.workers > 1 or arguments.bytes):
+            # those URLs are searched outside of the instrumented trie,
+            # so the counts would all be zero
+            parser.error("--count-search-steps cannot be combined with --workers or --bytes")
+
+    return arguments
+
+
+def load_trie(arguments: argparse.Namespace, instrumentation: Instrumentation = None) -> tuple:
+    """
+    Returns the trie (wrapped for --metrics, --tokenize and
+    --prefilter) and the builder's stats, which only --bulk-load
+    and --build-workers fill in.
+    """
+    build_stats: dict = {}
+
+    if arguments.snapshot:
+        trie = AutomatonSnapshot(arguments.snapshot)
+    elif arguments.build_workers > 1:
+        trie_builder = TrieBuilder(engine=arguments.engine, backend=arguments.backend)
+        trie = trie_builder.build_trie_in_parallel_from_file_path(
+            arguments.keywords, arguments.build_workers)[0]
+        build_stats = trie_builder.build_stats
+    elif arguments.bulk_load:
+        trie_builder = TrieBuilder(engine=arguments.engine, backend=arguments.backend)
+        trie = trie_builder.bulk_load_trie_from_file_path(arguments.keywords)[0]
+        build_stats = trie_builder.build_stats
+    else:
+        trie_builder = TrieBuilder(engine=arguments.engine, backend=arguments.backend)
+        trie = trie_builder.build_trie_from_file_path(arguments.keywords)[0]
+
+    if instrumentation is not None:
+        trie = InstrumentedTrie(trie, instrumentation, arguments.count_search_steps)
+
+    if arguments.tokenize:
+        trie = UrlTokenMatcher(trie)
+
+    if arguments.prefilter:
+        trie = KeywordPrefilter(trie, arguments.prefilter_length)
+
+    return (trie, build_stats)
+
+
+def run_match(arguments: argparse.Namespace) -> int:
+    """
+    Runs match_urls, under cProfile and/or tracemalloc
+    when --profile or --trace-memory asks for them.
+    """
+    with capture_run(arguments.profile, arguments.trace_memory):
+        return match_urls(arguments)
+
+
+def match_urls(arguments: argparse.Namespace) -> int:
+    """
+    Matches every URL and writes the results as they are found.
+    Returns 0 when at least one URL matched and 1 when none did,
+    the same way grep does.
+    """
+    start_time: int = time.perf_counter_ns()
+    match_cache: MatchCache = None
+    instrumentation: Instrumentation = None
+
+    if arguments.cache_size:
+        match_cache = MatchCache(arguments.cache_size, arguments.cache_bytes)
+
+    if arguments.metrics:
+        instrumentation = Instrumentation(arguments.metrics, arguments.metrics_format, arguments.metrics_interval)
+
+    cli = SubstringMatcherCli(record_runtimes=arguments.record_runtimes, match_cache=match_cache,
+                              match_kind=arguments.match_kind, any_match=arguments.any_match)
+    cli.trie, build_stats = load_trie(arguments, instrumentation)
+    build_time: int = time.perf_counter_ns()
+
+    result_writer = RESULT_WRITER_FORMATS[arguments.format](arguments.output)
+
+    if arguments.background_writer:
+        result_writer = BackgroundResultWriter([result_writer])
+
+    if instrumentation is not None:
+        instrumentation.observe_phase('build', (build_time - start_time) / 1e9)
+        result_writer = InstrumentedResultWriter(result_writer, instrumentation)
+
+    with result_writer:
+        if arguments.workers > 1:
+            total_number_of_urls: int = 0
+            number_of_urls_with_matches: int = 0
+
+            for url, match_data in match_urls_file_in_parallel(
+                    cli.trie, arguments.urls, arguments.workers, arguments.chunk_size,
+                    arguments.record_runtimes, arguments.cache_size, arguments.cache_bytes):
+                total_number_of_urls += 1
+                if match_data['matches']:
+                    number_of_urls_with_matches += 1
+                result_writer.write_result(url, match_data)
+
+        elif arguments.bytes and arguments.urls == '-':
+            total_number_of_urls, number_of_urls_with_matches = \
+                cli.stream_binary_urls_for_matching_keywords(sys.stdin.buffer, [result_writer])
+
+        elif arguments.bytes:
+            with open(arguments.urls, 'rb') as urls_file:
+                total_number_of_urls, number_of_urls_with_matches = \
+                    cli.stream_binary_urls_for_matching_keywords(urls_file, [result_writer])
+
+        elif arguments.urls == '-':
+            total_number_of_urls, number_of_urls_with_matches = \
+                cli.stream_urls_for_matching_keywords(sys.stdin, [result_writer])
+
+        else:
+            with open(arguments.urls, 'r', encoding='utf-8') as urls_file:
+                total_number_of_urls, number_of_urls_with_matches = \
+                    cli.stream_urls_for_matching_keywords(urls_file, [result_writer])
+
+    end_time: int = time.perf_counter_ns()
+
+    if instrumentation is not None:
+        instrumentation.dump()
+
+    if arguments.stats:
+        match_seconds: float = (end_time - build_time) / 1e9
+        stats: dict = {
+            'build_seconds': (build_time - start_time) / 1e9,
+            'match_seconds': match_seconds,
+            'total_seconds': (end_time - start_time) / 1e9,
+            'total_number_of_urls': total_number_of_urls,
+            'number_of_urls_with_matches': number_of_urls_with_matches,
+            'urls_per_second': total_number_of_urls / match_seconds if match_seconds else None
+        }
+
+        if build_stats:
+            stats['keyword_loading'] = build_stats
+
+        if instrumentation is not None:
+            stats['metrics'] = instrumentation.to_dict()
+
+        # with --workers each worker keeps its own cache and
+        # pre-filter counts, which are out of reach here
+        if match_cache is not None and arguments.workers == 1:
+            stats['match_cache'] = match_cache.stats()
+
+        if arguments.prefilter and arguments.workers == 1:
+            stats['prefilter'] = cli.trie.stats()
+
+        print(json.dumps(stats), file=sys.stderr)
+
+    if number_of_urls_with_matches:
+        return EXIT_CODE_MATCHES_FOUND
+
+    return EXIT_CODE_NO_MATCHES
+
+
+def run_compile(arguments: argparse.Namespace) -> int:
+    invalid_keywords: set = compile_keywords_file_path(arguments.keywords, arguments.output)
+
+    if invalid_keywords:
+        print(f"Skipped {len(invalid_keywords)} invalid keyword(s).", file=sys.stderr)
+
+    return EXIT_CODE_SUCCESS
+
+
+def run_serve(arguments: argparse.Namespace) -> int:
+    run_matching_server(arguments.keywords, arguments.host, arguments.port, arguments.socket)
+
+    return EXIT_CODE_SUCCESS
+
+
+def main(argv: List[str] = None) -> int:
+    arguments = parse_arguments(argv)
+    commands: dict = {'match': run_match, 'compile': run_compile, 'serve': run_serve}
+
+    try:
+        return commands[arguments.command](arguments)
+    except (ImportError, OSError, ValueError) as error:
+        print(f"substring_matcher: {error}", file=sys.stderr)
+        return EXIT_CODE_ERROR
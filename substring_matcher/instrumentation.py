@@ -0,0 +1,369 @@
+import cProfile
+from contextlib import contextmanager
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Set, Tuple
+
+from substring_matcher.compact_trie import CompactTrie
+from substring_matcher.constants import (
+    ALL_MATCHES,
+    JSON_METRICS_FORMAT,
+    METRICS_COUNTERS,
+    METRICS_DUMP_INTERVAL_IN_SECONDS,
+    METRICS_FORMATS,
+    METRICS_HISTOGRAM_BUCKETS_IN_SECONDS,
+    METRICS_PHASES
+)
+from substring_matcher.dawg import Dawg
+from substring_matcher.trie import Trie
+
+# resource is only available on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+METRICS_PREFIX: str = 'substring_matcher'
+NUMBER_OF_TOP_ALLOCATIONS: int = 10
+
+
+def get_peak_memory_in_bytes() -> int:
+    """
+    Returns the most memory the process has held at once (its peak
+    resident set size), or None where the resource module is missing.
+    """
+    if resource is None:
+        return None
+
+    peak_memory: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS reports bytes
+    return peak_memory if sys.platform == 'darwin' else peak_memory * 1024
+
+
+class Histogram:
+    """
+    Counts the observed values in fixed buckets, the way a Prometheus
+    histogram does. bucket_counts[i] is the number of values up to
+    bucket_bounds[i] that were above the bound before it, and the
+    last count is for the values above every bound.
+    """
+
+    def __init__(self, bucket_bounds: List[float] = METRICS_HISTOGRAM_BUCKETS_IN_SECONDS):
+        if not isinstance(bucket_bounds, list):
+            raise TypeError
+
+        if bucket_bounds != sorted(bucket_bounds):
+            raise ValueError("The bucket bounds must be sorted")
+
+        self.bucket_bounds: List[float] = bucket_bounds
+        self.bucket_counts: List[int] = [0] * (len(bucket_bounds) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float):
+        bucket: int = 0
+        while bucket < len(self.bucket_bounds) and value > self.bucket_bounds[bucket]:
+            bucket += 1
+
+        self.bucket_counts[bucket] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_cumulative_counts(self) -> List[int]:
+        """Returns the number of values up to each bound (and in total), as Prometheus expects."""
+        cumulative_counts: List[int] = []
+        running_count: int = 0
+
+        for bucket_count in self.bucket_counts:
+            running_count += bucket_count
+            cumulative_counts.append(running_count)
+
+        return cumulative_counts
+
+    def to_dict(self) -> dict:
+        bounds: List[str] = [repr(bound) for bound in self.bucket_bounds] + ['+Inf']
+
+        return {
+            'buckets': dict(zip(bounds, self.get_cumulative_counts())),
+            'count': self.count,
+            'sum': self.sum
+        }
+
+
+class Instrumentation:
+    """
+    Collects the counters (see constants.METRICS_COUNTERS), a timing
+    histogram for each phase (build, match and write) and the peak
+    memory of a run. Nothing is recorded unless an Instrumentation is
+    handed to the parts of the run that should be measured (see
+    InstrumentedTrie and InstrumentedResultWriter), so the regular
+    searches do not pay for it.
+
+    With a metrics_file_path, maybe_dump rewrites the file in the
+    metrics_format ('json' or 'prometheus') every dump_interval
+    seconds, so the progress of a long run can be followed (e.g. by
+    the node exporter's textfile collector). The file is replaced in
+    one step, so it is never read half written.
+    """
+
+    def __init__(self, metrics_file_path: str = None, metrics_format: str = JSON_METRICS_FORMAT,
+                 dump_interval_in_seconds: float = METRICS_DUMP_INTERVAL_IN_SECONDS):
+        if metrics_file_path is not None and not isinstance(metrics_file_path, str):
+            raise TypeError
+
+        if metrics_format not in METRICS_FORMATS:
+            raise ValueError(f"Metrics format must be one of {METRICS_FORMATS}")
+
+        if dump_interval_in_seconds <= 0:
+            raise ValueError("The dump interval must be more than 0 seconds")
+
+        self.metrics_file_path: str = metrics_file_path
+        self.metrics_format: str = metrics_format
+        self.dump_interval_in_seconds: float = dump_interval_in_seconds
+        self.last_dump_time: float = time.monotonic()
+        self.counters: Dict[str, int] = dict.fromkeys(METRICS_COUNTERS, 0)
+        self.histograms: Dict[str, Histogram] = {phase: Histogram() for phase in METRICS_PHASES}
+
+    def increment(self, counter_name: str, amount: int = 1):
+        self.counters[counter_name] += amount
+
+    def observe_phase(self, phase: str, seconds: float):
+        self.histograms[phase].observe(seconds)
+
+    @contextmanager
+    def time_phase(self, phase: str) -> Iterator[None]:
+        """Adds the time spent inside the with block to the phase's histogram."""
+        start_time: int = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe_phase(phase, (time.perf_counter_ns() - start_time) / 1e9)
+
+    def get_gauges(self) -> Dict[str, int]:
+        gauges: Dict[str, int] = {'peak_memory_bytes': get_peak_memory_in_bytes()}
+
+        if tracemalloc.is_tracing():
+            gauges['peak_traced_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+
+        return gauges
+
+    def to_dict(self) -> dict:
+        return {
+            'counters': dict(self.counters),
+            'phase_seconds': {phase: histogram.to_dict() for phase, histogram in self.histograms.items()},
+            'gauges': self.get_gauges()
+        }
+
+    def format_json(self) -> str:
+        return json.dumps(self.to_dict()) + '\n'
+
+    def format_prometheus(self) -> str:
+        """Formats the metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+
+        for counter_name, value in self.counters.items():
+            metric_name: str = f"{METRICS_PREFIX}_{counter_name}_total"
+            lines.append(f"# TYPE {metric_name} counter")
+            lines.append(f"{metric_name} {value}")
+
+        metric_name = f"{METRICS_PREFIX}_phase_seconds"
+        lines.append(f"# TYPE {metric_name} histogram")
+
+        for phase, histogram in self.histograms.items():
+            for bound, count in histogram.to_dict()['buckets'].items():
+                lines.append(f'{metric_name}_bucket{{phase="{phase}",le="{bound}"}} {count}')
+            lines.append(f'{metric_name}_sum{{phase="{phase}"}} {histogram.sum!r}')
+            lines.append(f'{metric_name}_count{{phase="{phase}"}} {histogram.count}')
+
+        for gauge_name, value in self.get_gauges().items():
+            if value is not None:
+                lines.append(f"# TYPE {METRICS_PREFIX}_{gauge_name} gauge")
+                lines.append(f"{METRICS_PREFIX}_{gauge_name} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self):
+        """Writes the metrics to the metrics file (if there is one)."""
+        self.last_dump_time = time.monotonic()
+
+        if self.metrics_file_path is None:
+            return
+
+        if self.metrics_format == JSON_METRICS_FORMAT:
+            metrics: str = self.format_json()
+        else:
+            metrics = self.format_prometheus()
+
+        temporary_file_path: str = f"{self.metrics_file_path}.tmp"
+        with open(temporary_file_path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(metrics)
+        os.replace(temporary_file_path, self.metrics_file_path)
+
+    def maybe_dump(self):
+        """Dumps the metrics if the dump interval has passed since the last dump."""
+        if time.monotonic() - self.last_dump_time >= self.dump_interval_in_seconds:
+            self.dump()
+
+
+class InstrumentedTrie:
+    """
+    Times every search of the trie it wraps as the 'match' phase.
+    With count_search_steps, it also counts the trie transitions and
+    root restarts of each search, which the trie counts during that
+    same search (see Trie.iterate_matching_nodes).
+
+    It has the same find_matching_* and get_keyword methods as the
+    tries, and goes right around the trie (inside a UrlTokenMatcher
+    or KeywordPrefilter), so that only real searches are measured.
+    """
+
+    def __init__(self, trie, instrumentation: Instrumentation, count_search_steps: bool = False):
+        if not isinstance(instrumentation, Instrumentation):
+            raise TypeError
+
+        if count_search_steps and not isinstance(trie, (Trie, CompactTrie, Dawg)):
+            raise ValueError("The trie cannot count its search steps")
+
+        self.trie = trie
+        self.instrumentation: Instrumentation = instrumentation
+        self.count_search_steps: bool = count_search_steps
+
+    @property
+    def keyword_set_version(self) -> int:
+        return self.trie.keyword_set_version
+
+    @property
+    def keyword_count(self) -> int:
+        return self.trie.keyword_count
+
+    def get_keyword(self, keyword_id: int) -> str:
+        return self.trie.get_keyword(keyword_id)
+
+    def start_search_steps(self) -> List[int]:
+        """Returns the [transitions, root_restarts] list for a search to count into, if counting."""
+        return [0, 0] if self.count_search_steps else None
+
+    def record_search_steps(self, search_steps: List[int]):
+        if search_steps is not None:
+            self.instrumentation.increment('trie_transitions', search_steps[0])
+            self.instrumentation.increment('root_restarts', search_steps[1])
+
+    def find_matching_keyword_ids(self, url: str, *, url_is_lowercase: bool = False) -> Set[int]:
+        search_steps: List[int] = self.start_search_steps()
+        with self.instrumentation.time_phase('match'):
+            keyword_ids: Set[int] = self.trie.find_matching_keyword_ids(
+                url, url_is_lowercase=url_is_lowercase, search_steps=search_steps)
+
+        self.record_search_steps(search_steps)
+
+        return keyword_ids
+
+    def find_matching_substrings(self, url: str) -> Set[str]:
+        search_steps: List[int] = self.start_search_steps()
+        with self.instrumentation.time_phase('match'):
+            matching_substrings: Set[str] = self.trie.find_matching_substrings(url, search_steps=search_steps)
+
+        self.record_search_steps(search_steps)
+
+        return matching_substrings
+
+    def find_matching_spans(self, url: str, match_kind: str = ALL_MATCHES, *,
+                            url_is_lowercase: bool = False) -> List[Tuple[int, int, int]]:
+        search_steps: List[int] = self.start_search_steps()
+        with self.instrumentation.time_phase('match'):
+            spans: List[Tuple[int, int, int]] = self.trie.find_matching_spans(
+                url, match_kind, url_is_lowercase=url_is_lowercase, search_steps=search_steps)
+
+        self.record_search_steps(search_steps)
+
+        return spans
+
+    def has_any_match(self, url: str, *, url_is_lowercase: bool = False) -> bool:
+        search_steps: List[int] = self.start_search_steps()
+        with self.instrumentation.time_phase('match'):
+            any_match: bool = self.trie.has_any_match(
+                url, url_is_lowercase=url_is_lowercase, search_steps=search_steps)
+
+        # only the steps up to the first match were taken
+        self.record_search_steps(search_steps)
+
+        return any_match
+
+
+class InstrumentedResultWriter:
+    """
+    Counts the URLs, their bytes and their matches as the results are
+    written, and times each write as the 'write' phase. Since every
+    result passes through it, the counts are right for the parallel
+    and bytes pipelines too. It also gives the Instrumentation its
+    chance to dump the metrics.
+    """
+
+    def __init__(self, result_writer, instrumentation: Instrumentation):
+        if not isinstance(instrumentation, Instrumentation):
+            raise TypeError
+
+        self.result_writer = result_writer
+        self.instrumentation: Instrumentation = instrumentation
+
+    def write_result(self, url: str, match_data: dict):
+        self.instrumentation.increment('urls_processed')
+        self.instrumentation.increment('bytes_scanned', len(url.encode('utf-8')))
+        self.instrumentation.increment('matches_emitted', len(match_data.get('matches', ())))
+
+        with self.instrumentation.time_phase('write'):
+            self.result_writer.write_result(url, match_data)
+
+        self.instrumentation.maybe_dump()
+
+    def close(self):
+        with self.instrumentation.time_phase('write'):
+            self.result_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+@contextmanager
+def capture_run(profile_file_path: str = None, trace_memory: bool = False) -> Iterator[None]:
+    """
+    Profiles the code inside the with block with cProfile and saves
+    the stats to profile_file_path (e.g. for snakeviz or pstats).
+    With trace_memory, tracemalloc follows every allocation (which
+    slows the run down a lot), and the lines that allocated the most
+    memory are printed to stderr at the end.
+    """
+    profiler: cProfile.Profile = None
+
+    if trace_memory:
+        tracemalloc.start()
+
+    if profile_file_path is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_file_path)
+
+        if trace_memory:
+            # leaves out what the profiler itself allocated
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, cProfile.__file__),
+                tracemalloc.Filter(False, '*/contextlib.py')])
+            top_allocations = snapshot.statistics('lineno')[:NUMBER_OF_TOP_ALLOCATIONS]
+            tracemalloc.stop()
+
+            print("Top memory allocations:", file=sys.stderr)
+            for allocation in top_allocations:
+                print(f"  {allocation}", file=sys.stderr)
@@ -0,0 +1,180 @@
+from substring_matcher.constants import ALL_MATCHES, PREFILTER_PREFIX_LENGTH
+import re
+from typing import Iterable, List, Pattern, Set, Tuple
+
+
+def compile_keyword_prefix_pattern(keywords: Iterable[str], prefix_length: int) -> Pattern:
+    """
+    Compiles a pattern that matches the first prefix_length characters
+    of any of the keywords (the whole keyword when it is shorter).
+    The prefixes are nested like a trie, e.g. 'arm', 'art' and 'man'
+    with a prefix length of 3 become 'ar[mt]|man', so the regular
+    expression engine never has to try the same leading characters
+    twice. A pattern for no keywords never matches.
+    """
+    prefix_tree: dict = {}
+
+    for keyword in keywords:
+        if not keyword:
+            continue
+
+        current_branch: dict = prefix_tree
+        for character in keyword[:prefix_length]:
+            current_branch = current_branch.setdefault(character, {})
+        # an empty key marks the end of a prefix
+        current_branch[''] = {}
+
+    if not prefix_tree:
+        return re.compile(r'(?!)')
+
+    return re.compile(render_prefix_branch(prefix_tree))
+
+
+def render_prefix_branch(branch: dict) -> str:
+    """Turns one level of the prefix tree into a regular expression."""
+    final_characters: list = []
+    alternatives: list = []
+
+    for character, next_branch in sorted(branch.items()):
+        if character == '':
+            continue
+
+        if '' in next_branch:
+            # a shorter keyword's prefix already covers everything below it
+            final_characters.append(re.escape(character))
+        else:
+            alternatives.append(re.escape(character) + render_prefix_branch(next_branch))
+
+    if len(final_characters) == 1:
+        alternatives.insert(0, final_characters[0])
+    elif final_characters:
+        alternatives.insert(0, f"[{''.join(final_characters)}]")
+
+    if len(alternatives) == 1:
+        return alternatives[0]
+
+    return f"(?:{'|'.join(alternatives)})"
+
+
+class KeywordPrefilter:
+    """
+    Rejects URLs that cannot contain any keyword before the trie
+    searches them. A URL can only contain a keyword if it contains
+    that keyword's first prefix_length characters, so one regular
+    expression search for those prefixes (which runs in C) is enough
+    to skip most URLs that match nothing. URLs that pass are searched
+    by the trie as usual, so the results never change.
+
+    Whether it pays off depends on how many URLs it rejects, not on
+    the engine: with a few hundred keywords most URLs contain none of
+    the prefixes and get skipped, but with tens of thousands nearly
+    every URL contains one, so the extra search only adds to the time
+    of both engines. benchmark.benchmark_prefilter measures this for
+    a range of keyword counts.
+
+    Longer prefixes reject more URLs but make a bigger pattern that
+    takes longer to compile and to run. The pattern is compiled again
+    only when the trie's keywords change.
+
+    It has the same find_matching_* and get_keyword methods as the
+    tries, so it can be used wherever a trie is searched (and it can
+    wrap a UrlTokenMatcher). urls_checked and urls_rejected count its
+    work, and selectivity is the share of URLs it rejected.
+    """
+
+    def __init__(self, trie, prefix_length: int = PREFILTER_PREFIX_LENGTH):
+        if not isinstance(prefix_length, int):
+            raise TypeError
+
+        if prefix_length < 1:
+            raise ValueError("The prefix length must be at least 1")
+
+        self.trie = trie
+        self.prefix_length: int = prefix_length
+        self.prefix_pattern: Pattern = None
+        self.prefix_pattern_version: int = None
+        self.urls_checked: int = 0
+        self.urls_rejected: int = 0
+
+    @property
+    def keyword_set_version(self) -> int:
+        return self.trie.keyword_set_version
+
+    @property
+    def keyword_count(self) -> int:
+        return self.trie.keyword_count
+
+    def get_keyword(self, keyword_id: int) -> str:
+        return self.trie.get_keyword(keyword_id)
+
+    def get_prefix_pattern(self) -> Pattern:
+        if self.prefix_pattern_version != self.trie.keyword_set_version:
+            self.prefix_pattern = compile_keyword_prefix_pattern(
+                (self.trie.get_keyword(keyword_id) for keyword_id in range(self.trie.keyword_count)),
+                self.prefix_length)
+            self.prefix_pattern_version = self.trie.keyword_set_version
+
+        return self.prefix_pattern
+
+    def could_match(self, lowercase_url: str) -> bool:
+        """Returns False only if the (lowercase) URL cannot contain any keyword."""
+        self.urls_checked += 1
+
+        if self.get_prefix_pattern().search(lowercase_url) is None:
+            self.urls_rejected += 1
+            return False
+
+        return True
+
+    def find_matching_keyword_ids(self, url: str, *, url_is_lowercase: bool = False) -> Set[int]:
+        if not isinstance(url, str):
+            raise TypeError
+
+        # the trie is handed the lowercase URL, so it is only lowercased once
+        if not url_is_lowercase:
+            url = url.lower()
+
+        if not self.could_match(url):
+            return set()
+
+        return self.trie.find_matching_keyword_ids(url, url_is_lowercase=True)
+
+    def find_matching_substrings(self, url: str) -> Set[str]:
+        return {
+            self.trie.get_keyword(keyword_id)
+            for keyword_id in self.find_matching_keyword_ids(url)
+        }
+
+    def find_matching_spans(self, url: str, match_kind: str = ALL_MATCHES, *,
+                            url_is_lowercase: bool = False) -> List[Tuple[int, int, int]]:
+        if not isinstance(url, str):
+            raise TypeError
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        if not self.could_match(url):
+            return []
+
+        return self.trie.find_matching_spans(url, match_kind, url_is_lowercase=True)
+
+    def has_any_match(self, url: str, *, url_is_lowercase: bool = False) -> bool:
+        if not isinstance(url, str):
+            raise TypeError
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        return self.could_match(url) and self.trie.has_any_match(url, url_is_lowercase=True)
+
+    @property
+    def selectivity(self) -> float:
+        """The share of the checked URLs that were rejected without a search."""
+        return self.urls_rejected / self.urls_checked if self.urls_checked else 0.0
+
+    def stats(self) -> dict:
+        return {
+            'urls_checked': self.urls_checked,
+            'urls_rejected': self.urls_rejected,
+            'selectivity': self.selectivity
+        }
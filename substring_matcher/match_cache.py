@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from substring_matcher.constants import MATCH_CACHE_SIZE
+import sys
+from typing import Set, Tuple
+
+
+class MatchCache:
+    """
+    Remembers the keyword ids found in recently matched URLs, so that
+    a URL seen again (crawl logs repeat the same hosts and paths a
+    lot) is answered with a dictionary lookup instead of a search.
+
+    The cache holds at most max_entries URLs and, when
+    max_size_in_bytes is given, about that many bytes of URLs and
+    results. The least recently used URL is evicted first. Results
+    are only valid for one keyword set, so the cache clears itself
+    when it is asked about a different trie, or about the same trie
+    after a keyword was added or removed.
+    """
+
+    def __init__(self, max_entries: int = MATCH_CACHE_SIZE, max_size_in_bytes: int = None):
+        if not isinstance(max_entries, int):
+            raise TypeError
+
+        if max_size_in_bytes is not None and not isinstance(max_size_in_bytes, int):
+            raise TypeError
+
+        if max_entries < 1 or (max_size_in_bytes is not None and max_size_in_bytes < 1):
+            raise ValueError("The cache must be able to hold at least one URL")
+
+        self.max_entries: int = max_entries
+        self.max_size_in_bytes: int = max_size_in_bytes
+        self.results: OrderedDict = OrderedDict()
+        self.size_in_bytes: int = 0
+        self.trie = None
+        self.keyword_set_version: int = None
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def find_matching_keyword_ids(self, trie, url: str) -> Tuple[int, ...]:
+        """
+        Returns the ids of the keywords in the URL, from the cache
+        when possible and from trie.find_matching_keyword_ids if not.
+        """
+        self.check_keyword_set(trie)
+        keyword_ids: Tuple[int, ...] = self.results.get(url)
+
+        if keyword_ids is not None:
+            self.hits += 1
+            self.results.move_to_end(url)
+            return keyword_ids
+
+        self.misses += 1
+        keyword_ids = tuple(trie.find_matching_keyword_ids(url))
+        self.add_result(url, keyword_ids)
+
+        return keyword_ids
+
+    def find_matching_substrings(self, trie, url: str) -> Set[str]:
+        """Same as trie.find_matching_substrings, but through the cache."""
+        return {trie.get_keyword(keyword_id)
+                for keyword_id in self.find_matching_keyword_ids(trie, url)}
+
+    def check_keyword_set(self, trie):
+        """Clears the cache if the trie or its keywords have changed."""
+        if trie is self.trie and trie.keyword_set_version == self.keyword_set_version:
+            return
+
+        if self.results:
+            self.invalidations += 1
+
+        self.clear()
+        self.trie = trie
+        self.keyword_set_version = trie.keyword_set_version
+
+    def add_result(self, url: str, keyword_ids: Tuple[int, ...]):
+        self.results[url] = keyword_ids
+        self.size_in_bytes += self.estimate_entry_size(url, keyword_ids)
+
+        while len(self.results) > self.max_entries or (
+                self.max_size_in_bytes is not None and self.size_in_bytes > self.max_size_in_bytes
+                and len(self.results) > 1):
+            evicted_url, evicted_keyword_ids = self.results.popitem(last=False)
+            self.size_in_bytes -= self.estimate_entry_size(evicted_url, evicted_keyword_ids)
+            self.evictions += 1
+
+    @staticmethod
+    def estimate_entry_size(url: str, keyword_ids: Tuple[int, ...]) -> int:
+        # the ids themselves are small ints, which Python shares
+        return sys.getsizeof(url) + sys.getsizeof(keyword_ids)
+
+    def clear(self):
+        self.results.clear()
+        self.size_in_bytes = 0
+
+    @property
+    def hit_rate(self) -> float:
+        number_of_lookups: int = self.hits + self.misses
+        return self.hits / number_of_lookups if number_of_lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hit_rate,
+            'entries': len(self.results),
+            'size_in_bytes': self.size_in_bytes
+        }
@@ -0,0 +1,109 @@
+from functools import partial
+import time
+
+
+def build_keyword_match_data(trie, url: str, record_runtimes: bool = False,
+                             use_keyword_ids: bool = False, match_cache=None,
+                             match_kind: str = None, any_match: bool = False) -> dict:
+    """
+    Builds the dictionary of matching keywords for the URL with a
+    single search. When record_runtimes is True, that same search is
+    timed with time.perf_counter_ns and stored as 'runtime_ns'.
+
+    When use_keyword_ids is True, the matches are stored as keyword
+    ids under 'keyword_ids' instead, and resolve_keyword_ids turns
+    them into keywords once the result is about to be written.
+
+    When a MatchCache is given, the search goes through it, so a URL
+    that was matched recently is not searched again.
+
+    When a match_kind is given (see constants.MATCH_KINDS), the
+    positions of the matches are kept as well: 'spans' holds a
+    [start, end, keyword] list for each one (or [start, end,
+    keyword_id] with use_keyword_ids), and the matches are listed in
+    the order they were found. With any_match, the search stops at the
+    first keyword and the data is just whether there was one, stored
+    as 'any_match'. The cache stores neither, so it cannot be used
+    with them.
+    """
+    if match_cache is not None and (match_kind is not None or any_match):
+        raise ValueError("The match cache cannot be used with a match kind or any_match")
+
+    if any_match:
+        return build_match_data_from_search(trie.has_any_match, url, record_runtimes, 'any_match')
+
+    if match_kind is not None:
+        match_data: dict = build_match_data_from_search(
+            partial(trie.find_matching_spans, match_kind=match_kind), url, record_runtimes, 'spans')
+        spans: list = match_data['spans']
+
+        if not use_keyword_ids:
+            spans = [(start, end, trie.get_keyword(keyword_id)) for start, end, keyword_id in spans]
+        matches_key: str = 'keyword_ids' if use_keyword_ids else 'matches'
+
+        # dict.fromkeys drops the repeated matches but keeps their order
+        span_match_data: dict = {
+            matches_key: list(dict.fromkeys(span[2] for span in spans)),
+            'spans': [list(span) for span in spans]}
+        span_match_data.update(
+            (key, value) for key, value in match_data.items() if key != 'spans')
+
+        return span_match_data
+
+    if match_cache is not None:
+        search_source = match_cache
+    else:
+        search_source = trie
+
+    if use_keyword_ids:
+        find_matches = search_source.find_matching_keyword_ids
+        matches_key = 'keyword_ids'
+    else:
+        find_matches = search_source.find_matching_substrings
+        matches_key = 'matches'
+
+    if match_cache is not None:
+        find_matches = partial(find_matches, trie)
+
+    match_data = build_match_data_from_search(find_matches, url, record_runtimes, matches_key)
+    match_data[matches_key] = list(match_data[matches_key])
+
+    return match_data
+
+
+def build_match_data_from_search(find_matches, url: str, record_runtimes: bool, matches_key: str) -> dict:
+    """Runs the search once, timing it only when record_runtimes is True."""
+    if not record_runtimes:
+        return {matches_key: find_matches(url)}
+
+    start_time: int = time.perf_counter_ns()
+    matches = find_matches(url)
+    runtime_in_ns: int = time.perf_counter_ns() - start_time
+
+    return {matches_key: matches, 'runtime_ns': runtime_in_ns}
+
+
+def resolve_keyword_ids(trie, match_data: dict) -> dict:
+    """
+    Replaces the 'keyword_ids' of the match data with the
+    keywords they stand for, stored under 'matches'. The ids
+    in the 'spans' (if there are any) are replaced as well.
+    """
+    if 'keyword_ids' not in match_data:
+        return match_data
+
+    resolved_match_data: dict = {
+        'matches': [trie.get_keyword(keyword_id) for keyword_id in match_data['keyword_ids']]}
+    resolved_match_data.update(
+        (key, value) for key, value in match_data.items() if key != 'keyword_ids')
+
+    if 'spans' in match_data:
+        resolved_match_data['spans'] = [
+            [start, end, trie.get_keyword(keyword_id)] for start, end, keyword_id in match_data['spans']]
+
+    return resolved_match_data
+
+
+def format_runtime(runtime_in_ns: int) -> str:
+    """Formats a runtime in nanoseconds for the human readable results."""
+    return f"{runtime_in_ns / 1e6} milliseconds"
@@ -0,0 +1,68 @@
+from typing import List, Tuple
+
+from substring_matcher.constants import (
+    ALL_MATCHES,
+    LEFTMOST_LONGEST_MATCHES,
+    MATCH_KINDS
+)
+
+# (start, end, keyword_id), where url[start:end] is the keyword
+Span = Tuple[int, int, int]
+
+
+def select_matching_spans(spans: List[Span], match_kind: str) -> List[Span]:
+    """
+    Picks the spans for the match kind out of every (possibly
+    overlapping) match found in a single search, and sorts them
+    by where they start.
+
+    - all: keeps every match, overlapping ones included.
+    - leftmost_longest: goes from left to right and keeps the
+      longest match that starts first, then skips every match that
+      overlaps it (like a POSIX regular expression alternation).
+    - leftmost_first: the same, but keeps the keyword that was
+      added first (the lowest keyword id) instead of the longest.
+    """
+    if match_kind not in MATCH_KINDS:
+        raise ValueError(f"Match kind must be one of {MATCH_KINDS}")
+
+    if match_kind == ALL_MATCHES:
+        return sorted(spans)
+
+    if match_kind == LEFTMOST_LONGEST_MATCHES:
+        sorted_spans: List[Span] = sorted(spans, key=lambda span: (span[0], span[0] - span[1]))
+    else:
+        sorted_spans = sorted(spans, key=lambda span: (span[0], span[2]))
+
+    selected_spans: List[Span] = []
+    end_of_last_span: int = 0
+
+    for span in sorted_spans:
+        if span[0] >= end_of_last_span:
+            selected_spans.append(span)
+            end_of_last_span = span[1]
+
+    return selected_spans
+
+
+def convert_byte_spans_to_character_spans(url: str, spans: List[Span]) -> List[Span]:
+    """
+    Turns spans over the UTF-8 bytes of the URL into spans over its
+    characters. Nothing needs to change when the URL is all ASCII.
+    """
+    if url.isascii():
+        return spans
+
+    character_indexes: dict = {}
+    byte_index: int = 0
+
+    for character_index, character in enumerate(url):
+        character_indexes[byte_index] = character_index
+        byte_index += len(character.encode('utf-8'))
+
+    character_indexes[byte_index] = len(url)
+
+    return [
+        (character_indexes[start], character_indexes[end], keyword_id)
+        for start, end, keyword_id in spans
+    ]
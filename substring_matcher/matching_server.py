@@ -0,0 +1,252 @@
+import asyncio
+import json
+from contextlib import nullcontext
+from typing import AsyncIterator, List
+
+from substring_matcher.constants import (
+    DEFAULT_KEYWORDS_FILE,
+    MATCHING_SERVER_BATCH_SIZE,
+    MATCHING_SERVER_HOST,
+    MATCHING_SERVER_MAX_LINE_LENGTH,
+    MATCHING_SERVER_MAX_PENDING_RESPONSES,
+    MATCHING_SERVER_MAX_PENDING_URLS,
+    MATCHING_SERVER_PORT,
+    SUBSTRING_MATCHER_DATA_PATH
+)
+from substring_matcher.trie_builder import TrieBuilder
+from substring_matcher.trie_generations import TrieGenerations
+from substring_matcher.utils.file_paths import resource_path
+
+DEFAULT_KEYWORDS_FILE_PATH: str = resource_path(
+    f"{SUBSTRING_MATCHER_DATA_PATH}/{DEFAULT_KEYWORDS_FILE}")
+
+
+class MatchingServer:
+    """
+    A local asyncio server that keeps one trie warm for many clients.
+
+    Clients send newline-delimited URLs and may pipeline as many as
+    they like. Every URL gets one JSON line back, in the order it was
+    sent: {"url": ..., "matches": [...]}. URLs from all connections
+    go into one queue and get matched together in batches. When that
+    queue (or a client's unread responses) fills up, the server stops
+    reading from the client until there is room again.
+
+    A line longer than max_line_length bytes, or a URL whose batch
+    failed to match, gets {"url": ..., "error": ...} back instead,
+    so the responses stay in step with the requests.
+    """
+
+    def __init__(self, trie, *,
+                 batch_size: int = MATCHING_SERVER_BATCH_SIZE,
+                 batch_delay_in_seconds: float = 0,
+                 max_pending_urls: int = MATCHING_SERVER_MAX_PENDING_URLS,
+                 max_pending_responses: int = MATCHING_SERVER_MAX_PENDING_RESPONSES,
+                 max_line_length: int = MATCHING_SERVER_MAX_LINE_LENGTH):
+        if batch_size < 1:
+            raise ValueError("The batch size must be at least one")
+
+        self.trie = trie
+        self.batch_size: int = batch_size
+        self.batch_delay_in_seconds: float = batch_delay_in_seconds
+        self.max_pending_urls: int = max_pending_urls
+        self.max_pending_responses: int = max_pending_responses
+        self.max_line_length: int = max_line_length
+        self.pending_urls: asyncio.Queue = None
+        self.batcher_task: asyncio.Task = None
+        self.server: asyncio.AbstractServer = None
+
+    async def start_tcp(self, host: str = MATCHING_SERVER_HOST,
+                        port: int = MATCHING_SERVER_PORT) -> asyncio.AbstractServer:
+        self.start_batcher()
+        self.server = await asyncio.start_server(
+            self.handle_client, host, port, limit=self.max_line_length)
+        return self.server
+
+    async def start_unix(self, socket_path: str) -> asyncio.AbstractServer:
+        self.start_batcher()
+        self.server = await asyncio.start_unix_server(
+            self.handle_client, socket_path, limit=self.max_line_length)
+        return self.server
+
+    def start_batcher(self):
+        self.pending_urls = asyncio.Queue(maxsize=self.max_pending_urls)
+        self.batcher_task = asyncio.create_task(self.run_batcher())
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+        if self.batcher_task is not None:
+            self.batcher_task.cancel()
+            try:
+                await self.batcher_task
+            except asyncio.CancelledError:
+                pass
+
+    async def run_batcher(self):
+        """
+        Waits for a URL, gives the other clients a chance to add theirs,
+        then matches everything that is waiting (up to batch_size) at once.
+        """
+        while True:
+            batch: list = [await self.pending_urls.get()]
+            await asyncio.sleep(self.batch_delay_in_seconds)
+
+            while len(batch) < self.batch_size and not self.pending_urls.empty():
+                batch.append(self.pending_urls.get_nowait())
+
+            try:
+                batch_matches: List[list] = self.match_batch([url for url, _ in batch])
+            except Exception as error:
+                # only this batch fails, the batcher keeps serving the next ones
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            for (_, future), matches in zip(batch, batch_matches):
+                if not future.done():
+                    future.set_result(matches)
+
+    def match_batch(self, urls: List[str]) -> List[list]:
+        """
+        Matches the URLs with one match_many call when the trie has
+        one, and one search per URL otherwise.
+        """
+        # The keyword ids must be turned back into keywords by the same
+        # generation that found them, even if another one is swapped in.
+        searching = self.trie.searching() if isinstance(self.trie, TrieGenerations) else nullcontext(self.trie)
+
+        with searching as trie:
+            if not hasattr(trie, 'match_many'):
+                return [list(trie.find_matching_substrings(url)) for url in urls]
+
+            url_indexes, keyword_ids = trie.match_many(urls)
+            batch_matches: List[list] = [[] for _ in urls]
+
+            for url_index, keyword_id in zip(url_indexes, keyword_ids):
+                batch_matches[url_index].append(trie.get_keyword(keyword_id))
+
+        return batch_matches
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        responses: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending_responses)
+        writer_task: asyncio.Task = asyncio.create_task(self.write_responses(responses, writer))
+
+        try:
+            async for line in self.read_lines(reader):
+                future: asyncio.Future = loop.create_future()
+
+                if line is None:
+                    future.set_exception(ValueError(f"The line is longer than {self.max_line_length} bytes"))
+                    await responses.put((None, future))
+                    continue
+
+                url: str = line.decode('utf-8', errors='replace').strip()
+                await self.pending_urls.put((url, future))
+                await responses.put((url, future))
+        except ConnectionError:
+            pass
+        finally:
+            await responses.put(None)
+            await writer_task
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def read_lines(self, reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+        """
+        Yields each line the client sends, and None in place of a line
+        longer than max_line_length. A long line is skipped piece by
+        piece, so it is never held in memory as a whole.
+        """
+        while True:
+            try:
+                line: bytes = await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as error:
+                # the client is done, maybe after a last line without a newline
+                if error.partial:
+                    yield error.partial
+                return
+            except asyncio.LimitOverrunError as error:
+                await self.skip_line(reader, error.consumed)
+                line = None
+
+            yield line
+
+    @staticmethod
+    async def skip_line(reader: asyncio.StreamReader, number_of_bytes_to_skip: int):
+        """Drops the rest of the current line, including its newline."""
+        while True:
+            await reader.readexactly(number_of_bytes_to_skip)
+
+            try:
+                await reader.readuntil(b'\n')
+                return
+            except asyncio.IncompleteReadError:
+                return
+            except asyncio.LimitOverrunError as error:
+                number_of_bytes_to_skip = error.consumed
+
+    async def write_responses(self, responses: asyncio.Queue, writer: asyncio.StreamWriter):
+        """Writes the responses in request order as their matches come in."""
+        while True:
+            response = await responses.get()
+            if response is None:
+                return
+
+            url, future = response
+
+            try:
+                result: dict = {'url': url, 'matches': await future}
+            except Exception as error:
+                result = {'url': url, 'error': str(error)}
+
+            try:
+                writer.write(json.dumps(result).encode('utf-8') + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                # the client is gone, but the reader still needs the queue drained
+                continue
+
+
+def build_warm_trie(keywords_file_path: str = DEFAULT_KEYWORDS_FILE_PATH) -> TrieGenerations:
+    """
+    Builds the trie the server keeps in memory for as long as it runs.
+    The server only matches with match_many, so TrieGenerations builds
+    the transition table up front, and no Aho-Corasick links are built
+    for the trie itself.
+    """
+    trie_builder = TrieBuilder()
+    return TrieGenerations(trie_builder.build_trie_from_file_path(keywords_file_path)[0])
+
+
+async def serve_forever(matching_server: MatchingServer, host: str = MATCHING_SERVER_HOST,
+                        port: int = MATCHING_SERVER_PORT, socket_path: str = None):
+    if socket_path:
+        server = await matching_server.start_unix(socket_path)
+    else:
+        server = await matching_server.start_tcp(host, port)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await matching_server.close()
+
+
+def run_matching_server(keywords_file_path: str = DEFAULT_KEYWORDS_FILE_PATH,
+                        host: str = MATCHING_SERVER_HOST, port: int = MATCHING_SERVER_PORT,
+                        socket_path: str = None):
+    """Loads the keywords once and serves matches until interrupted."""
+    matching_server = MatchingServer(build_warm_trie(keywords_file_path))
+
+    try:
+        asyncio.run(serve_forever(matching_server, host, port, socket_path))
+    except KeyboardInterrupt:
+        pass
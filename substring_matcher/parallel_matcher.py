@@ -0,0 +1,133 @@
+import multiprocessing
+import os
+from typing import Iterator, List, Tuple
+
+from substring_matcher.compact_trie import CompactTrie
+from substring_matcher.constants import (
+    AHO_CORASICK_ENGINE,
+    PARALLEL_CHUNK_SIZE_IN_BYTES
+)
+from substring_matcher.dawg import Dawg
+from substring_matcher.instrumentation import InstrumentedTrie
+from substring_matcher.keyword_prefilter import KeywordPrefilter
+from substring_matcher.match_cache import MatchCache
+from substring_matcher.match_data import build_keyword_match_data, resolve_keyword_ids
+from substring_matcher.trie import Trie
+from substring_matcher.url_tokenizer import UrlTokenMatcher
+
+# Set once in each worker process by initialize_worker.
+# Every task in that worker reuses it.
+worker_trie: Trie = None
+worker_match_cache: MatchCache = None
+
+
+def initialize_worker(trie: Trie, match_cache_size: int = 0, match_cache_size_in_bytes: int = None):
+    """
+    Stores the trie for the worker process. With the 'fork' start
+    method the trie is inherited from the parent without pickling.
+    Otherwise it gets pickled once per worker, never once per task.
+    Each worker keeps its own result cache when match_cache_size is
+    more than 0.
+    """
+    global worker_trie, worker_match_cache
+    worker_trie = trie
+    worker_match_cache = None
+
+    if match_cache_size:
+        worker_match_cache = MatchCache(match_cache_size, match_cache_size_in_bytes)
+
+
+def split_file_into_byte_ranges(file_path: str, chunk_size_in_bytes: int) -> List[Tuple[int, int]]:
+    """
+    Splits the file into (start, end) byte ranges of roughly
+    chunk_size_in_bytes each. The ranges do not need to line up
+    with newlines, since each line belongs to the range it starts in.
+    """
+    if not isinstance(chunk_size_in_bytes, int):
+        raise TypeError
+
+    if chunk_size_in_bytes < 1:
+        raise ValueError("The chunk size must be at least one byte")
+
+    file_size: int = os.path.getsize(file_path)
+
+    return [
+        (start, min(start + chunk_size_in_bytes, file_size))
+        for start in range(0, file_size, chunk_size_in_bytes)
+    ]
+
+
+def read_urls_in_byte_range(file_path: str, start: int, end: int) -> Iterator[str]:
+    """
+    Yields every URL whose line starts inside of [start, end).
+    A line that began in the previous range gets skipped, and bytes
+    that are not valid UTF-8 are replaced (they cannot match anyway).
+    """
+    with open(file_path, 'rb') as urls_file:
+        if start > 0:
+            urls_file.seek(start - 1)
+            urls_file.readline()
+
+        while urls_file.tell() < end:
+            line: bytes = urls_file.readline()
+            if not line:
+                break
+            yield line.decode('utf-8', errors='replace').strip()
+
+
+def match_urls_in_byte_range(byte_range: tuple) -> List[Tuple[str, dict]]:
+    """
+    Finds the matching keywords for every URL in the byte range
+    using the worker's trie. Only keyword ids are sent back to the
+    parent process, which is cheaper than pickling the keywords.
+    """
+    file_path, start, end, record_runtimes = byte_range
+
+    return [
+        (url, build_keyword_match_data(
+            worker_trie, url, record_runtimes, use_keyword_ids=True,
+            match_cache=worker_match_cache))
+        for url in read_urls_in_byte_range(file_path, start, end)
+    ]
+
+
+def match_urls_file_in_parallel(
+        trie: Trie,
+        file_path: str,
+        number_of_workers: int = None,
+        chunk_size_in_bytes: int = PARALLEL_CHUNK_SIZE_IN_BYTES,
+        record_runtimes: bool = False,
+        match_cache_size: int = 0,
+        match_cache_size_in_bytes: int = None) -> Iterator[Tuple[str, dict]]:
+    """
+    Matches the URLs in the file with a pool of worker processes and
+    yields (url, match_data) pairs in the same order as the file.
+    """
+    matching_trie = trie
+    while isinstance(matching_trie, (InstrumentedTrie, KeywordPrefilter, UrlTokenMatcher)):
+        matching_trie = matching_trie.trie
+
+    if not isinstance(matching_trie, (Trie, CompactTrie, Dawg)):
+        raise TypeError
+
+    # Build the automaton links (or the DAWG) before the workers
+    # start, so that none of them has to build it on its own.
+    needs_automaton: bool = matching_trie.engine == AHO_CORASICK_ENGINE or isinstance(matching_trie, Dawg)
+    if needs_automaton and not matching_trie.is_automaton_built:
+        matching_trie.build_automaton()
+
+    byte_ranges: List[tuple] = [
+        (file_path, start, end, record_runtimes)
+        for start, end in split_file_into_byte_ranges(file_path, chunk_size_in_bytes)
+    ]
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+
+    with context.Pool(number_of_workers, initialize_worker,
+                      (trie, match_cache_size, match_cache_size_in_bytes)) as pool:
+        for chunk_results in pool.imap(match_urls_in_byte_range, byte_ranges):
+            for url, match_data in chunk_results:
+                yield (url, resolve_keyword_ids(trie, match_data))
@@ -0,0 +1,281 @@
+import csv
+from functools import partial
+import io
+import json
+import queue
+import sys
+import threading
+from typing import List, Tuple
+
+from substring_matcher.columnar_writer import ColumnarResultWriter
+from substring_matcher.constants import (
+    BACKGROUND_WRITER_BATCH_SIZE,
+    BACKGROUND_WRITER_MAX_PENDING_BATCHES,
+    RESULT_WRITE_BUFFER_SIZE_IN_BYTES
+)
+from substring_matcher.match_data import format_runtime
+
+# json.dumps builds a new encoder whenever it gets options, so the
+# compact encoder is built once and reused for every result
+COMPACT_JSON_ENCODER: json.JSONEncoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def format_url_keyword_match_data(url: str, matches: list, runtime_in_ns: int = None) -> str:
+    """
+    Formats the match data for one URL in the
+    human readable layout of the .txt results file.
+    """
+    runtime_line: str = ''
+    if runtime_in_ns is not None:
+        runtime_line = f"\nRuntime: {format_runtime(runtime_in_ns)}\n"
+
+    return (
+        "\n######################################\n"
+        f"URL: {url}\n"
+        "\nMATCHING KEYWORDS:\n"
+        f"{matches}\n"
+        f"{runtime_line}"
+        "\n######################################\n"
+        "\n-----------------------------------------------------------------\n\n"
+    )
+
+
+class ResultWriter:
+    """
+    Base class for writers that receive search results one URL
+    at a time and write them to a file straight away, so the
+    results never have to be held in memory. A file path of '-'
+    writes to stdout.
+
+    Each result is encoded on its own as soon as it arrives, and the
+    encoded text is collected until about buffer_size_in_bytes of it
+    is waiting, then written with a single call. Subclasses only
+    need to implement format_result (plus format_header and
+    format_footer when the format wraps the results).
+    """
+
+    def __init__(self, file_path: str, buffer_size_in_bytes: int = RESULT_WRITE_BUFFER_SIZE_IN_BYTES):
+        if not isinstance(file_path, str) or not isinstance(buffer_size_in_bytes, int):
+            raise TypeError
+
+        if buffer_size_in_bytes < 1:
+            raise ValueError("The buffer size must be at least one byte")
+
+        self.file_path: str = file_path
+        self.owns_results_file: bool = file_path != '-'
+        self.buffer_size_in_bytes: int = buffer_size_in_bytes
+        self.pending_output: List[str] = []
+        self.pending_size: int = 0
+        self.number_of_results: int = 0
+        self.is_closed: bool = False
+
+        if self.owns_results_file:
+            self.results_file = open(
+                file_path, 'w', encoding='utf-8', buffering=buffer_size_in_bytes, newline='')
+        else:
+            self.results_file = sys.stdout
+
+        self.write_text(self.format_header())
+
+    def format_header(self) -> str:
+        return ''
+
+    def format_result(self, url: str, match_data: dict) -> str:
+        raise NotImplementedError
+
+    def format_footer(self) -> str:
+        return ''
+
+    def write_result(self, url: str, match_data: dict):
+        self.write_text(self.format_result(url, match_data))
+        self.number_of_results += 1
+
+    def write_text(self, text: str):
+        self.pending_output.append(text)
+        self.pending_size += len(text)
+
+        if self.pending_size >= self.buffer_size_in_bytes:
+            self.flush()
+
+    def flush(self):
+        """Writes out everything that is waiting in one call."""
+        if self.pending_output:
+            self.results_file.write(''.join(self.pending_output))
+            self.pending_output = []
+            self.pending_size = 0
+
+    def close(self):
+        if self.is_closed:
+            return
+
+        self.is_closed = True
+        self.write_text(self.format_footer())
+        self.flush()
+
+        if self.owns_results_file:
+            self.results_file.close()
+        else:
+            self.results_file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class JsonLinesResultWriter(ResultWriter):
+    """Writes one JSON object per line for each URL."""
+
+    def format_result(self, url: str, match_data: dict) -> str:
+        return f"{json.dumps({'url': url, **match_data})}\n"
+
+
+class CompactJsonResultWriter(ResultWriter):
+    """
+    Writes a single JSON object that maps each URL to its match data,
+    the same layout as the keyword_search_results.json file, but
+    without indentation and one URL at a time.
+    """
+
+    def format_header(self) -> str:
+        return '{'
+
+    def format_result(self, url: str, match_data: dict) -> str:
+        separator: str = ',' if self.number_of_results else ''
+        return f"{separator}{COMPACT_JSON_ENCODER.encode(url)}:{COMPACT_JSON_ENCODER.encode(match_data)}"
+
+    def format_footer(self) -> str:
+        return '}\n'
+
+
+class CsvResultWriter(ResultWriter):
+    """
+    Writes a url,matches,runtime_ns row for each URL. The matching
+    keywords are joined with '|', which no keyword can contain.
+    """
+
+    def __init__(self, file_path: str, buffer_size_in_bytes: int = RESULT_WRITE_BUFFER_SIZE_IN_BYTES):
+        # rows are formatted into this buffer, then handed to write_text
+        self.row_buffer: io.StringIO = io.StringIO()
+        self.csv_writer = csv.writer(self.row_buffer, lineterminator='\n')
+        super().__init__(file_path, buffer_size_in_bytes)
+
+    def format_row(self, row: list) -> str:
+        self.row_buffer.seek(0)
+        self.row_buffer.truncate()
+        self.csv_writer.writerow(row)
+        return self.row_buffer.getvalue()
+
+    def format_header(self) -> str:
+        return self.format_row(['url', 'matches', 'runtime_ns'])
+
+    def format_result(self, url: str, match_data: dict) -> str:
+        return self.format_row([
+            url, '|'.join(match_data.get('matches', [])), match_data.get('runtime_ns', '')])
+
+
+class TextResultWriter(ResultWriter):
+    """Writes the human readable format used by the .txt results file."""
+
+    def format_result(self, url: str, match_data: dict) -> str:
+        return format_url_keyword_match_data(
+            url, match_data.get('matches'), match_data.get('runtime_ns'))
+
+
+class BackgroundResultWriter:
+    """
+    Hands the results to other result writers on a separate thread,
+    so that encoding and writing the output overlaps with matching.
+    Results are passed over in batches to keep the cost of the queue
+    low, and the queue is bounded, so matching waits for the writer
+    instead of piling up results in memory when the disk is slow.
+    Errors raised by the writers are raised again by close.
+    """
+
+    def __init__(self, result_writers: List[ResultWriter],
+                 batch_size: int = BACKGROUND_WRITER_BATCH_SIZE,
+                 max_pending_batches: int = BACKGROUND_WRITER_MAX_PENDING_BATCHES):
+        if not isinstance(batch_size, int) or not isinstance(max_pending_batches, int):
+            raise TypeError
+
+        if batch_size < 1 or max_pending_batches < 1:
+            raise ValueError("The batch size and the number of pending batches must be at least 1")
+
+        self.result_writers: List[ResultWriter] = list(result_writers)
+        self.batch_size: int = batch_size
+        self.current_batch: List[Tuple[str, dict]] = []
+        self.pending_batches: queue.Queue = queue.Queue(max_pending_batches)
+        self.writer_error: BaseException = None
+        self.is_closed: bool = False
+        self.writer_thread: threading.Thread = threading.Thread(
+            target=self.write_batches, name='result-writer', daemon=True)
+        self.writer_thread.start()
+
+    def write_result(self, url: str, match_data: dict):
+        if self.writer_error is not None:
+            raise self.writer_error
+
+        self.current_batch.append((url, match_data))
+
+        if len(self.current_batch) >= self.batch_size:
+            self.pending_batches.put(self.current_batch)
+            self.current_batch = []
+
+    def write_batches(self):
+        while True:
+            batch = self.pending_batches.get()
+            if batch is None:
+                return
+
+            # keep draining after an error, so write_result never blocks on a full queue
+            if self.writer_error is not None:
+                continue
+
+            try:
+                for url, match_data in batch:
+                    for result_writer in self.result_writers:
+                        result_writer.write_result(url, match_data)
+            except BaseException as error:
+                self.writer_error = error
+
+    def close(self):
+        """Writes the remaining results, waits for the thread, then closes the writers."""
+        if self.is_closed:
+            return
+
+        self.is_closed = True
+
+        if self.current_batch:
+            self.pending_batches.put(self.current_batch)
+            self.current_batch = []
+
+        self.pending_batches.put(None)
+        self.writer_thread.join()
+
+        for result_writer in self.result_writers:
+            result_writer.close()
+
+        if self.writer_error is not None:
+            raise self.writer_error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# output formats that can be picked by name (e.g. from the command line)
+RESULT_WRITER_FORMATS: dict = {
+    'arrow': partial(ColumnarResultWriter, table_format='arrow', compression='zstd'),
+    'csv': CsvResultWriter,
+    'json': CompactJsonResultWriter,
+    'jsonl': JsonLinesResultWriter,
+    'parquet': partial(ColumnarResultWriter, table_format='parquet', compression='zstd'),
+    'text': TextResultWriter
+}
+
+# the formats that write every key of the match data, so they are
+# the only ones that can hold the spans and any_match results
+MATCH_DATA_FORMATS: list = ['json', 'jsonl']
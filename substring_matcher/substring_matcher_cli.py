@@ -16,27 +16,39 @@ from substring_matcher.utils.cli_messages import (
     display_reminder_for_exiting_the_application,
     display_search_completion_notification,
     display_search_results_summary,
-    display_url_keyword_match_data_in_file,
     display_waiting_message_while_building_trie,
     display_warning_to_request_more_keywords,
     display_warning_to_request_more_urls,
     display_waiting_message_during_keyword_matching,
     display_welcome_message
 )
-from substring_matcher.trie_builder import TrieBuilder
+from substring_matcher.byte_pipeline import match_binary_urls
+from substring_matcher.match_cache import MatchCache
+from substring_matcher.match_data import build_keyword_match_data, resolve_keyword_ids
+from substring_matcher.parallel_matcher import match_urls_file_in_parallel
+from substring_matcher.result_writers import (
+    CompactJsonResultWriter,
+    JsonLinesResultWriter,
+    ResultWriter,
+    TextResultWriter
+)
+from substring_matcher.trie_builder import VALID_KEYWORD_PATTERN, TrieBuilder
+from substring_matcher.trie_cache import TrieCache, fingerprint_keywords
 from substring_matcher.trie import Trie, TrieNode
 from substring_matcher.constants import (
     DEFAULT_KEYWORDS_FILE,
     DEFAULT_URLS_FILE,
+    PARALLEL_CHUNK_SIZE_IN_BYTES,
+    STREAMED_RESULTS_JSON_LINES_FILE,
+    STREAMED_RESULTS_TEXT_FILE,
+    SUBSTRING_MATCHER_DATA_PATH,
+    SUBSTRING_MATCHER_RESULTS_PATH,
     VALID_RESPONSES_FOR_NO,
     VALID_RESPONSES_FOR_YES
 )
-import datetime
-import json
-import re
 import os
 import sys
-from typing import Set
+from typing import BinaryIO, Callable, Iterable, List, Set, Tuple
 
 
 class SubstringMatcherCli:
@@ -45,9 +57,16 @@ class SubstringMatcherCli:
     interact with the Substring Matcher based on a set of choices.
     """
 
-    def __init__(self):
+    def __init__(self, *, record_runtimes: bool = False, match_cache: MatchCache = None,
+                 match_kind: str = None, any_match: bool = False):
         self.trie: Trie = None
+        self.record_runtimes: bool = record_runtimes
+        self.match_cache: MatchCache = match_cache
+        # see build_keyword_match_data (only used when streaming)
+        self.match_kind: str = match_kind
+        self.any_match: bool = any_match
         self.trie_builder: TrieBuilder = TrieBuilder()
+        self.trie_cache: TrieCache = TrieCache()
         self.user_input: str = ""
         self.keyword_input: str = ""
         self.url_input: str = ""
@@ -57,46 +76,58 @@ class SubstringMatcherCli:
         self.invalid_keywords: Set[str] = set()
 
     def start_cli(self):
-        """Welcomes the user and presents a menu."""
+        """
+        Runs the menus until the user exits. Each step returns the
+        step that comes after it instead of calling it, so the stack
+        stays at the same depth no matter how many rounds of searches
+        a session goes through.
+        """
+        next_step: Callable = self.welcome_user
+
+        while next_step is not None:
+            next_step = next_step()
+
+    def welcome_user(self) -> Callable:
+        """Welcomes the user and moves on to the keyword menu."""
         display_welcome_message()
         user_input = input("Press the 'Enter' or 'Return' key to continue.")
 
+        return self.present_keyword_options
+
+    def present_keyword_options(self) -> Callable:
         display_menu_options_for_keyword_source()
         self.request_user_input()
-        self.handle_response_to_keyword_options()
+        return self.handle_response_to_keyword_options
 
     def request_user_input(self):
         """Requests input from the user."""
         display_reminder_for_exiting_the_application()
         self.user_input = input("\nPlease enter your choice: ")
 
-    def handle_response_to_keyword_options(self):
+    def handle_response_to_keyword_options(self) -> Callable:
         """
         Handles what to do when a user provides a
         choice for the keyword options menu.
         """
         if self.user_input == '1':
             display_waiting_message_while_building_trie()
-            self.trie_builder.file_name = DEFAULT_KEYWORDS_FILE
-            self.trie_builder.user_keywords = self.keywords
-            self.trie, self.invalid_keywords = self.trie_builder.build_trie_from_file()
-            self.trie_builder.invalid_keywords = set()
+            self.trie, self.invalid_keywords = self.build_or_reuse_trie(
+                resource_path(f"{SUBSTRING_MATCHER_DATA_PATH}/{DEFAULT_KEYWORDS_FILE}"))
             self.handle_displaying_invalid_keywords_message()
             display_ready_message_for_finding_keywords_in_url()
-            display_menu_options_for_url_source()
-            self.request_user_input()
-            self.handle_response_to_url_options()
+            return self.present_url_options
 
         elif self.user_input == '2':
-            self.request_keywords()
-            self.handle_keyword_input()
+            return self.ask_for_keywords
 
         else:
             self.check_if_user_wants_to_exit()
             display_incorrect_response_alert()
-            display_menu_options_for_keyword_source()
-            self.request_user_input()
-            self.handle_response_to_keyword_options()
+            return self.present_keyword_options
+
+    def ask_for_keywords(self) -> Callable:
+        self.request_keywords()
+        return self.handle_keyword_input
 
     def request_keywords(self):
         """
@@ -113,7 +144,7 @@ class SubstringMatcherCli:
         self.keywords = set()
         self.invalid_keywords = set()
 
-    def handle_keyword_input(self):
+    def handle_keyword_input(self) -> Callable:
         """
         Handles what happens when a user responds to the
         request for user defined keywords through the
@@ -122,11 +153,10 @@ class SubstringMatcherCli:
         if self.keyword_input.strip():
             self.create_keyword_lists_from_user_input()
             self.request_keyword_confirmation()
-            self.handle_keyword_confirmation()
+            return self.handle_keyword_confirmation
         else:
             display_warning_to_request_more_keywords()
-            self.request_keywords()
-            self.handle_keyword_input()
+            return self.ask_for_keywords
 
     def create_keyword_lists_from_user_input(self):
         for keyword in self.keyword_input.lower().split('|'):
@@ -143,7 +173,7 @@ class SubstringMatcherCli:
 
     @staticmethod
     def is_valid_keyword(keyword):
-        return bool(re.match("^[A-Za-z_-]*$", keyword))
+        return bool(VALID_KEYWORD_PATTERN.fullmatch(keyword))
 
     def request_keyword_confirmation(self) -> str:
         display_confirmation_message_for_keywords(
@@ -151,34 +181,62 @@ class SubstringMatcherCli:
         )
         self.user_input = input('\nContinue?: ')
 
-    def handle_keyword_confirmation(self):
+    def handle_keyword_confirmation(self) -> Callable:
         """
         Handles behavior pertaining to user
         responses to the request for keyword confirmation.
         """
         if self.user_input.lower() in VALID_RESPONSES_FOR_YES:
             display_waiting_message_while_building_trie()
-            self.trie_builder.user_keywords = self.keywords
-            self.trie = self.trie_builder.build_trie_from_list()[0]
-            self.trie_builder.invalid_keywords = set()
+            self.trie = self.build_or_reuse_trie()[0]
             self.handle_displaying_invalid_keywords_message()
             display_ready_message_for_finding_keywords_in_url()
-            display_menu_options_for_url_source()
-            self.request_user_input()
-            self.handle_response_to_url_options()
+            return self.present_url_options
 
         elif self.user_input.lower() in VALID_RESPONSES_FOR_NO:
-            self.request_keywords()
-            self.handle_keyword_input()
-            self.handle_keyword_confirmation()
+            return self.ask_for_keywords
 
         else:
             self.check_if_user_wants_to_exit()
             display_incorrect_response_alert()
-            self.handle_keyword_input()
-            self.handle_keyword_confirmation()
+            return self.handle_keyword_input
 
-    def handle_response_to_url_options(self):
+    def build_or_reuse_trie(self, keywords_file_path: str = None) -> tuple:
+        """
+        Returns the trie and invalid keywords for self.keywords, or for
+        the keywords file when a path is given. A trie built earlier in
+        the session with the same fingerprint is returned as is instead
+        of being built again.
+        """
+        fingerprint: str = fingerprint_keywords(
+            self.keywords, keywords_file_path,
+            engine=self.trie_builder.engine, backend=self.trie_builder.backend)
+        cached_trie = self.trie_cache.get(fingerprint)
+
+        if cached_trie is not None:
+            return cached_trie
+
+        # cached tries must never be added to, so every build gets a new one
+        self.trie_builder.trie = self.trie_builder.create_trie()
+        self.trie_builder.invalid_keywords = set()
+
+        if keywords_file_path is None:
+            self.trie_builder.user_keywords = self.keywords
+            trie, invalid_keywords = self.trie_builder.build_trie_from_list()
+        else:
+            trie, invalid_keywords = self.trie_builder.build_trie_from_file_path(keywords_file_path)
+
+        self.trie_builder.invalid_keywords = set()
+        self.trie_cache.put(fingerprint, trie, invalid_keywords)
+
+        return (trie, set(invalid_keywords))
+
+    def present_url_options(self) -> Callable:
+        display_menu_options_for_url_source()
+        self.request_user_input()
+        return self.handle_response_to_url_options
+
+    def handle_response_to_url_options(self) -> Callable:
         """
         Handles what to do when a user provides a
         choice for the URL options menu.
@@ -190,18 +248,19 @@ class SubstringMatcherCli:
             self.process_search_results_data_for_json_file()
             self.process_search_results_data_for_text_file()
             self.handle_displaying_search_results_summary()
-            self.handle_restarting_cli_on_completion()
+            return self.handle_restarting_cli_on_completion
 
         elif self.user_input == '2':
-            self.request_urls()
-            self.handle_url_input()
+            return self.ask_for_urls
 
         else:
             self.check_if_user_wants_to_exit()
             display_incorrect_response_alert()
-            display_menu_options_for_url_source()
-            self.request_user_input()
-            self.handle_response_to_url_options()
+            return self.present_url_options
+
+    def ask_for_urls(self) -> Callable:
+        self.request_urls()
+        return self.handle_url_input
 
     def request_urls(self):
         """Requests urls from the user through the command line."""
@@ -209,7 +268,7 @@ class SubstringMatcherCli:
         display_help_tips_for_url_input()
         self.url_input = input('Your URLs: ')
 
-    def handle_url_input(self):
+    def handle_url_input(self) -> Callable:
         """
         Handles what happens when a user responds to the
         request for user defined URLs through the
@@ -218,11 +277,10 @@ class SubstringMatcherCli:
         if self.url_input.strip():
             self.create_url_list()
             self.request_url_confirmation()
-            self.handle_url_confirmation()
+            return self.handle_url_confirmation
         else:
             display_warning_to_request_more_urls()
-            self.request_urls()
-            self.handle_url_input()
+            return self.ask_for_urls
 
     def create_url_list(self):
         """Creates a list of URLs from the user's input"""
@@ -237,7 +295,7 @@ class SubstringMatcherCli:
         display_confirmation_message_for_urls(self.urls)
         self.user_input = input('\nEnter yes or no (y/n): ')
 
-    def handle_url_confirmation(self):
+    def handle_url_confirmation(self) -> Callable:
         """
         Handles behavior pertaining to user
         responses to the request for URL confirmation.
@@ -249,18 +307,15 @@ class SubstringMatcherCli:
             self.process_search_results_data_for_json_file()
             self.process_search_results_data_for_text_file()
             self.handle_displaying_search_results_summary()
-            self.handle_restarting_cli_on_completion()
+            return self.handle_restarting_cli_on_completion
 
         elif self.user_input.lower() in VALID_RESPONSES_FOR_NO:
-            self.request_urls()
-            self.handle_url_input()
-            self.handle_url_confirmation()
+            return self.ask_for_urls
 
         else:
             self.check_if_user_wants_to_exit()
             display_incorrect_response_alert()
-            self.handle_url_input()
-            self.handle_url_confirmation()
+            return self.handle_url_input
 
     def reset_urls_and_url_input(self):
         """Resets the values for the url and its input"""
@@ -285,6 +340,98 @@ class SubstringMatcherCli:
                 self.current_url = url
                 self.add_keyword_match_data_to_search_results(url.strip())
 
+    def search_urls_file_in_parallel(
+            self,
+            file_name: str = DEFAULT_URLS_FILE,
+            number_of_workers: int = None,
+            chunk_size_in_bytes: int = PARALLEL_CHUNK_SIZE_IN_BYTES):
+        """
+        Splits a file containing URLs into byte ranges and finds the
+        matching keywords with a pool of worker processes. The results
+        are added to self.keyword_search_results in file order.
+        """
+        if not isinstance(file_name, str):
+            raise TypeError
+
+        urls_file_path: str = resource_path(
+            f"substring_matcher/data/{file_name}")
+
+        for url, match_data in match_urls_file_in_parallel(
+                self.trie, urls_file_path, number_of_workers, chunk_size_in_bytes,
+                self.record_runtimes):
+            self.keyword_search_results[url] = match_data
+
+    def stream_urls_file_for_matching_keywords(
+            self, file_name: str, result_writers: List[ResultWriter]) -> Tuple[int, int]:
+        """
+        Reads a file containing URLs one line at a time and hands the
+        match data for each URL to the result writers right away.
+        Nothing is kept in self.keyword_search_results, so memory use
+        stays flat no matter how large the file is. Returns the total
+        number of URLs and the number of URLs with matches.
+        """
+        if not isinstance(file_name, str):
+            raise TypeError
+
+        urls_file_path: str = resource_path(
+            f"substring_matcher/data/{file_name}")
+
+        with open(urls_file_path, 'r', encoding='utf-8') as urls_file:
+            return self.stream_urls_for_matching_keywords(urls_file, result_writers)
+
+    def stream_urls_for_matching_keywords(
+            self, urls: Iterable[str], result_writers: List[ResultWriter]) -> Tuple[int, int]:
+        """
+        Matches the URLs as they are read from any iterable (e.g. an
+        open file or sys.stdin) and writes each result right away.
+        Returns the total number of URLs and the number with matches.
+        """
+        total_number_of_urls: int = 0
+        number_of_urls_with_matches: int = 0
+
+        for url in urls:
+            url = url.strip()
+            match_data: dict = build_keyword_match_data(
+                self.trie, url, self.record_runtimes, use_keyword_ids=True,
+                match_cache=self.match_cache, match_kind=self.match_kind, any_match=self.any_match)
+
+            total_number_of_urls += 1
+            if match_data.get('keyword_ids') or match_data.get('any_match'):
+                number_of_urls_with_matches += 1
+
+            # keywords are only looked up once the result is written
+            match_data = resolve_keyword_ids(self.trie, match_data)
+
+            for result_writer in result_writers:
+                result_writer.write_result(url, match_data)
+
+        return (total_number_of_urls, number_of_urls_with_matches)
+
+    def stream_binary_urls_for_matching_keywords(
+            self, binary_file: BinaryIO, result_writers: List[ResultWriter]) -> Tuple[int, int]:
+        """
+        Works like stream_urls_for_matching_keywords, but for a file
+        opened in binary mode. The file is read in large blocks and
+        each block is matched as raw bytes (see byte_pipeline), so
+        the URLs are not decoded or lowercased to be searched. Case
+        is only folded for ASCII letters, and runtimes are not
+        recorded, since the URLs in a block are matched together.
+        """
+        total_number_of_urls: int = 0
+        number_of_urls_with_matches: int = 0
+
+        for url, keyword_ids in match_binary_urls(self.trie, binary_file):
+            total_number_of_urls += 1
+            if keyword_ids:
+                number_of_urls_with_matches += 1
+
+            match_data: dict = resolve_keyword_ids(self.trie, {'keyword_ids': keyword_ids})
+
+            for result_writer in result_writers:
+                result_writer.write_result(url, match_data)
+
+        return (total_number_of_urls, number_of_urls_with_matches)
+
     def search_url_list_for_matching_keywords(self) -> dict:
         """
         Iterates through a list of URLs to find matching keywords.
@@ -302,55 +449,43 @@ class SubstringMatcherCli:
         self.keyword_search_results dictionary for the
         specified URL.
         """
-        self.keyword_search_results[url]: dict = {}
-        self.keyword_search_results[url]['matches']: list = list(self.trie.find_matching_substrings(
-            url))
-
-        self.keyword_search_results[url][
-            'runtime']: str = f"{self.calculate_keyword_search_runtime(url)} milliseconds"
+        self.keyword_search_results[url]: dict = self.build_keyword_match_data(url)
 
-    def calculate_keyword_search_runtime(self, url: str):
-        start_time = datetime.datetime.now()
-        self.trie.find_matching_substrings(url)
-        end_time = datetime.datetime.now()
-        runtime: int = (end_time - start_time).total_seconds() * 1000
-
-        return runtime
+    def build_keyword_match_data(self, url: str) -> dict:
+        """
+        Builds the dictionary of matching keywords that gets recorded
+        for the specified URL. The search only runs once, and it is
+        only timed when self.record_runtimes is True. It is skipped
+        altogether when self.match_cache has the URL already.
+        """
+        return build_keyword_match_data(
+            self.trie, url, self.record_runtimes, match_cache=self.match_cache)
 
     def process_search_results_data_for_json_file(self):
         search_results_json_path: str = resource_path(
             "substring_matcher/results/keyword_search_results.json")
 
-        if os.path.exists(search_results_json_path):
-            os.remove(search_results_json_path)
+        os.makedirs(os.path.dirname(search_results_json_path), exist_ok=True)
 
-        with open(search_results_json_path, 'w') as json_file:
-            self.write_url_keyword_match_data_to_file_as_json(json_file)
-
-    def write_url_keyword_match_data_to_file_as_json(self, json_file):
-        json_data = json.dumps(self.keyword_search_results, indent=3)
-        json_file.write(json_data)
+        with CompactJsonResultWriter(search_results_json_path) as json_writer:
+            self.write_search_results(json_writer)
 
     def process_search_results_data_for_text_file(self):
         search_results_text_path: str = resource_path(
             "substring_matcher/results/keyword_search_results.txt")
 
-        if os.path.exists(search_results_text_path):
-            os.remove(search_results_text_path)
-
-        with open(search_results_text_path, 'w') as text_file:
-            self.write_url_keyword_match_data_to_file_as_text(text_file)
+        os.makedirs(os.path.dirname(search_results_text_path), exist_ok=True)
 
-    def write_url_keyword_match_data_to_file_as_text(self, text_file):
-        original_stdout = sys.stdout
-        sys.stdout = text_file
+        with TextResultWriter(search_results_text_path) as text_writer:
+            self.write_search_results(text_writer)
 
-        for url, data in self.keyword_search_results.items():
-            display_url_keyword_match_data_in_file(
-                url, data.get('matches'), data.get('runtime')
-            )
-
-        sys.stdout = original_stdout
+    def write_search_results(self, result_writer: ResultWriter):
+        """
+        Hands every result in self.keyword_search_results to the
+        writer, which encodes and buffers them one URL at a time.
+        """
+        for url, match_data in self.keyword_search_results.items():
+            result_writer.write_result(url, match_data)
 
     def handle_displaying_search_results_summary(self):
         """
@@ -377,7 +512,7 @@ class SubstringMatcherCli:
         else:
             print('All keywords are valid!')
 
-    def handle_restarting_cli_on_completion(self):
+    def handle_restarting_cli_on_completion(self) -> Callable:
         """
         Handles what happens once the program finishes
         running (i.e. searching URLs for matches).
@@ -385,21 +520,19 @@ class SubstringMatcherCli:
         self.reset_values()
         display_options_for_starting_over()
         self.request_user_input()
-        self.handle_user_response_for_starting_over()
+        return self.handle_user_response_for_starting_over
 
-    def handle_user_response_for_starting_over(self):
+    def handle_user_response_for_starting_over(self) -> Callable:
         if self.user_input == '1':
-            self.start_cli()
+            return self.welcome_user
 
         elif self.user_input == '2':
-            display_menu_options_for_url_source()
-            self.request_user_input()
-            self.handle_response_to_url_options()
+            return self.present_url_options
 
         else:
             self.check_if_user_wants_to_exit()
             display_incorrect_response_alert()
-            self.handle_restarting_cli_on_completion()
+            return self.handle_restarting_cli_on_completion
 
     def check_if_user_wants_to_exit(self):
         """
@@ -411,7 +544,11 @@ class SubstringMatcherCli:
             sys.exit()
 
     def reset_values(self):
-        """Resets all values to their default state."""
+        """
+        Resets all values to their default state. self.trie and the
+        trie cache are kept, so the next round can search more URLs
+        (or reuse a trie for keywords it has seen) without a rebuild.
+        """
         self.user_input = ""
         self.keyword_input = ""
         self.url_input = ""
@@ -421,9 +558,38 @@ class SubstringMatcherCli:
         self.keyword_search_results = {}
         self.trie_builder.user_keywords = set()
         self.trie_builder.invalid_keywords = set()
-        self.trie_builder.trie = Trie()
+        self.trie_builder.trie = self.trie_builder.create_trie()
+
+
+def stream_search_results_to_files(
+        keywords_file_name: str = DEFAULT_KEYWORDS_FILE,
+        urls_file_name: str = DEFAULT_URLS_FILE,
+        record_runtimes: bool = False) -> Tuple[int, int]:
+    """
+    Runs a search without any prompts. The URLs are read lazily and
+    each result is written to the JSON Lines and text files in the
+    results directory as soon as it is found.
+    """
+    new_cli_instance = SubstringMatcherCli(record_runtimes=record_runtimes)
+    new_cli_instance.trie_builder.file_name = keywords_file_name
+    new_cli_instance.trie, new_cli_instance.invalid_keywords = (
+        new_cli_instance.trie_builder.build_trie_from_file())
+
+    results_path: str = resource_path(SUBSTRING_MATCHER_RESULTS_PATH)
+    os.makedirs(results_path, exist_ok=True)
+
+    with JsonLinesResultWriter(os.path.join(results_path, STREAMED_RESULTS_JSON_LINES_FILE)) as json_lines_writer, \
+            TextResultWriter(os.path.join(results_path, STREAMED_RESULTS_TEXT_FILE)) as text_writer:
+        return new_cli_instance.stream_urls_file_for_matching_keywords(
+            urls_file_name, [json_lines_writer, text_writer])
 
 
 def main():
-    new_cli_instance = SubstringMatcherCli()
+    new_cli_instance = SubstringMatcherCli(record_runtimes=True)
     new_cli_instance.start_cli()
+
+
+def main_streaming():
+    total_number_of_urls, number_of_urls_with_matches = stream_search_results_to_files()
+    print(f"Total number of urls: {total_number_of_urls}")
+    print(f"URLs with Matching Keywords: {number_of_urls_with_matches}")
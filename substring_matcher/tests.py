@@ -1,7 +1,82 @@
+import asyncio
+import contextlib
+import csv
+import io
+import json
+import os
+import random
 import sys
+import tempfile
+import threading
 import unittest
+from unittest import mock
+from substring_matcher.automaton_snapshot import (
+    AutomatonSnapshot,
+    compile_keywords_file,
+    compile_keywords_file_path,
+    write_automaton_snapshot
+)
+from substring_matcher.benchmark import (
+    benchmark_prefilter,
+    calculate_percentile,
+    generate_keywords,
+    generate_url,
+    summarize_runtimes
+)
+from substring_matcher.byte_pipeline import match_binary_urls, read_line_aligned_chunks
+from substring_matcher.columnar_writer import ColumnarResultWriter, pyarrow, read_columnar_table
+from substring_matcher.compact_trie import CompactTrie
+from substring_matcher.constants import (
+    AHO_CORASICK_ENGINE,
+    ALL_MATCHES,
+    COMPACT_BACKEND,
+    DAWG_BACKEND,
+    NODE_BACKEND,
+    ELEVEN_THOUSAND_CHARS_URL,
+    EXIT_CODE_ERROR,
+    EXIT_CODE_MATCHES_FOUND,
+    EXIT_CODE_NO_MATCHES,
+    EXIT_CODE_SUCCESS,
+    LEFTMOST_FIRST_MATCHES,
+    LEFTMOST_LONGEST_MATCHES,
+    MATCHING_ENGINES,
+    THREE_HUNDRED_CHARS_URL,
+    TRIE_BACKENDS,
+    TRIE_WALK_ENGINE
+)
+from substring_matcher.dawg import Dawg
+from substring_matcher.headless_cli import main as headless_main, parse_arguments
+from substring_matcher.instrumentation import (
+    Histogram,
+    InstrumentedResultWriter,
+    InstrumentedTrie,
+    Instrumentation,
+    capture_run
+)
+from substring_matcher.keyword_prefilter import KeywordPrefilter, compile_keyword_prefix_pattern
+from substring_matcher.match_cache import MatchCache
+from substring_matcher.matching_server import MatchingServer, build_warm_trie
+from substring_matcher.match_data import build_keyword_match_data, resolve_keyword_ids
+from substring_matcher.match_spans import select_matching_spans
+from substring_matcher.parallel_matcher import (
+    match_urls_file_in_parallel,
+    read_urls_in_byte_range,
+    split_file_into_byte_ranges
+)
+from substring_matcher.result_writers import (
+    BackgroundResultWriter,
+    CompactJsonResultWriter,
+    CsvResultWriter,
+    JsonLinesResultWriter,
+    ResultWriter,
+    TextResultWriter,
+    format_url_keyword_match_data
+)
 from substring_matcher.trie import Trie, TrieNode
-from substring_matcher.trie_builder import TrieBuilder
+from substring_matcher.trie_generations import TrieGenerations
+from substring_matcher.trie_builder import TrieBuilder, count_partition_nodes
+from substring_matcher.trie_cache import TrieCache, fingerprint_keywords
+from substring_matcher.url_tokenizer import UrlTokenMatcher, find_keyword_runs, split_url_into_components
 from substring_matcher.substring_matcher_cli import SubstringMatcherCli
 
 
@@ -124,6 +199,621 @@ class TestTrie(unittest.TestCase):
              'super_meow', 'woman', 'womanly', 'womanlyon'})
 
 
+class TestAhoCorasickEngine(unittest.TestCase):
+    """
+    Checks that the Aho-Corasick engine returns the same
+    matches as the original trie walk.
+    """
+    keywords_file_name = 'test_keywords.txt'
+
+    def build_tries_from_keywords(self, keywords):
+        trie_walk = Trie(engine=TRIE_WALK_ENGINE)
+        automaton = Trie(engine=AHO_CORASICK_ENGINE)
+
+        for keyword in keywords:
+            trie_walk.add_keyword(keyword)
+            automaton.add_keyword(keyword)
+
+        return (trie_walk, automaton)
+
+    def build_tries_from_file(self):
+        trie_walk = TrieBuilder(engine=TRIE_WALK_ENGINE)
+        trie_walk.file_name = self.keywords_file_name
+        automaton = TrieBuilder(engine=AHO_CORASICK_ENGINE)
+        automaton.file_name = self.keywords_file_name
+
+        return (trie_walk.build_trie_from_file()[0], automaton.build_trie_from_file()[0])
+
+    def test_create_fail(self):
+        self.assertRaises(ValueError, Trie, engine='regex')
+        self.assertRaises(TypeError, Trie, engine=2)
+
+    def test_matches_trie_walk_for_test_urls(self):
+        trie_walk, automaton = self.build_tries_from_file()
+
+        with open('substring_matcher/data/test_urls.txt', 'r', encoding='utf-8') as urls_file:
+            for url in urls_file:
+                self.assertEqual(
+                    automaton.find_matching_substrings(url.strip()),
+                    trie_walk.find_matching_substrings(url.strip())
+                )
+
+    def test_matches_trie_walk_for_long_urls(self):
+        trie_walk, automaton = self.build_tries_from_file()
+
+        for url in [THREE_HUNDRED_CHARS_URL, ELEVEN_THOUSAND_CHARS_URL]:
+            self.assertEqual(
+                automaton.find_matching_substrings(url),
+                trie_walk.find_matching_substrings(url)
+            )
+
+    def test_matches_trie_walk_for_overlapping_keywords(self):
+        trie_walk, automaton = self.build_tries_from_keywords(
+            {'a', 'ab', 'bab', 'bc', 'bca', 'c', 'caa', 'he', 'she', 'his', 'hers'})
+
+        for url in ['abccab', 'ushers', 'aaaa', 'bcbcbca', 'hishershe', 'xyz', '']:
+            self.assertEqual(
+                automaton.find_matching_substrings(url),
+                trie_walk.find_matching_substrings(url)
+            )
+
+    def test_matches_trie_walk_for_random_inputs(self):
+        generator = random.Random(1120)
+
+        for _ in range(200):
+            keywords = {
+                ''.join(generator.choice('ab-_') for _ in range(generator.randint(1, 5)))
+                for _ in range(generator.randint(1, 15))
+            }
+            trie_walk, automaton = self.build_tries_from_keywords(keywords)
+            url = ''.join(generator.choice('aAbB-_.') for _ in range(generator.randint(0, 60)))
+
+            self.assertEqual(
+                automaton.find_matching_substrings(url),
+                trie_walk.find_matching_substrings(url)
+            )
+
+    def test_rebuilds_links_after_new_keywords(self):
+        automaton = Trie(engine=AHO_CORASICK_ENGINE)
+        automaton.add_keyword('man')
+        self.assertEqual(automaton.find_matching_substrings('woman'), {'man'})
+        self.assertTrue(automaton.is_automaton_built)
+
+        automaton.add_keyword('woman')
+        self.assertFalse(automaton.is_automaton_built)
+        self.assertEqual(automaton.find_matching_substrings('woman'), {'man', 'woman'})
+
+
+class TestKeywordRemoval(unittest.TestCase):
+
+    def test_remove_keyword(self):
+        for engine in [TRIE_WALK_ENGINE, AHO_CORASICK_ENGINE]:
+            trie = Trie(engine=engine)
+            for keyword in ['man', 'manage', 'manager', 'woman', 'arm']:
+                trie.add_keyword(keyword)
+            self.assertEqual(trie.find_matching_substrings('womanager'),
+                             {'man', 'manage', 'manager', 'woman'})
+
+            self.assertTrue(trie.remove_keyword('Manage'))
+            self.assertFalse(trie.remove_keyword('manage'))
+            self.assertFalse(trie.remove_keyword('mana'))
+            self.assertFalse(trie.remove_keyword('zebra'))
+            self.assertRaises(TypeError, trie.remove_keyword, 2)
+
+            self.assertTrue(trie.does_word_exist('manager'))
+            self.assertFalse(trie.does_word_exist('manage'))
+            self.assertEqual(trie.find_matching_substrings('womanager'), {'man', 'manager', 'woman'})
+            self.assertEqual(trie.keywords, ['man', None, 'manager', 'woman', 'arm'])
+
+            self.assertTrue(trie.remove_keyword('manager'))
+            self.assertEqual(set(trie.root.children['m'].children['a'].children['n'].children), set())
+            self.assertEqual(trie.find_matching_substrings('womanager'), {'man', 'woman'})
+            self.assertEqual(
+                {trie.keywords[keyword_id] for keyword_id in trie.match_many(['womanager'])[1]},
+                {'man', 'woman'})
+
+            trie.add_keyword('manage')
+            self.assertEqual(trie.root.children['m'].children['a'].children['n'].children['a']
+                             .children['g'].children['e'].keyword_id, 5)
+
+    def test_copy(self):
+        trie = Trie(engine=AHO_CORASICK_ENGINE)
+        for keyword in ['he', 'she', 'his', 'hers']:
+            trie.add_keyword(keyword)
+        trie.find_matching_substrings('ushers')
+
+        trie_copy = trie.copy()
+        self.assertFalse(trie_copy.is_automaton_built)
+        self.assertEqual(trie_copy.keywords, trie.keywords)
+        self.assertEqual(trie_copy.find_matching_substrings('ushers'), {'he', 'she', 'hers'})
+
+        trie_copy.remove_keyword('she')
+        self.assertEqual(trie.find_matching_substrings('ushers'), {'he', 'she', 'hers'})
+
+    def test_trie_generations(self):
+        trie = Trie(engine=AHO_CORASICK_ENGINE)
+        trie.add_keyword('man')
+        generations = TrieGenerations(trie)
+        self.assertTrue(trie.is_automaton_built)
+        self.assertIsNotNone(trie.transition_table)
+
+        old_trie = generations.trie
+        self.assertEqual(generations.update_keywords(['woman', 'arm'], ['man']), 1)
+        self.assertTrue(generations.trie.is_automaton_built)
+        self.assertIsNotNone(generations.trie.transition_table)
+        self.assertIsNot(generations.trie, old_trie)
+
+        self.assertEqual(old_trie.find_matching_substrings('woman-army'), {'man'})
+        self.assertEqual(generations.find_matching_substrings('woman-army'), {'woman', 'arm'})
+        self.assertEqual(
+            {generations.get_keyword(keyword_id)
+             for keyword_id in generations.find_matching_keyword_ids('woman-army')},
+            {'woman', 'arm'})
+
+        self.assertEqual(generations.replace_trie(Trie()), 2)
+        self.assertIsNotNone(generations.trie.transition_table)
+        self.assertEqual(generations.find_matching_substrings('woman-army'), set())
+        self.assertRaises(TypeError, TrieGenerations, CompactTrie())
+
+    @staticmethod
+    def match_many_keywords(trie: Trie, urls: list) -> list:
+        url_indexes, keyword_ids = trie.match_many(urls)
+        return sorted(
+            (url_index, trie.get_keyword(keyword_id)) for url_index, keyword_id in zip(url_indexes, keyword_ids))
+
+    def test_update_keywords_patches_links(self):
+        random_generator = random.Random(3)
+        keywords = {''.join(random_generator.choice('abc') for _ in range(random_generator.randint(1, 6)))
+                    for _ in range(40)}
+        urls = [''.join(random_generator.choice('abcA-') for _ in range(30)) for _ in range(20)]
+        trie = Trie(engine=AHO_CORASICK_ENGINE)
+        for keyword in sorted(keywords):
+            trie.add_keyword(keyword)
+        trie.build_automaton()
+        transition_table = trie.get_transition_table()
+
+        for _ in range(10):
+            keywords_to_add = [''.join(random_generator.choice('abc') for _ in range(random_generator.randint(1, 6)))
+                               for _ in range(3)]
+            keywords_to_remove = random_generator.sample(sorted(keywords), 3)
+            trie.update_keywords(keywords_to_add, keywords_to_remove)
+            keywords = (keywords - set(keywords_to_remove)) | set(keywords_to_add)
+
+            self.assertTrue(trie.is_automaton_built)
+            self.assertIs(trie.transition_table, transition_table)
+            self.assertEqual({keyword for keyword in trie.keywords if keyword is not None}, keywords)
+
+            fresh_trie = Trie(engine=AHO_CORASICK_ENGINE)
+            for keyword in keywords:
+                fresh_trie.add_keyword(keyword)
+            for url in urls:
+                self.assertEqual(trie.find_matching_substrings(url), fresh_trie.find_matching_substrings(url))
+            self.assertEqual(self.match_many_keywords(trie, urls), self.match_many_keywords(fresh_trie, urls))
+
+        # a new byte needs a new column in every row, so the table is dropped
+        trie.update_keywords(['abd'])
+        self.assertIsNone(trie.transition_table)
+        self.assertEqual(trie.find_matching_substrings('xabdx'), {'abd'} | ({'a', 'b', 'ab'} & keywords))
+
+    def test_trie_generations_wait_for_searches(self):
+        generations = TrieGenerations(Trie())
+        generations.update_keywords(['man'])
+
+        with generations.searching() as trie:
+            self.assertEqual(generations.update_keywords(['arm']), 2)
+            self.assertEqual(trie.find_matching_substrings('woman-army'), {'man'})
+
+            # the next update goes to the Trie this search still runs against
+            update_thread = threading.Thread(target=generations.update_keywords, args=(['woman'],))
+            update_thread.start()
+            update_thread.join(0.1)
+            self.assertTrue(update_thread.is_alive())
+            self.assertEqual(trie.find_matching_substrings('woman-army'), {'man'})
+
+        update_thread.join()
+        self.assertEqual(generations.generation, 3)
+        self.assertIs(generations.trie, trie)
+        self.assertEqual(generations.find_matching_substrings('woman-army'), {'man', 'arm', 'woman'})
+
+
+class TestMatchMany(unittest.TestCase):
+
+    def group_matches(self, trie, urls):
+        url_indexes, keyword_ids = trie.match_many(urls)
+        grouped_matches = [set() for _ in urls]
+
+        for url_index, keyword_id in zip(url_indexes, keyword_ids):
+            self.assertNotIn(trie.keywords[keyword_id], grouped_matches[url_index])
+            grouped_matches[url_index].add(trie.keywords[keyword_id])
+
+        return grouped_matches
+
+    def test_keyword_ids(self):
+        trie = Trie()
+        for keyword in ['Man', 'woman', 'man']:
+            trie.add_keyword(keyword)
+
+        self.assertEqual(trie.keywords, ['man', 'woman'])
+        self.assertEqual(trie.root.children['m'].children['a'].children['n'].keyword_id, 0)
+        self.assertEqual(len(trie.match_many([])[0]), 0)
+        self.assertRaises(TypeError, trie.match_many, ['woman', 2])
+
+    def test_matches_find_matching_substrings(self):
+        trie_builder = TrieBuilder()
+        trie_builder.file_name = 'test_keywords.txt'
+        trie = trie_builder.build_trie_from_file()[0]
+
+        with open('substring_matcher/data/test_urls.txt', 'r', encoding='utf-8') as urls_file:
+            urls = [url.strip() for url in urls_file]
+        urls += [TestTrie.invalid_url, TestTrie.mixcase_url, THREE_HUNDRED_CHARS_URL, '']
+
+        self.assertEqual(
+            self.group_matches(trie, urls),
+            [set(trie.find_matching_substrings(url)) for url in urls]
+        )
+
+    def test_matches_find_matching_substrings_for_random_inputs(self):
+        generator = random.Random(808)
+
+        for _ in range(100):
+            trie = Trie()
+            for _ in range(generator.randint(1, 15)):
+                trie.add_keyword(
+                    ''.join(generator.choice('ab-_') for _ in range(generator.randint(1, 5))))
+
+            urls = [
+                ''.join(generator.choice('aAbB-_.') for _ in range(generator.randint(0, 30)))
+                for _ in range(generator.randint(0, 8))
+            ]
+            self.assertEqual(
+                self.group_matches(trie, urls),
+                [set(trie.find_matching_substrings(url)) for url in urls]
+            )
+
+
+class TestCompactTrie(unittest.TestCase):
+
+    def build_tries_from_keywords(self, keywords, engine=TRIE_WALK_ENGINE):
+        trie = Trie()
+        compact_trie = CompactTrie(engine=engine)
+
+        for keyword in keywords:
+            trie.add_keyword(keyword)
+            compact_trie.add_keyword(keyword)
+
+        return (trie, compact_trie)
+
+    def test_create_fail(self):
+        self.assertRaises(TypeError, CompactTrie, 'a')
+        self.assertRaises(ValueError, CompactTrie, engine='regex')
+        self.assertRaises(ValueError, TrieBuilder, backend='dicts')
+
+    def test_add_keyword_and_does_word_exist(self):
+        compact_trie = CompactTrie()
+        compact_trie.add_keyword('hello')
+        compact_trie.add_keyword('help')
+
+        self.assertEqual(compact_trie.node_count, 7)
+        self.assertTrue(compact_trie.does_word_exist(''))
+        self.assertTrue(compact_trie.does_word_exist('hello'))
+        self.assertTrue(compact_trie.does_word_exist('help'))
+        self.assertFalse(compact_trie.does_word_exist('hel'))
+        self.assertFalse(compact_trie.does_word_exist('zebra'))
+        self.assertRaises(TypeError, compact_trie.add_keyword, 2)
+        self.assertRaises(TypeError, compact_trie.does_word_exist, 2)
+
+    def test_matches_node_trie_from_file(self):
+        node_trie_builder = TrieBuilder()
+        node_trie_builder.file_name = 'test_keywords.txt'
+        trie = node_trie_builder.build_trie_from_file()[0]
+
+        for engine in [TRIE_WALK_ENGINE, AHO_CORASICK_ENGINE]:
+            trie_builder = TrieBuilder(engine=engine, backend=COMPACT_BACKEND)
+            trie_builder.file_name = 'test_keywords.txt'
+            compact_trie = trie_builder.build_trie_from_file()[0]
+            self.assertTrue(isinstance(compact_trie, CompactTrie))
+
+            for url in [TestTrie.invalid_url, TestTrie.mixcase_url, THREE_HUNDRED_CHARS_URL]:
+                self.assertEqual(
+                    compact_trie.find_matching_substrings(url),
+                    trie.find_matching_substrings(url)
+                )
+
+    def test_matches_node_trie_for_random_inputs(self):
+        generator = random.Random(2204)
+
+        for _ in range(200):
+            keywords = {
+                ''.join(generator.choice('ab-_') for _ in range(generator.randint(1, 5)))
+                for _ in range(generator.randint(1, 15))
+            }
+            url = ''.join(generator.choice('aAbB-_.') for _ in range(generator.randint(0, 60)))
+
+            for engine in [TRIE_WALK_ENGINE, AHO_CORASICK_ENGINE]:
+                trie, compact_trie = self.build_tries_from_keywords(keywords, engine)
+                self.assertEqual(
+                    compact_trie.find_matching_substrings(url),
+                    trie.find_matching_substrings(url)
+                )
+
+    def test_memory_usage_per_node(self):
+        trie, compact_trie = self.build_tries_from_keywords(
+            ['manage', 'manager', 'management'], AHO_CORASICK_ENGINE)
+        compact_trie.find_matching_substrings('management')
+
+        self.assertEqual(compact_trie.node_count, 12)
+        self.assertTrue(0 < compact_trie.memory_usage_per_node() < 64)
+
+
+class TestDawg(unittest.TestCase):
+
+    def build_tries_from_keywords(self, keywords):
+        trie = Trie()
+        dawg = Dawg()
+
+        for keyword in keywords:
+            trie.add_keyword(keyword)
+            dawg.add_keyword(keyword)
+
+        return (trie, dawg)
+
+    def test_create_fail(self):
+        self.assertRaises(TypeError, Dawg, 'a')
+        self.assertRaises(ValueError, Dawg, engine=AHO_CORASICK_ENGINE)
+        self.assertRaises(ValueError, TrieBuilder, engine=AHO_CORASICK_ENGINE, backend=DAWG_BACKEND)
+
+    def test_shared_suffixes_are_merged(self):
+        keywords = [f"{place}-{stay}" for place in ['lake', 'river', 'forest', 'beach']
+                    for stay in ['cabins', 'lodges', 'cottages']]
+        dawg = Dawg()
+        dawg.add_sorted_keywords(sorted(keywords))
+        compact_trie = CompactTrie()
+        compact_trie.add_sorted_keywords(sorted(keywords))
+
+        # "-cabins", "-lodges" and "-cottages" are stored once, not once per place
+        self.assertEqual(dawg.node_count, 32)
+        self.assertLess(dawg.node_count * 3, compact_trie.node_count)
+        self.assertLess(dawg.memory_usage_in_bytes() * 3, compact_trie.memory_usage_in_bytes())
+
+    def test_keyword_ids_follow_sorted_order(self):
+        trie, dawg = self.build_tries_from_keywords(['woman', 'arm', 'man', 'armada', 'an'])
+
+        self.assertEqual(list(dawg.iterate_keywords()), ['an', 'arm', 'armada', 'man', 'woman'])
+        self.assertEqual(dawg.keyword_count, 5)
+        self.assertEqual(dawg.find_matching_keyword_ids('womanarm'), {0, 1, 3, 4})
+        self.assertEqual(dawg.find_matching_substrings('womanarm'), {'an', 'arm', 'man', 'woman'})
+        self.assertRaises(IndexError, dawg.get_keyword, 5)
+
+    def test_add_keyword_after_searching(self):
+        dawg = Dawg()
+        dawg.add_keyword('Cabin')
+        self.assertEqual(dawg.find_matching_substrings('log-cabins'), {'cabin'})
+        version = dawg.keyword_set_version
+
+        dawg.add_keyword('cabin')
+        self.assertEqual(dawg.keyword_set_version, version)
+
+        dawg.add_keyword('log')
+        self.assertEqual(dawg.keyword_set_version, version + 1)
+        self.assertEqual(dawg.find_matching_substrings('log-cabins'), {'cabin', 'log'})
+        self.assertTrue(dawg.does_word_exist('log'))
+        self.assertFalse(dawg.does_word_exist('lo'))
+        self.assertRaises(TypeError, dawg.add_keyword, 2)
+
+    def test_matches_node_trie_from_file(self):
+        node_trie_builder = TrieBuilder()
+        node_trie_builder.file_name = 'test_keywords.txt'
+        trie = node_trie_builder.build_trie_from_file()[0]
+        trie_builder = TrieBuilder(backend=DAWG_BACKEND)
+        trie_builder.file_name = 'test_keywords.txt'
+        dawg = trie_builder.build_trie_from_file()[0]
+
+        self.assertTrue(isinstance(dawg, Dawg))
+        for url in [TestTrie.invalid_url, TestTrie.mixcase_url, THREE_HUNDRED_CHARS_URL]:
+            self.assertEqual(dawg.find_matching_substrings(url), trie.find_matching_substrings(url))
+            self.assertEqual(
+                {dawg.get_keyword(keyword_id) for keyword_id in dawg.find_matching_keyword_ids(url)},
+                trie.find_matching_substrings(url) or set()
+            )
+
+    def test_matches_node_trie_for_random_inputs(self):
+        generator = random.Random(2204)
+
+        for _ in range(200):
+            keywords = {
+                ''.join(generator.choice('ab-_') for _ in range(generator.randint(1, 5)))
+                for _ in range(generator.randint(1, 15))
+            }
+            url = ''.join(generator.choice('aAbB-_.') for _ in range(generator.randint(0, 60)))
+            trie, dawg = self.build_tries_from_keywords(keywords)
+
+            self.assertEqual(dawg.find_matching_substrings(url), trie.find_matching_substrings(url))
+
+
+class TestAutomatonSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot_directory = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.snapshot_directory.name, 'keywords.bin')
+
+    def tearDown(self):
+        self.snapshot_directory.cleanup()
+
+    def test_matches_trie_after_compiling(self):
+        invalid_keywords = compile_keywords_file('test_keywords.txt', self.snapshot_path)
+        trie_builder = TrieBuilder()
+        trie_builder.file_name = 'test_keywords.txt'
+        trie = trie_builder.build_trie_from_file()[0]
+
+        self.assertEqual(invalid_keywords, trie_builder.invalid_keywords)
+
+        with AutomatonSnapshot(self.snapshot_path) as snapshot:
+            for url in [TestTrie.invalid_url, TestTrie.mixcase_url, THREE_HUNDRED_CHARS_URL, '']:
+                self.assertEqual(
+                    snapshot.find_matching_substrings(url),
+                    trie.find_matching_substrings(url)
+                )
+
+            self.assertTrue(snapshot.does_word_exist(''))
+            self.assertTrue(snapshot.does_word_exist('womanlyon'))
+            self.assertFalse(snapshot.does_word_exist('womanl'))
+            self.assertEqual(snapshot.memory_usage_in_bytes(), os.path.getsize(self.snapshot_path))
+            self.assertRaises(ValueError, snapshot.add_keyword, 'cat')
+            self.assertRaises(ValueError, snapshot.add_sorted_keywords, ['cat'])
+            self.assertRaises(ValueError, snapshot.shift_ids, 1, 1)
+            self.assertRaises(ValueError, snapshot.graft, CompactTrie())
+
+    def test_works_in_worker_processes(self):
+        compile_keywords_file('test_keywords.txt', self.snapshot_path)
+        urls_file_path = 'substring_matcher/data/test_urls.txt'
+
+        with AutomatonSnapshot(self.snapshot_path) as snapshot:
+            for url, match_data in match_urls_file_in_parallel(
+                    snapshot, urls_file_path, number_of_workers=2, chunk_size_in_bytes=200):
+                self.assertEqual(
+                    set(match_data['matches']), snapshot.find_matching_substrings(url))
+
+    def test_load_fail(self):
+        self.assertRaises(TypeError, AutomatonSnapshot, 2)
+        self.assertRaises(TypeError, write_automaton_snapshot, Trie(), self.snapshot_path)
+
+        with open(self.snapshot_path, 'wb') as snapshot_file:
+            snapshot_file.write(b'NOPE' + bytes(12))
+        self.assertRaises(ValueError, AutomatonSnapshot, self.snapshot_path)
+
+        # an empty file cannot be mapped, and must not be left open
+        opened_files = []
+        open(self.snapshot_path, 'wb').close()
+        with self.assertRaises(ValueError), mock.patch(
+                'substring_matcher.automaton_snapshot.open', create=True,
+                side_effect=lambda *args: opened_files.append(open(*args)) or opened_files[-1]):
+            AutomatonSnapshot(self.snapshot_path)
+        self.assertTrue(opened_files[0].closed)
+
+        compile_keywords_file('test_keywords.txt', self.snapshot_path)
+        opened_files.clear()
+        with self.assertRaises(OSError), mock.patch(
+                'substring_matcher.automaton_snapshot.open', create=True,
+                side_effect=lambda *args: opened_files.append(open(*args)) or opened_files[-1]), mock.patch(
+                'substring_matcher.automaton_snapshot.mmap.mmap', side_effect=OSError(12, "Cannot allocate memory")):
+            AutomatonSnapshot(self.snapshot_path)
+        self.assertTrue(opened_files[0].closed)
+
+        with open(self.snapshot_path, 'r+b') as snapshot_file:
+            snapshot_file.seek(4)
+            snapshot_file.write((99).to_bytes(4, 'little'))
+        self.assertRaises(ValueError, AutomatonSnapshot, self.snapshot_path)
+
+
+class TestMatchSpans(unittest.TestCase):
+    keywords = ['arm', 'arms', 'rms', 'man', 'woman']
+    url = 'Arms-Woman.com/arm'
+
+    def build_tries(self):
+        for trie_class, engine in [(Trie, TRIE_WALK_ENGINE), (Trie, AHO_CORASICK_ENGINE),
+                                   (CompactTrie, TRIE_WALK_ENGINE), (CompactTrie, AHO_CORASICK_ENGINE),
+                                   (Dawg, TRIE_WALK_ENGINE)]:
+            trie = trie_class(engine=engine)
+            for keyword in self.keywords:
+                trie.add_keyword(keyword)
+            yield trie
+
+    def named_spans(self, trie, spans):
+        return [(start, end, trie.get_keyword(keyword_id)) for start, end, keyword_id in spans]
+
+    def test_match_kinds(self):
+        for trie in self.build_tries():
+            with self.subTest(trie=type(trie).__name__, engine=trie.engine):
+                self.assertEqual(self.named_spans(trie, trie.find_matching_spans(self.url)), [
+                    (0, 3, 'arm'), (0, 4, 'arms'), (1, 4, 'rms'), (5, 10, 'woman'),
+                    (7, 10, 'man'), (15, 18, 'arm')])
+                self.assertEqual(self.named_spans(trie, trie.find_matching_spans(self.url, LEFTMOST_LONGEST_MATCHES)),
+                                 [(0, 4, 'arms'), (5, 10, 'woman'), (15, 18, 'arm')])
+                self.assertEqual(trie.find_matching_spans(''), [])
+                self.assertRaises(ValueError, trie.find_matching_spans, self.url, 'rightmost')
+                self.assertRaises(TypeError, trie.find_matching_spans, None)
+
+    def test_leftmost_first_keeps_lowest_keyword_id(self):
+        trie = Trie()
+        for keyword in self.keywords:
+            trie.add_keyword(keyword)
+
+        self.assertEqual(self.named_spans(trie, trie.find_matching_spans(self.url, LEFTMOST_FIRST_MATCHES)),
+                         [(0, 3, 'arm'), (5, 10, 'woman'), (15, 18, 'arm')])
+
+    def test_spans_are_character_positions(self):
+        for trie in self.build_tries():
+            trie.add_keyword('café')
+            url = 'éé/café-arm'
+
+            with self.subTest(trie=type(trie).__name__, engine=trie.engine):
+                spans = self.named_spans(trie, trie.find_matching_spans(url))
+                self.assertEqual(spans, [(3, 7, 'café'), (8, 11, 'arm')])
+                self.assertTrue(all(url[start:end] == keyword for start, end, keyword in spans))
+
+    def test_has_any_match(self):
+        for trie in self.build_tries():
+            with self.subTest(trie=type(trie).__name__, engine=trie.engine):
+                self.assertTrue(trie.has_any_match(self.url))
+                self.assertFalse(trie.has_any_match('zzz.com/ar'))
+                self.assertFalse(trie.has_any_match(''))
+
+    def test_wrappers(self):
+        trie = Trie()
+        for keyword in self.keywords:
+            trie.add_keyword(keyword)
+        url = 'http://arms.com/9woman'
+        expected = trie.find_matching_spans(url, LEFTMOST_LONGEST_MATCHES)
+
+        for wrapper in [UrlTokenMatcher(trie), KeywordPrefilter(trie), KeywordPrefilter(UrlTokenMatcher(trie)),
+                        InstrumentedTrie(trie, Instrumentation())]:
+            with self.subTest(wrapper=type(wrapper).__name__):
+                self.assertEqual(wrapper.find_matching_spans(url, LEFTMOST_LONGEST_MATCHES), expected)
+                self.assertTrue(wrapper.has_any_match(url))
+                self.assertFalse(wrapper.has_any_match('http://ar.com/ms'))
+
+    def test_snapshot_spans(self):
+        with tempfile.TemporaryDirectory() as snapshot_directory:
+            snapshot_path = os.path.join(snapshot_directory, 'keywords.bin')
+            compile_keywords_file('test_keywords.txt', snapshot_path)
+            trie_builder = TrieBuilder()
+            trie_builder.file_name = 'test_keywords.txt'
+            trie = trie_builder.build_trie_from_file()[0]
+
+            with AutomatonSnapshot(snapshot_path) as snapshot:
+                for url in [TestTrie.mixcase_url, THREE_HUNDRED_CHARS_URL]:
+                    self.assertEqual(
+                        self.named_spans(snapshot, snapshot.find_matching_spans(url)),
+                        self.named_spans(trie, trie.find_matching_spans(url))
+                    )
+
+    def test_select_matching_spans(self):
+        spans = [(2, 5, 0), (0, 3, 2), (0, 2, 1), (3, 4, 3)]
+
+        self.assertEqual(select_matching_spans(spans, ALL_MATCHES), sorted(spans))
+        self.assertEqual(select_matching_spans(spans, LEFTMOST_LONGEST_MATCHES), [(0, 3, 2), (3, 4, 3)])
+        self.assertEqual(select_matching_spans(spans, LEFTMOST_FIRST_MATCHES), [(0, 2, 1), (2, 5, 0)])
+
+    def test_match_data(self):
+        trie = Trie()
+        for keyword in self.keywords:
+            trie.add_keyword(keyword)
+
+        self.assertEqual(build_keyword_match_data(trie, 'armarms', match_kind=LEFTMOST_LONGEST_MATCHES), {
+            'matches': ['arm', 'arms'], 'spans': [[0, 3, 'arm'], [3, 7, 'arms']]})
+
+        match_data = build_keyword_match_data(trie, 'armarms', use_keyword_ids=True, match_kind=ALL_MATCHES)
+        self.assertEqual(match_data['keyword_ids'], [0, 1, 2])
+        self.assertEqual(resolve_keyword_ids(trie, match_data), {
+            'matches': ['arm', 'arms', 'rms'],
+            'spans': [[0, 3, 'arm'], [3, 6, 'arm'], [3, 7, 'arms'], [4, 7, 'rms']]})
+
+        self.assertEqual(build_keyword_match_data(trie, 'zzz', any_match=True), {'any_match': False})
+        self.assertEqual(set(build_keyword_match_data(trie, 'arm', True, any_match=True)), {'any_match', 'runtime_ns'})
+        self.assertRaises(ValueError, build_keyword_match_data, trie, 'arm',
+                          match_cache=MatchCache(2), any_match=True)
+
+
 class TestTrieBuilder(unittest.TestCase):
 
     trie_builder = TrieBuilder()
@@ -224,3 +914,1322 @@ class TestTrieBuilder(unittest.TestCase):
         self.assertTrue(isinstance(invalid_keywords, set))
         self.assertTrue(len(invalid_keywords) > 0)
         self.assertEqual(invalid_keywords, expected_invalid_keywords)
+
+    def test_bulk_load_trie_from_file_path(self):
+        keywords_file_path = os.path.join(os.path.dirname(__file__), 'data', 'test_keywords.txt')
+        urls_file_path = os.path.join(os.path.dirname(__file__), 'data', 'test_urls.txt')
+
+        for backend in TRIE_BACKENDS:
+            sequential_trie, sequential_invalid_keywords = TrieBuilder(
+                backend=backend).build_trie_from_file_path(keywords_file_path)
+            trie_builder = TrieBuilder(backend=backend)
+            bulk_trie, bulk_invalid_keywords = trie_builder.bulk_load_trie_from_file_path(keywords_file_path)
+
+            self.assertEqual(bulk_invalid_keywords, sequential_invalid_keywords)
+            self.assertEqual([bulk_trie.get_keyword(keyword_id) for keyword_id in range(bulk_trie.keyword_count)],
+                             sorted(set(sequential_trie.get_keyword(keyword_id)
+                                        for keyword_id in range(sequential_trie.keyword_count)) - {''}))
+
+            with open(urls_file_path, 'r', encoding='utf-8') as urls_file:
+                for url in urls_file:
+                    self.assertEqual(bulk_trie.find_matching_substrings(url.strip()),
+                                     sequential_trie.find_matching_substrings(url.strip()))
+
+            self.assertEqual(trie_builder.build_stats['number_of_keywords_added'], bulk_trie.keyword_count)
+            self.assertEqual(trie_builder.build_stats['number_of_invalid_keywords'], len(bulk_invalid_keywords))
+
+    def test_bulk_load_with_only_valid_keywords(self):
+        with tempfile.TemporaryDirectory() as directory_path:
+            keywords_file_path = os.path.join(directory_path, 'keywords.txt')
+            with open(keywords_file_path, 'w', encoding='utf-8') as keywords_file:
+                keywords_file.write("Cabins\n  lodges \n\ncabins\nlodge\n")
+
+            trie_builder = TrieBuilder()
+            trie, invalid_keywords = trie_builder.bulk_load_trie_from_file_path(keywords_file_path)
+
+        self.assertEqual(trie.keywords, ['cabins', 'lodge', 'lodges'])
+        self.assertEqual(invalid_keywords, set())
+        self.assertEqual(trie_builder.build_stats['number_of_lines'], 5)
+        self.assertEqual(trie_builder.build_stats['number_of_unique_keywords'], 3)
+        self.assertAlmostEqual(trie_builder.build_stats['keywords_per_second'],
+                               3 / trie_builder.build_stats['build_seconds'])
+
+    def test_build_trie_in_parallel_from_file_path(self):
+        keywords_file_path = os.path.join(os.path.dirname(__file__), 'data', 'test_keywords.txt')
+
+        for engine in MATCHING_ENGINES:
+            bulk_trie, bulk_invalid_keywords = TrieBuilder(
+                engine=engine, backend=COMPACT_BACKEND).bulk_load_trie_from_file_path(keywords_file_path)
+            trie_builder = TrieBuilder(engine=engine, backend=COMPACT_BACKEND)
+            parallel_trie, parallel_invalid_keywords = trie_builder.build_trie_in_parallel_from_file_path(
+                keywords_file_path, 2)
+
+            self.assertEqual(parallel_invalid_keywords, bulk_invalid_keywords)
+            self.assertEqual(parallel_trie.keywords, bulk_trie.keywords)
+            self.assertEqual(parallel_trie.node_count, bulk_trie.node_count)
+            self.assertEqual(parallel_trie.is_automaton_built, engine == AHO_CORASICK_ENGINE)
+            self.assertGreater(trie_builder.build_stats['number_of_partitions'], 1)
+
+            for url in [TestTrie.invalid_url, TestTrie.mixcase_url, THREE_HUNDRED_CHARS_URL]:
+                self.assertEqual(parallel_trie.find_matching_keyword_ids(url),
+                                 bulk_trie.find_matching_keyword_ids(url))
+
+        # a, r, m, y and t below the root
+        self.assertEqual(count_partition_nodes(['arm', 'army', 'art']), 5)
+        self.assertRaises(ValueError, TrieBuilder().build_trie_in_parallel_from_file_path, keywords_file_path, 2)
+        self.assertRaises(ValueError, TrieBuilder(backend=COMPACT_BACKEND).build_trie_in_parallel_from_file_path,
+                          keywords_file_path, 0)
+
+    def test_build_trie_in_parallel_into_non_empty_trie(self):
+        with tempfile.TemporaryDirectory() as directory_path:
+            keywords_file_path = os.path.join(directory_path, 'keywords.txt')
+            with open(keywords_file_path, 'w', encoding='utf-8') as keywords_file:
+                keywords_file.write("cherry\ndove\n")
+
+            for engine in MATCHING_ENGINES:
+                trie_builder = TrieBuilder(engine=engine, backend=COMPACT_BACKEND)
+                trie_builder.trie.add_keyword('dog')
+                trie, _ = trie_builder.build_trie_in_parallel_from_file_path(keywords_file_path, 2)
+
+                self.assertEqual(trie.keyword_count, 3)
+                self.assertEqual(trie_builder.build_stats['number_of_partitions'], 2)
+                self.assertEqual({trie.get_keyword(keyword_id)
+                                  for keyword_id in trie.find_matching_keyword_ids("cherrydovedog")},
+                                 {'cherry', 'dove', 'dog'})
+
+    def test_graft(self):
+        compact_trie = CompactTrie()
+        compact_trie.add_sorted_keywords(['arm', 'army'])
+        other_trie = CompactTrie()
+        other_trie.add_sorted_keywords(['man', 'woman'])
+        compact_trie.graft(other_trie)
+
+        self.assertEqual(compact_trie.keywords, ['arm', 'army', 'man', 'woman'])
+        self.assertEqual(compact_trie.find_matching_keyword_ids('womanarmy'), {0, 1, 2, 3})
+
+        conflicting_trie = CompactTrie()
+        conflicting_trie.add_keyword('art')
+        self.assertRaises(ValueError, compact_trie.graft, conflicting_trie)
+        self.assertRaises(TypeError, compact_trie.graft, Trie())
+
+    def test_add_sorted_keywords(self):
+        keywords = ['ant', 'ant', 'antler', 'arm', 'b', 'woman', 'womb']
+
+        for trie in (Trie(), CompactTrie()):
+            trie.add_sorted_keywords(keywords)
+            # out of order and already known keywords still work
+            trie.add_sorted_keywords(['man', 'an', 'arm'])
+
+            self.assertEqual(trie.keywords, ['ant', 'antler', 'arm', 'b', 'woman', 'womb', 'man', 'an'])
+            self.assertEqual(trie.find_matching_substrings('womantler'), {'woman', 'man', 'ant', 'antler', 'an'})
+            self.assertRaises(TypeError, trie.add_sorted_keywords, 'ant')
+
+
+class TestStreamingSearch(unittest.TestCase):
+
+    def build_cli(self):
+        cli = SubstringMatcherCli()
+        cli.trie_builder.file_name = 'test_keywords.txt'
+        cli.trie = cli.trie_builder.build_trie_from_file()[0]
+        return cli
+
+    def test_stream_urls_file_for_matching_keywords(self):
+        cli = self.build_cli()
+
+        with tempfile.TemporaryDirectory() as results_path:
+            json_lines_path = os.path.join(results_path, 'results.jsonl')
+            text_path = os.path.join(results_path, 'results.txt')
+
+            with JsonLinesResultWriter(json_lines_path) as json_lines_writer, \
+                    TextResultWriter(text_path) as text_writer:
+                total_number_of_urls, number_of_urls_with_matches = (
+                    cli.stream_urls_file_for_matching_keywords(
+                        'test_urls.txt', [json_lines_writer, text_writer]))
+
+            self.assertEqual(cli.keyword_search_results, {})
+
+            with open(json_lines_path, 'r', encoding='utf-8') as json_lines_file:
+                records = [json.loads(line) for line in json_lines_file]
+
+            with open(text_path, 'r', encoding='utf-8') as text_file:
+                text_results = text_file.read()
+
+        cli.search_urls_file_for_matching_keywords('test_urls.txt')
+
+        self.assertEqual(len(records), total_number_of_urls)
+        self.assertEqual(len(records), len(cli.keyword_search_results))
+        self.assertEqual(
+            number_of_urls_with_matches,
+            len([record for record in records if record['matches']])
+        )
+
+        for record in records:
+            self.assertEqual(
+                set(record['matches']),
+                set(cli.keyword_search_results[record['url']]['matches'])
+            )
+            self.assertIn(f"URL: {record['url']}\n", text_results)
+
+    def test_result_writer_fail(self):
+        self.assertRaises(TypeError, JsonLinesResultWriter, 2)
+        self.assertRaises(TypeError, JsonLinesResultWriter, '-', '1')
+        self.assertRaises(ValueError, JsonLinesResultWriter, '-', 0)
+
+
+class TestResultWriters(unittest.TestCase):
+    results = {
+        'https://www.arm.com': {'matches': ['arm'], 'runtime_ns': 1500},
+        'woman, "quoted".org': {'matches': ['man', 'woman']},
+        'cat.org': {'matches': []}
+    }
+
+    def write_results(self, result_writer_class, **options):
+        with tempfile.TemporaryDirectory() as results_path:
+            results_file_path = os.path.join(results_path, 'results')
+
+            with result_writer_class(results_file_path, **options) as result_writer:
+                for url, match_data in self.results.items():
+                    result_writer.write_result(url, match_data)
+
+            with open(results_file_path, 'r', encoding='utf-8', newline='') as results_file:
+                return results_file.read()
+
+    def test_json_lines(self):
+        self.assertEqual(
+            [json.loads(line) for line in self.write_results(JsonLinesResultWriter).splitlines()],
+            [{'url': url, **match_data} for url, match_data in self.results.items()]
+        )
+
+    def test_compact_json(self):
+        self.assertEqual(json.loads(self.write_results(CompactJsonResultWriter)), self.results)
+        self.assertEqual(json.loads(self.write_results(CompactJsonResultWriter, buffer_size_in_bytes=1)), self.results)
+        self.assertEqual(self.write_results(CompactJsonResultWriter).count('\n'), 1)
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.write_results(CsvResultWriter))))
+
+        self.assertEqual(rows, [
+            ['url', 'matches', 'runtime_ns'],
+            ['https://www.arm.com', 'arm', '1500'],
+            ['woman, "quoted".org', 'man|woman', ''],
+            ['cat.org', '', '']
+        ])
+
+    def test_text(self):
+        text = self.write_results(TextResultWriter)
+
+        self.assertTrue(text.startswith(
+            "\n######################################\n"
+            "URL: https://www.arm.com\n"
+            "\nMATCHING KEYWORDS:\n"
+            "['arm']\n"
+            "\nRuntime: 0.0015 milliseconds\n"
+            "\n######################################\n"
+        ))
+        self.assertEqual(text.count('URL: '), len(self.results))
+        self.assertEqual(text.count('Runtime: '), 1)
+
+    def test_output_is_written_in_large_blocks(self):
+        with tempfile.TemporaryDirectory() as results_path:
+            result_writer = JsonLinesResultWriter(os.path.join(results_path, 'results.jsonl'), 1000)
+
+            with mock.patch.object(result_writer.results_file, 'write') as write:
+                for number in range(100):
+                    result_writer.write_result(f'arm.com/{number}', {'matches': ['arm']})
+                result_writer.close()
+
+        self.assertLess(write.call_count, 10)
+        self.assertEqual(
+            ''.join(call.args[0] for call in write.call_args_list).count('\n'), 100)
+
+    def test_background_writer(self):
+        class SlowJsonLinesResultWriter(JsonLinesResultWriter):
+            def __init__(self, file_path):
+                super().__init__(file_path)
+                self.writer_threads = set()
+
+            def write_result(self, url, match_data):
+                self.writer_threads.add(threading.current_thread().name)
+                super().write_result(url, match_data)
+
+        with tempfile.TemporaryDirectory() as results_path:
+            json_lines_path = os.path.join(results_path, 'results.jsonl')
+            json_lines_writer = SlowJsonLinesResultWriter(json_lines_path)
+
+            with BackgroundResultWriter([json_lines_writer], batch_size=2, max_pending_batches=1) as writer:
+                for url, match_data in self.results.items():
+                    writer.write_result(url, match_data)
+
+            with open(json_lines_path, 'r', encoding='utf-8') as json_lines_file:
+                records = [json.loads(line) for line in json_lines_file]
+
+        self.assertEqual(records, [{'url': url, **match_data} for url, match_data in self.results.items()])
+        self.assertEqual(json_lines_writer.writer_threads, {'result-writer'})
+
+    def test_background_writer_errors_are_raised(self):
+        class FailingResultWriter(ResultWriter):
+            def format_result(self, url, match_data):
+                raise ValueError(url)
+
+        background_writer = BackgroundResultWriter([FailingResultWriter(os.devnull)], batch_size=1)
+        background_writer.write_result('arm.com', {'matches': ['arm']})
+        self.assertRaises(ValueError, background_writer.close)
+
+    def test_interactive_results_files(self):
+        cli = SubstringMatcherCli()
+        cli.keyword_search_results = self.results
+
+        with tempfile.TemporaryDirectory() as results_path:
+            with mock.patch('substring_matcher.substring_matcher_cli.resource_path',
+                            side_effect=lambda path: os.path.join(results_path, path)):
+                cli.process_search_results_data_for_json_file()
+                cli.process_search_results_data_for_text_file()
+
+            with open(os.path.join(results_path, 'substring_matcher/results/keyword_search_results.json')) as json_file:
+                self.assertEqual(json.load(json_file), self.results)
+
+            with open(os.path.join(results_path, 'substring_matcher/results/keyword_search_results.txt')) as text_file:
+                self.assertEqual(text_file.read(), self.write_results(TextResultWriter))
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class TestColumnarResultWriter(unittest.TestCase):
+    results = [
+        ('https://arm.com', {'matches': ['arm'], 'runtime_ns': 120}),
+        ('https://example.com', {'matches': [], 'runtime_ns': 80}),
+        ('https://woman.arm.com', {'matches': ['woman', 'man', 'arm'], 'runtime_ns': 300}),
+    ]
+
+    def write_and_read_tables(self, **writer_options):
+        with tempfile.TemporaryDirectory() as directory_path:
+            with ColumnarResultWriter(directory_path, **writer_options) as result_writer:
+                for url, match_data in self.results:
+                    result_writer.write_result(url, match_data)
+
+            extension = writer_options.get('table_format', 'arrow')
+            return {table_name: read_columnar_table(os.path.join(directory_path, f"{table_name}.{extension}"))
+                    for table_name in ('urls', 'keywords', 'matches')}
+
+    def assert_tables_hold_results(self, tables):
+        urls = tables['urls'].to_pydict()
+        keywords = dict(zip(*tables['keywords'].to_pydict().values()))
+        matches = tables['matches'].to_pydict()
+
+        self.assertEqual(urls['url_id'], [0, 1, 2])
+        self.assertEqual(urls['url'], [url for url, _ in self.results])
+        self.assertEqual(urls['runtime_ns'], [match_data['runtime_ns'] for _, match_data in self.results])
+        self.assertEqual(sorted(keywords.values()), ['arm', 'man', 'woman'])
+        self.assertEqual(
+            [(url_id, keywords[keyword_id]) for url_id, keyword_id in zip(matches['url_id'], matches['keyword_id'])],
+            [(0, 'arm'), (2, 'woman'), (2, 'man'), (2, 'arm')]
+        )
+
+    def test_arrow_tables(self):
+        tables = self.write_and_read_tables()
+        self.assert_tables_hold_results(tables)
+
+    def test_parquet_tables(self):
+        tables = self.write_and_read_tables(table_format='parquet', compression='zstd')
+        self.assert_tables_hold_results(tables)
+
+    def test_results_are_written_in_record_batches(self):
+        tables = self.write_and_read_tables(batch_size=2, compression='lz4')
+
+        self.assert_tables_hold_results(tables)
+        self.assertEqual([len(batch) for batch in tables['urls'].to_batches()], [2, 1])
+
+    def test_missing_runtimes_are_null(self):
+        with tempfile.TemporaryDirectory() as directory_path:
+            with ColumnarResultWriter(directory_path) as result_writer:
+                result_writer.write_result('arm.com', {'matches': ['arm']})
+
+            urls = read_columnar_table(os.path.join(directory_path, 'urls.arrow'))
+
+        self.assertEqual(urls.column('runtime_ns').to_pylist(), [None])
+
+    def test_invalid_options(self):
+        with tempfile.TemporaryDirectory() as directory_path:
+            self.assertRaises(ValueError, ColumnarResultWriter, '-')
+            self.assertRaises(ValueError, ColumnarResultWriter, directory_path, table_format='orc')
+            self.assertRaises(ValueError, ColumnarResultWriter, directory_path, batch_size=0)
+            self.assertRaises(TypeError, ColumnarResultWriter, 1)
+
+    def test_headless_cli_output(self):
+        keywords_path = os.path.join(os.path.dirname(__file__), 'data', 'test_keywords.txt')
+        urls_path = os.path.join(os.path.dirname(__file__), 'data', 'test_urls.txt')
+
+        with tempfile.TemporaryDirectory() as directory_path:
+            exit_code = headless_main(['match', '--keywords', keywords_path, '--urls', urls_path,
+                                       '--output', directory_path, '--format', 'parquet'])
+            urls = read_columnar_table(os.path.join(directory_path, 'urls.parquet'))
+            matches = read_columnar_table(os.path.join(directory_path, 'matches.parquet'))
+
+        with open(urls_path, 'r', encoding='utf-8') as urls_file:
+            self.assertEqual(urls.column('url').to_pylist(), [line.strip() for line in urls_file if line.strip()])
+
+        self.assertEqual(exit_code, EXIT_CODE_MATCHES_FOUND)
+        self.assertGreater(matches.num_rows, 0)
+
+
+class TestInteractiveCli(unittest.TestCase):
+
+    def run_session(self, responses, cli=None):
+        cli = cli or SubstringMatcherCli()
+
+        with mock.patch('builtins.input', side_effect=responses), \
+                mock.patch.object(cli, 'process_search_results_data_for_json_file'), \
+                mock.patch.object(cli, 'process_search_results_data_for_text_file'), \
+                mock.patch.object(cli, 'search_url_list_for_matching_keywords',
+                                  wraps=cli.search_url_list_for_matching_keywords) as search, \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.assertRaises(SystemExit, cli.start_cli)
+
+        return cli, search
+
+    def test_long_session_does_not_grow_the_stack(self):
+        number_of_rounds = sys.getrecursionlimit() + 100
+        # an empty response dismisses each "Press 'Enter'" pause
+        first_round = ['', '2', 'man|arm', 'y', '', '2', 'woman.com|arms.net', 'y', '']
+        next_round = ['2', '2', 'woman.com', 'y', '']
+
+        cli, search = self.run_session(
+            first_round + next_round * (number_of_rounds - 1) + ['exit'])
+
+        self.assertEqual(search.call_count, number_of_rounds)
+        self.assertEqual(cli.trie.find_matching_substrings('woman.com'), {'man'})
+        self.assertEqual(cli.keyword_search_results, {})
+
+    def test_invalid_responses_repeat_the_question(self):
+        cli, search = self.run_session(
+            ['', '3', '', '2', '', 'man', 'maybe', '', 'n', 'arm', 'y', '',
+             '9', '', '2', 'arms.net', 'y', '', 'quit'])
+
+        self.assertEqual(search.call_count, 1)
+        self.assertEqual(cli.trie.find_matching_substrings('arms.net'), {'arm'})
+
+
+    def test_same_keywords_reuse_the_trie(self):
+        cli = SubstringMatcherCli()
+        first_round = ['', '2', 'man|arm', 'y', '', '2', 'woman.com', 'y', '']
+        same_keywords_round = ['1', '', '2', 'ARM | man', 'y', '', '2', 'arms.net', 'y', '']
+        new_keywords_session = ['', '2', 'arm', 'y', '', '2', 'arms.net', 'y', '']
+
+        with mock.patch.object(cli.trie_builder, 'build_trie_from_list',
+                               wraps=cli.trie_builder.build_trie_from_list) as build:
+            self.run_session(first_round + same_keywords_round + ['exit'], cli)
+            self.assertEqual(build.call_count, 1)
+
+            self.run_session(new_keywords_session + ['exit'], cli)
+            self.assertEqual(build.call_count, 2)
+
+        self.assertEqual(len(cli.trie_cache), 2)
+        self.assertEqual(cli.trie.find_matching_substrings('woman.com'), set())
+
+
+class TestTrieCache(unittest.TestCase):
+
+    def test_fingerprint_ignores_order_case_and_whitespace(self):
+        self.assertEqual(
+            fingerprint_keywords(['man', 'Arm ']),
+            fingerprint_keywords(['arm', 'man', 'MAN'])
+        )
+        self.assertNotEqual(fingerprint_keywords(['man']), fingerprint_keywords(['man', 'arm']))
+        self.assertNotEqual(
+            fingerprint_keywords(['man']),
+            fingerprint_keywords(['man'], engine=AHO_CORASICK_ENGINE)
+        )
+
+    def test_fingerprint_changes_when_the_keywords_file_changes(self):
+        with tempfile.TemporaryDirectory() as data_path:
+            keywords_path = os.path.join(data_path, 'keywords.txt')
+            with open(keywords_path, 'w', encoding='utf-8') as keywords_file:
+                keywords_file.write('man\n')
+
+            fingerprint = fingerprint_keywords([], keywords_path)
+            self.assertEqual(fingerprint, fingerprint_keywords([], keywords_path))
+
+            file_stats = os.stat(keywords_path)
+            os.utime(keywords_path, ns=(file_stats.st_atime_ns, file_stats.st_mtime_ns + 1))
+            self.assertNotEqual(fingerprint, fingerprint_keywords([], keywords_path))
+
+    def test_least_recently_used_trie_is_evicted(self):
+        trie_cache = TrieCache(max_size=2)
+        trie_cache.put('a', Trie(), set())
+        trie_cache.put('b', Trie(), {'b!'})
+        trie_cache.get('a')
+        trie_cache.put('c', Trie(), set())
+
+        self.assertIn('a', trie_cache)
+        self.assertNotIn('b', trie_cache)
+        self.assertIn('c', trie_cache)
+        self.assertIsNone(trie_cache.get('b'))
+
+    def test_cached_invalid_keywords_are_copies(self):
+        trie_cache = TrieCache()
+        trie_cache.put('a', Trie(), {'b!'})
+        trie_cache.get('a')[1].add('c!')
+
+        self.assertEqual(trie_cache.get('a')[1], {'b!'})
+
+    def test_trie_cache_fail(self):
+        self.assertRaises(TypeError, TrieCache, '2')
+        self.assertRaises(ValueError, TrieCache, 0)
+
+
+class TestMatchCache(unittest.TestCase):
+
+    def build_trie(self):
+        trie = Trie()
+        for keyword in ['man', 'arm', 'woman']:
+            trie.add_keyword(keyword)
+        return trie
+
+    def test_repeated_urls_are_not_searched_again(self):
+        trie = self.build_trie()
+        match_cache = MatchCache()
+
+        with mock.patch.object(trie, 'find_matching_keyword_ids',
+                               wraps=trie.find_matching_keyword_ids) as search:
+            for url in ['woman.com', 'arms.net', 'woman.com', 'woman.com', 'cat.org']:
+                self.assertEqual(
+                    match_cache.find_matching_substrings(trie, url),
+                    trie.find_matching_substrings(url)
+                )
+
+        self.assertEqual(search.call_count, 3)
+        self.assertEqual((match_cache.hits, match_cache.misses), (2, 3))
+        self.assertEqual(match_cache.hit_rate, 0.4)
+
+    def test_least_recently_used_url_is_evicted(self):
+        trie = self.build_trie()
+        match_cache = MatchCache(max_entries=2)
+
+        for url in ['woman.com', 'arms.net', 'woman.com', 'cat.org']:
+            match_cache.find_matching_keyword_ids(trie, url)
+
+        self.assertEqual(list(match_cache.results), ['woman.com', 'cat.org'])
+        self.assertEqual(match_cache.evictions, 1)
+
+    def test_size_in_bytes_is_bounded(self):
+        trie = self.build_trie()
+        entry_size = MatchCache.estimate_entry_size('arms.net/1', (1,))
+        match_cache = MatchCache(max_size_in_bytes=3 * entry_size)
+
+        for number in range(10):
+            match_cache.find_matching_keyword_ids(trie, f'arms.net/{number}')
+
+        self.assertEqual(len(match_cache), 3)
+        self.assertEqual(match_cache.evictions, 7)
+        self.assertLessEqual(match_cache.size_in_bytes, 3 * entry_size)
+
+    def test_changed_keywords_invalidate_the_cache(self):
+        trie = self.build_trie()
+        match_cache = MatchCache()
+
+        self.assertEqual(match_cache.find_matching_substrings(trie, 'cat.org'), set())
+        trie.add_keyword('cat')
+        self.assertEqual(match_cache.find_matching_substrings(trie, 'cat.org'), {'cat'})
+        trie.remove_keyword('cat')
+        self.assertEqual(match_cache.find_matching_substrings(trie, 'cat.org'), set())
+        self.assertEqual(match_cache.find_matching_substrings(Trie(), 'woman.com'), set())
+
+        self.assertEqual(match_cache.invalidations, 3)
+        self.assertEqual(match_cache.misses, 4)
+
+    def test_adding_a_known_keyword_keeps_the_cache(self):
+        trie = self.build_trie()
+        match_cache = MatchCache()
+        match_cache.find_matching_keyword_ids(trie, 'woman.com')
+        trie.add_keyword('man')
+        match_cache.find_matching_keyword_ids(trie, 'woman.com')
+
+        self.assertEqual((match_cache.hits, match_cache.invalidations), (1, 0))
+
+    def test_cli_results_match_without_cache(self):
+        expected_cli = SubstringMatcherCli()
+        expected_cli.trie = self.build_trie()
+        expected_cli.search_urls_file_for_matching_keywords('test_urls.txt')
+
+        cached_cli = SubstringMatcherCli(match_cache=MatchCache(max_entries=4))
+        cached_cli.trie = expected_cli.trie
+        cached_cli.search_urls_file_for_matching_keywords('test_urls.txt')
+
+        self.assertEqual(
+            {url: set(data['matches']) for url, data in cached_cli.keyword_search_results.items()},
+            {url: set(data['matches']) for url, data in expected_cli.keyword_search_results.items()}
+        )
+
+    def test_match_cache_fail(self):
+        self.assertRaises(TypeError, MatchCache, '10')
+        self.assertRaises(TypeError, MatchCache, 10, 1.5)
+        self.assertRaises(ValueError, MatchCache, 0)
+        self.assertRaises(ValueError, MatchCache, 10, 0)
+
+
+class TestUrlTokenMatcher(unittest.TestCase):
+
+    def build_tries(self):
+        keywords = TrieBuilder().build_trie_from_file_path(
+            os.path.join(os.path.dirname(__file__), 'data', 'test_keywords.txt'))[0].keywords
+
+        for engine in MATCHING_ENGINES:
+            for backend in TRIE_BACKENDS:
+                if backend == DAWG_BACKEND and engine != TRIE_WALK_ENGINE:
+                    continue
+                trie = TrieBuilder(engine=engine, backend=backend).create_trie()
+                for keyword in keywords:
+                    trie.add_keyword(keyword)
+                yield trie
+
+    def test_find_keyword_runs(self):
+        self.assertEqual(
+            find_keyword_runs('https://www.arm-2.com/my_arms?x=9ab', 2),
+            ['https', 'www', 'arm-', 'com', 'my_arms', 'ab']
+        )
+
+    def test_split_url_into_components(self):
+        self.assertEqual(
+            split_url_into_components('https://www.arm.com/arms?q=man#top'),
+            [('scheme', 'https'), ('host', 'www.arm.com'), ('path', '/arms'),
+             ('query', 'q=man'), ('fragment', 'top')]
+        )
+        self.assertEqual(
+            split_url_into_components('www.arm.com/arms'),
+            [('host', 'www.arm.com'), ('path', '/arms')]
+        )
+
+    def test_matches_are_the_same_as_a_full_scan(self):
+        with open(os.path.join(os.path.dirname(__file__), 'data', 'test_urls.txt'), 'r') as urls_file:
+            urls = [url.strip() for url in urls_file] + [THREE_HUNDRED_CHARS_URL, ELEVEN_THOUSAND_CHARS_URL]
+
+        for trie in self.build_tries():
+            url_token_matcher = UrlTokenMatcher(trie)
+            for url in urls:
+                self.assertEqual(
+                    url_token_matcher.find_matching_keyword_ids(url),
+                    trie.find_matching_keyword_ids(url) if url else set()
+                )
+
+    def test_short_runs_and_separators_are_skipped(self):
+        trie = Trie()
+        trie.add_keyword('arm')
+        trie.add_keyword('man')
+        url_token_matcher = UrlTokenMatcher(trie)
+
+        self.assertEqual(url_token_matcher.extract_searchable_text('HTTP://ab.ARM.com/9/woman'), 'http arm com woman')
+        self.assertEqual(url_token_matcher.find_matching_substrings('ar.m/m-an'), set())
+
+        trie.add_keyword('ab')
+        self.assertEqual(url_token_matcher.find_matching_substrings('HTTP://ab.ARM.com'), {'ab', 'arm'})
+
+    def test_find_matching_substrings_by_component(self):
+        trie = Trie()
+        for keyword in ['arm', 'man', 'top']:
+            trie.add_keyword(keyword)
+
+        self.assertEqual(
+            UrlTokenMatcher(trie).find_matching_substrings_by_component('https://www.ARM.com/arms?q=woman#top'),
+            {'host': {'arm'}, 'path': {'arm'}, 'query': {'man'}, 'fragment': {'top'}}
+        )
+
+    def test_url_token_matcher_fail(self):
+        self.assertRaises(TypeError, UrlTokenMatcher(Trie()).find_matching_keyword_ids, 2)
+
+
+class TestKeywordPrefilter(unittest.TestCase):
+
+    def test_compile_keyword_prefix_pattern(self):
+        self.assertEqual(
+            compile_keyword_prefix_pattern(['arm', 'art', 'arts', 'man', 'a-b', None], 3).pattern,
+            r'(?:a(?:\-b|r[mt])|man)'
+        )
+        self.assertEqual(compile_keyword_prefix_pattern(['ar', 'arm'], 3).pattern, 'ar')
+        self.assertIsNone(compile_keyword_prefix_pattern([], 3).search('arm'))
+
+    def test_rejects_only_urls_without_matches(self):
+        generator = random.Random(7)
+        trie = Trie()
+        for keyword in generate_keywords(50, generator, min_length=5):
+            trie.add_keyword(keyword)
+
+        urls = [generate_url(80, trie.keywords, generator.choice([0, 0.2]), generator) for _ in range(300)]
+
+        for prefix_length in [1, 3, 6]:
+            keyword_prefilter = KeywordPrefilter(trie, prefix_length)
+            for url in urls:
+                self.assertEqual(
+                    keyword_prefilter.find_matching_keyword_ids(url),
+                    trie.find_matching_keyword_ids(url)
+                )
+
+            self.assertEqual(keyword_prefilter.urls_checked, len(urls))
+
+        # longer prefixes reject more of the URLs without matches
+        self.assertGreater(keyword_prefilter.selectivity, 0)
+
+    def test_selectivity(self):
+        trie = Trie()
+        trie.add_keyword('arm')
+        keyword_prefilter = KeywordPrefilter(trie)
+
+        with mock.patch.object(trie, 'find_matching_keyword_ids',
+                               wraps=trie.find_matching_keyword_ids) as search:
+            for url in ['arms.com', 'cat.org', 'ar.m', 'ARM']:
+                keyword_prefilter.find_matching_substrings(url)
+
+        self.assertEqual(search.call_count, 2)
+        self.assertEqual(keyword_prefilter.stats(),
+                         {'urls_checked': 4, 'urls_rejected': 2, 'selectivity': 0.5})
+
+    def test_lowercases_the_url_once(self):
+        class CountingUrl(str):
+            number_of_lowercasings = 0
+
+            def lower(self):
+                CountingUrl.number_of_lowercasings += 1
+                return str.lower(self)
+
+        for trie in [Trie(), CompactTrie(), Dawg()]:
+            trie.add_keyword('arm')
+
+            for searchable_trie in [trie, UrlTokenMatcher(trie)]:
+                with self.subTest(trie=type(trie).__name__, wrapper=type(searchable_trie).__name__):
+                    keyword_prefilter = KeywordPrefilter(searchable_trie)
+                    CountingUrl.number_of_lowercasings = 0
+
+                    self.assertEqual(keyword_prefilter.find_matching_keyword_ids(CountingUrl('ARMS.com')), {0})
+                    self.assertEqual(keyword_prefilter.find_matching_spans(CountingUrl('ARMS.com')), [(0, 3, 0)])
+                    self.assertTrue(keyword_prefilter.has_any_match(CountingUrl('ARMS.com')))
+                    self.assertEqual(CountingUrl.number_of_lowercasings, 3)
+
+    def test_pattern_follows_keyword_changes(self):
+        trie = Trie()
+        trie.add_keyword('arm')
+        keyword_prefilter = KeywordPrefilter(UrlTokenMatcher(trie))
+        self.assertEqual(keyword_prefilter.find_matching_substrings('cat.org'), set())
+
+        trie.add_keyword('cat')
+        self.assertEqual(keyword_prefilter.find_matching_substrings('cat.org'), {'cat'})
+
+        trie.remove_keyword('cat')
+        self.assertEqual(keyword_prefilter.find_matching_substrings('cat.org'), set())
+
+    def test_keyword_prefilter_fail(self):
+        self.assertRaises(TypeError, KeywordPrefilter, Trie(), '4')
+        self.assertRaises(ValueError, KeywordPrefilter, Trie(), 0)
+
+
+class TestBytePipeline(unittest.TestCase):
+    keywords_path = os.path.join(os.path.dirname(__file__), 'data', 'test_keywords.txt')
+    urls_path = os.path.join(os.path.dirname(__file__), 'data', 'test_urls.txt')
+
+    def test_read_line_aligned_chunks(self):
+        data = b'arm.com\nwoman.org/x\n\nlast'
+
+        for read_size in [1, 3, 8, 1024]:
+            chunks = list(read_line_aligned_chunks(io.BytesIO(data), read_size))
+            self.assertEqual(b''.join(chunks), data)
+            self.assertTrue(all(chunk.endswith(b'\n') for chunk in chunks[:-1]))
+
+        self.assertEqual(list(read_line_aligned_chunks(io.BytesIO(b''))), [])
+        self.assertRaises(ValueError, list, read_line_aligned_chunks(io.BytesIO(data), 0))
+
+    def test_matches_are_the_same_as_the_text_pipeline(self):
+        with open(self.urls_path, 'r', encoding='utf-8') as urls_file:
+            expected_urls = [url.strip() for url in urls_file]
+
+        for backend in TRIE_BACKENDS:
+            trie = TrieBuilder(backend=backend).build_trie_from_file_path(self.keywords_path)[0]
+
+            with open(self.urls_path, 'rb') as urls_file:
+                results = list(match_binary_urls(trie, urls_file, 64))
+
+            self.assertEqual([url for url, _ in results], expected_urls)
+            for url, keyword_ids in results:
+                self.assertEqual(sorted(keyword_ids), sorted(trie.find_matching_keyword_ids(url)))
+
+    def test_case_folding_and_non_ascii_bytes(self):
+        trie = Trie()
+        for keyword in ['arm', 'man']:
+            trie.add_keyword(keyword)
+
+        data = 'HTTP://ARMS.COM\r\nwo\u00e9man.org/wOMAN\nwoma\u00e9n\n'.encode('utf-8') + b'\xffarm\n'
+        self.assertEqual(
+            [(url, sorted(trie.get_keyword(keyword_id) for keyword_id in keyword_ids))
+             for url, keyword_ids in match_binary_urls(trie, io.BytesIO(data))],
+            [('HTTP://ARMS.COM', ['arm']), ('wo\u00e9man.org/wOMAN', ['man']), ('woma\u00e9n', []),
+             ('\ufffdarm', ['arm'])]
+        )
+
+    def test_snapshot_uses_the_same_keyword_ids(self):
+        with tempfile.TemporaryDirectory() as snapshot_directory:
+            snapshot_path = os.path.join(snapshot_directory, 'keywords.smac')
+            compile_keywords_file_path(self.keywords_path, snapshot_path)
+
+            with AutomatonSnapshot(snapshot_path) as snapshot, open(self.urls_path, 'rb') as urls_file:
+                for url, keyword_ids in match_binary_urls(snapshot, urls_file):
+                    self.assertEqual(set(keyword_ids), snapshot.find_matching_keyword_ids(url))
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def build_instrumented_trie(self, instrumentation, engine=AHO_CORASICK_ENGINE):
+        trie = Trie(engine=engine)
+        for keyword in ['arm', 'man', 'woman', 'an']:
+            trie.add_keyword(keyword)
+
+        return InstrumentedTrie(trie, instrumentation, count_search_steps=True)
+
+    def test_histogram(self):
+        histogram = Histogram([0.001, 0.01, 0.1])
+        for value in [0.0005, 0.001, 0.05, 0.05, 3.0]:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.bucket_counts, [2, 0, 2, 1])
+        self.assertEqual(histogram.to_dict()['buckets'], {'0.001': 2, '0.01': 2, '0.1': 4, '+Inf': 5})
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.sum, 3.1015)
+        self.assertRaises(ValueError, Histogram, [0.1, 0.01])
+
+    def test_count_search_steps(self):
+        keywords = ['an', 'arm', 'man', 'woman']
+        for engine, expected_steps, expected_early_steps in [(TRIE_WALK_ENGINE, [14, 10], [5, 1]),
+                                                             (AHO_CORASICK_ENGINE, [13, 2], [5, 0])]:
+            tries = [Trie(engine=engine), CompactTrie(engine=engine)]
+            if engine == TRIE_WALK_ENGINE:
+                tries.append(Dawg())
+
+            for trie in tries:
+                trie.add_sorted_keywords(keywords)
+
+                search_steps = [0, 0]
+                self.assertEqual(len(trie.find_matching_keyword_ids('Woman-army', search_steps=search_steps)), 4)
+                self.assertEqual(search_steps, expected_steps)
+
+                search_steps = [0, 0]
+                self.assertEqual(len(trie.find_matching_spans('Woman-army', search_steps=search_steps)), 4)
+                self.assertEqual(search_steps, expected_steps)
+
+                # the search stops at 'woman', so only its steps count
+                search_steps = [0, 0]
+                self.assertTrue(trie.has_any_match('Woman-army', search_steps=search_steps))
+                self.assertEqual(search_steps, expected_early_steps)
+
+    def test_instrumented_trie(self):
+        instrumentation = Instrumentation()
+        instrumented_trie = self.build_instrumented_trie(instrumentation)
+
+        self.assertEqual(instrumented_trie.find_matching_substrings('Woman-army'), {'woman', 'man', 'an', 'arm'})
+        self.assertEqual(len(instrumented_trie.find_matching_keyword_ids('Woman-army')), 4)
+        self.assertEqual(instrumentation.counters['trie_transitions'], 26)
+        self.assertEqual(instrumentation.counters['root_restarts'], 4)
+        self.assertEqual(instrumentation.histograms['match'].count, 2)
+
+        self.assertTrue(instrumented_trie.has_any_match('Woman-army'))
+        self.assertEqual(instrumentation.counters['trie_transitions'], 31)
+        self.assertEqual(instrumented_trie.keyword_count, 4)
+        self.assertRaises(ValueError, InstrumentedTrie, UrlTokenMatcher(Trie()), instrumentation, True)
+
+    def test_instrumented_result_writer(self):
+        instrumentation = Instrumentation()
+        output = io.StringIO()
+
+        with mock.patch('sys.stdout', output):
+            with InstrumentedResultWriter(JsonLinesResultWriter('-'), instrumentation) as result_writer:
+                result_writer.write_result('woman.com', {'matches': ['woman', 'man']})
+                result_writer.write_result('ü.com', {'matches': []})
+
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+        self.assertEqual(instrumentation.counters['urls_processed'], 2)
+        self.assertEqual(instrumentation.counters['bytes_scanned'], 15)
+        self.assertEqual(instrumentation.counters['matches_emitted'], 2)
+        self.assertEqual(instrumentation.histograms['write'].count, 3)
+
+    def test_dumps(self):
+        with tempfile.TemporaryDirectory() as directory_path:
+            metrics_file_path = os.path.join(directory_path, 'metrics.prom')
+            instrumentation = Instrumentation(metrics_file_path, 'prometheus', dump_interval_in_seconds=60)
+            instrumentation.increment('urls_processed', 3)
+            instrumentation.observe_phase('match', 0.002)
+
+            instrumentation.maybe_dump()
+            self.assertFalse(os.path.exists(metrics_file_path))
+
+            instrumentation.last_dump_time -= 60
+            instrumentation.maybe_dump()
+            with open(metrics_file_path, 'r', encoding='utf-8') as metrics_file:
+                metrics = metrics_file.read()
+
+        self.assertIn('substring_matcher_urls_processed_total 3\n', metrics)
+        self.assertIn('substring_matcher_phase_seconds_bucket{phase="match",le="0.01"} 1\n', metrics)
+        self.assertIn('substring_matcher_phase_seconds_count{phase="build"} 0\n', metrics)
+        self.assertEqual(json.loads(instrumentation.format_json())['counters']['urls_processed'], 3)
+        self.assertRaises(ValueError, Instrumentation, metrics_format='xml')
+
+    def test_capture_run(self):
+        with tempfile.TemporaryDirectory() as directory_path:
+            profile_file_path = os.path.join(directory_path, 'run.prof')
+
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                with capture_run(profile_file_path, trace_memory=True):
+                    Trie().add_keyword('profiled')
+
+            self.assertTrue(os.path.getsize(profile_file_path) > 0)
+
+        self.assertIn('Top memory allocations:', stderr.getvalue())
+
+
+class TestHeadlessCli(unittest.TestCase):
+    keywords_path = os.path.join(os.path.dirname(__file__), 'data', 'test_keywords.txt')
+    urls_path = os.path.join(os.path.dirname(__file__), 'data', 'test_urls.txt')
+
+    def run_match(self, *extra_arguments):
+        if '--snapshot' not in extra_arguments:
+            extra_arguments = ('--keywords', self.keywords_path, *extra_arguments)
+
+        with tempfile.TemporaryDirectory() as results_path:
+            output_path = os.path.join(results_path, 'results.jsonl')
+            exit_code = headless_main(['match', '--urls', self.urls_path, '--output', output_path,
+                                       *extra_arguments])
+
+            with open(output_path, 'r', encoding='utf-8') as output_file:
+                records = [json.loads(line) for line in output_file]
+
+        return exit_code, records
+
+    def test_match(self):
+        exit_code, records = self.run_match()
+
+        with open(self.urls_path, 'r', encoding='utf-8') as urls_file:
+            urls = [line.strip() for line in urls_file if line.strip()]
+
+        self.assertEqual(exit_code, EXIT_CODE_MATCHES_FOUND)
+        self.assertEqual([record['url'] for record in records], urls)
+        self.assertTrue(any(record['matches'] for record in records))
+
+    def test_match_in_parallel(self):
+        self.assertEqual(
+            self.run_match('--workers', '2', '--chunk-size', '64'),
+            self.run_match()
+        )
+
+    def test_match_with_bulk_load(self):
+        def sorted_matches(records):
+            return [(record['url'], sorted(record['matches'])) for record in records]
+
+        exit_code, records = self.run_match('--bulk-load')
+
+        self.assertEqual(exit_code, EXIT_CODE_MATCHES_FOUND)
+        self.assertEqual(sorted_matches(records), sorted_matches(self.run_match()[1]))
+
+    def test_match_with_dawg_backend(self):
+        def sorted_matches(records):
+            return [(record['url'], sorted(record['matches'])) for record in records]
+
+        exit_code, records = self.run_match('--backend', 'dawg', '--workers', '2')
+
+        self.assertEqual(exit_code, EXIT_CODE_MATCHES_FOUND)
+        self.assertEqual(sorted_matches(records), sorted_matches(self.run_match()[1]))
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, parse_arguments,
+                              ['match', '--keywords', 'k.txt', '--backend', 'dawg', '--engine', 'aho_corasick'])
+
+    def test_match_with_build_workers(self):
+        self.assertEqual(
+            self.run_match('--backend', 'compact', '--build-workers', '2'),
+            self.run_match('--backend', 'compact', '--bulk-load')
+        )
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, parse_arguments, ['match', '--keywords', 'k.txt', '--build-workers', '2'])
+
+    def test_match_with_metrics(self):
+        with tempfile.TemporaryDirectory() as directory_path:
+            metrics_file_path = os.path.join(directory_path, 'metrics.json')
+            exit_code, records = self.run_match('--metrics', metrics_file_path, '--count-search-steps',
+                                                '--prefilter')
+
+            with open(metrics_file_path, 'r', encoding='utf-8') as metrics_file:
+                metrics = json.load(metrics_file)
+
+        self.assertEqual(exit_code, EXIT_CODE_MATCHES_FOUND)
+        self.assertEqual(metrics['counters']['urls_processed'], len(records))
+        self.assertEqual(metrics['counters']['matches_emitted'], sum(len(record['matches']) for record in records))
+        self.assertGreater(metrics['counters']['trie_transitions'], 0)
+        self.assertEqual(metrics['phase_seconds']['build']['count'], 1)
+        self.assertLessEqual(metrics['phase_seconds']['match']['count'], len(records))
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, parse_arguments,
+                              ['match', '--keywords', 'k.txt', '--count-search-steps'])
+            for extra_arguments in [['--workers', '2'], ['--bytes']]:
+                self.assertRaises(SystemExit, parse_arguments, ['match', '--keywords', 'k.txt', '--metrics', 'm.json',
+                                                                '--count-search-steps'] + extra_arguments)
+
+    def test_match_tokenized(self):
+        expected = self.run_match()
+        self.assertEqual(self.run_match('--tokenize'), expected)
+        self.assertEqual(self.run_match('--tokenize', '--workers', '2', '--cache-size', '2'), expected)
+
+    def test_match_prefiltered(self):
+        expected = self.run_match()
+        self.assertEqual(self.run_match('--prefilter', '--prefilter-length', '2'), expected)
+        self.assertEqual(self.run_match('--prefilter', '--tokenize', '--workers', '2'), expected)
+
+    def test_match_bytes(self):
+        def sort_matches(run_result):
+            exit_code, records = run_result
+            return (exit_code, [(record['url'], sorted(record['matches'])) for record in records])
+
+        expected = sort_matches(self.run_match())
+        self.assertEqual(sort_matches(self.run_match('--bytes')), expected)
+        self.assertEqual(sort_matches(self.run_match('--bytes', '--backend', 'compact')), expected)
+
+    def test_match_with_cache(self):
+        expected = self.run_match()
+        self.assertEqual(self.run_match('--cache-size', '2', '--cache-bytes', '1000'), expected)
+        self.assertEqual(self.run_match('--cache-size', '2', '--workers', '2'), expected)
+
+    def test_match_from_snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_directory:
+            snapshot_path = os.path.join(snapshot_directory, 'keywords.smac')
+            self.assertEqual(
+                headless_main(['compile', '--keywords', self.keywords_path, '--output', snapshot_path]),
+                EXIT_CODE_SUCCESS
+            )
+
+            snapshot_records = self.run_match('--snapshot', snapshot_path)[1]
+
+        expected_records = self.run_match()[1]
+        self.assertEqual(
+            [set(record['matches']) for record in snapshot_records],
+            [set(record['matches']) for record in expected_records]
+        )
+
+    def test_match_with_spans(self):
+        expected_records = self.run_match()[1]
+        exit_code, records = self.run_match('--match-kind', LEFTMOST_LONGEST_MATCHES, '--record-runtimes')
+
+        self.assertEqual(exit_code, EXIT_CODE_MATCHES_FOUND)
+        self.assertEqual([record['url'] for record in records], [record['url'] for record in expected_records])
+
+        for record in records:
+            self.assertEqual([keyword for _, _, keyword in record['spans']],
+                             [record['url'].lower()[start:end] for start, end, _ in record['spans']])
+            self.assertIn('runtime_ns', record)
+
+        exit_code, records = self.run_match('--any-match')
+        self.assertEqual(exit_code, EXIT_CODE_MATCHES_FOUND)
+        self.assertEqual([record['any_match'] for record in records],
+                         [bool(record['matches']) for record in expected_records])
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, parse_arguments,
+                              ['match', '--keywords', 'k.txt', '--urls', 'u.txt', '--any-match', '--workers', '2'])
+            self.assertRaises(SystemExit, parse_arguments,
+                              ['match', '--keywords', 'k.txt', '--any-match', '--match-kind', ALL_MATCHES])
+            for result_format in ['csv', 'text', 'arrow', 'parquet']:
+                self.assertRaises(SystemExit, parse_arguments,
+                                  ['match', '--keywords', 'k.txt', '--any-match', '--format', result_format])
+                self.assertRaises(SystemExit, parse_arguments, [
+                    'match', '--keywords', 'k.txt', '--match-kind', ALL_MATCHES, '--format', result_format])
+
+    def test_no_matches(self):
+        with tempfile.TemporaryDirectory() as data_path:
+            urls_path = os.path.join(data_path, 'urls.txt')
+            with open(urls_path, 'w', encoding='utf-8') as urls_file:
+                urls_file.write('zzz.qqq\n')
+
+            exit_code = headless_main(['match', '--keywords', self.keywords_path, '--urls', urls_path,
+                                       '--output', os.path.join(data_path, 'results.jsonl')])
+
+        self.assertEqual(exit_code, EXIT_CODE_NO_MATCHES)
+
+    def test_missing_keywords_file(self):
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            exit_code = headless_main(['match', '--keywords', 'missing_keywords.txt', '--urls', self.urls_path])
+
+        self.assertEqual(exit_code, EXIT_CODE_ERROR)
+        self.assertIn('missing_keywords.txt', stderr.getvalue())
+
+    def test_invalid_arguments(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, parse_arguments, ['match', '--keywords', 'k.txt', '--workers', '0'])
+            self.assertRaises(SystemExit, parse_arguments, ['match', '--keywords', 'k.txt', '--workers', '2'])
+            self.assertRaises(SystemExit, parse_arguments,
+                              ['match', '--keywords', 'k.txt', '--snapshot', 's.smac'])
+            self.assertRaises(SystemExit, parse_arguments,
+                              ['match', '--snapshot', 's.smac', '--engine', TRIE_WALK_ENGINE])
+            self.assertRaises(SystemExit, parse_arguments,
+                              ['match', '--snapshot', 's.smac', '--backend', NODE_BACKEND])
+            self.assertRaises(SystemExit, parse_arguments,
+                              ['match', '--keywords', 'k.txt', '--bytes', '--record-runtimes'])
+
+
+class TestKeywordMatchData(unittest.TestCase):
+
+    class CountingTrie(Trie):
+        def __init__(self):
+            super().__init__()
+            self.number_of_searches = 0
+
+        def find_matching_substrings(self, url):
+            self.number_of_searches += 1
+            return super().find_matching_substrings(url)
+
+    def test_build_keyword_match_data(self):
+        trie = self.CountingTrie()
+        trie.add_keyword('man')
+
+        self.assertEqual(build_keyword_match_data(trie, 'woman'), {'matches': ['man']})
+        self.assertEqual(trie.number_of_searches, 1)
+
+        match_data = build_keyword_match_data(trie, 'woman', record_runtimes=True)
+        self.assertEqual(match_data['matches'], ['man'])
+        self.assertTrue(isinstance(match_data['runtime_ns'], int))
+        self.assertEqual(trie.number_of_searches, 2)
+
+    def test_keyword_ids(self):
+        trie_builder = TrieBuilder()
+        trie_builder.user_keywords = {'woman', 'man', 'arm', 'army'}
+        trie = trie_builder.build_trie_from_list()[0]
+
+        self.assertEqual(trie.keywords, ['arm', 'army', 'man', 'woman'])
+        self.assertEqual(trie.find_matching_keyword_ids('Army-Woman'), {0, 1, 2, 3})
+        self.assertEqual(trie.find_matching_keyword_ids(''), set())
+        self.assertRaises(TypeError, trie.find_matching_keyword_ids, 2)
+
+        match_data = build_keyword_match_data(
+            trie, 'arms', record_runtimes=True, use_keyword_ids=True)
+        self.assertEqual(match_data['keyword_ids'], [0])
+        self.assertEqual(resolve_keyword_ids(trie, match_data), {
+            'matches': ['arm'], 'runtime_ns': match_data['runtime_ns']})
+        self.assertEqual(resolve_keyword_ids(trie, {'matches': []}), {'matches': []})
+
+    def test_keyword_ids_match_keywords_for_every_backend(self):
+        snapshot_directory = tempfile.TemporaryDirectory()
+        snapshot_path = os.path.join(snapshot_directory.name, 'keywords.bin')
+        compile_keywords_file('test_keywords.txt', snapshot_path)
+
+        with AutomatonSnapshot(snapshot_path) as snapshot:
+            for engine, backend in [(TRIE_WALK_ENGINE, NODE_BACKEND), (AHO_CORASICK_ENGINE, NODE_BACKEND),
+                                    (TRIE_WALK_ENGINE, COMPACT_BACKEND),
+                                    (AHO_CORASICK_ENGINE, COMPACT_BACKEND)]:
+                trie_builder = TrieBuilder(engine=engine, backend=backend)
+                trie_builder.file_name = 'test_keywords.txt'
+                trie = trie_builder.build_trie_from_file()[0]
+
+                for current_trie in [trie, snapshot]:
+                    self.assertEqual(
+                        {current_trie.get_keyword(keyword_id)
+                         for keyword_id in current_trie.find_matching_keyword_ids(TestTrie.invalid_url)},
+                        current_trie.find_matching_substrings(TestTrie.invalid_url)
+                    )
+
+                self.assertEqual(trie.keywords, [snapshot.get_keyword(keyword_id)
+                                                 for keyword_id in range(snapshot.keyword_count)])
+
+        snapshot_directory.cleanup()
+
+    def test_cli_searches_each_url_once(self):
+        cli = SubstringMatcherCli(record_runtimes=True)
+        cli.trie = self.CountingTrie()
+        cli.trie.add_keyword('man')
+        cli.urls = ['woman', 'manly', 'cat']
+        cli.search_url_list_for_matching_keywords()
+
+        self.assertEqual(cli.trie.number_of_searches, 3)
+        self.assertTrue(all('runtime_ns' in data for data in cli.keyword_search_results.values()))
+
+    def test_format_url_keyword_match_data(self):
+        self.assertNotIn('Runtime', format_url_keyword_match_data('woman', ['man']))
+        self.assertIn(
+            'Runtime: 1.5 milliseconds',
+            format_url_keyword_match_data('woman', ['man'], 1_500_000))
+
+
+class TestParallelMatcher(unittest.TestCase):
+    urls_file_path = 'substring_matcher/data/test_urls.txt'
+
+    def build_trie(self, engine=TRIE_WALK_ENGINE):
+        trie_builder = TrieBuilder(engine=engine)
+        trie_builder.file_name = 'test_keywords.txt'
+        return trie_builder.build_trie_from_file()[0]
+
+    def read_urls(self):
+        with open(self.urls_file_path, 'r', encoding='utf-8') as urls_file:
+            return [url.strip() for url in urls_file]
+
+    def test_split_file_into_byte_ranges(self):
+        self.assertRaises(
+            ValueError, split_file_into_byte_ranges, self.urls_file_path, 0)
+        self.assertRaises(
+            TypeError, split_file_into_byte_ranges, self.urls_file_path, '1')
+
+        for chunk_size_in_bytes in [1, 7, 64, 1000, 10 ** 9]:
+            byte_ranges = split_file_into_byte_ranges(
+                self.urls_file_path, chunk_size_in_bytes)
+            urls = [
+                url
+                for start, end in byte_ranges
+                for url in read_urls_in_byte_range(self.urls_file_path, start, end)
+            ]
+            self.assertEqual(urls, self.read_urls())
+
+    def test_match_urls_file_in_parallel(self):
+        for engine in [TRIE_WALK_ENGINE, AHO_CORASICK_ENGINE]:
+            trie = self.build_trie(engine)
+            results = list(match_urls_file_in_parallel(
+                trie, self.urls_file_path, number_of_workers=2, chunk_size_in_bytes=100))
+
+            self.assertEqual([url for url, _ in results], self.read_urls())
+
+            for url, match_data in results:
+                self.assertEqual(
+                    set(match_data['matches']), set(trie.find_matching_substrings(url)))
+
+    def test_invalid_utf8_url(self):
+        with tempfile.TemporaryDirectory() as directory_path:
+            urls_file_path = os.path.join(directory_path, 'urls.txt')
+            with open(urls_file_path, 'wb') as urls_file:
+                urls_file.write(b'\xff\nwoman.com\n')
+
+            results = list(match_urls_file_in_parallel(self.build_trie(), urls_file_path, number_of_workers=2))
+
+        self.assertEqual([url for url, _ in results], ['\ufffd', 'woman.com'])
+        self.assertEqual(results[0][1]['matches'], [])
+        self.assertIn('woman', results[1][1]['matches'])
+
+    def test_search_urls_file_in_parallel(self):
+        cli = SubstringMatcherCli()
+        cli.trie = self.build_trie()
+        cli.search_urls_file_in_parallel(
+            'test_urls.txt', number_of_workers=2, chunk_size_in_bytes=100)
+
+        self.assertEqual(list(cli.keyword_search_results), list(dict.fromkeys(self.read_urls())))
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_calculate_percentile(self):
+        self.assertEqual(calculate_percentile([5], 99), 5)
+        self.assertEqual(calculate_percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(calculate_percentile([0, 10], 95), 9.5)
+        self.assertRaises(ValueError, calculate_percentile, [], 50)
+
+    def test_summarize_runtimes(self):
+        summary = summarize_runtimes([2_000_000, 1_000_000, 3_000_000], 2, 1000)
+        self.assertEqual(summary['runs'], 3)
+        self.assertEqual(summary['p50_ms'], 2)
+        self.assertEqual(summary['min_ms'], 1)
+        self.assertEqual(summary['max_ms'], 3)
+        self.assertAlmostEqual(summary['urls_per_second'], 1000)
+        self.assertAlmostEqual(summary['megabytes_per_second'], 0.5)
+
+    def test_generators(self):
+        keywords = generate_keywords(50, random.Random(3))
+        self.assertEqual(len(keywords), 50)
+        self.assertTrue(all(SubstringMatcherCli.is_valid_keyword(keyword) for keyword in keywords))
+
+        url = generate_url(500, keywords, 0.5, random.Random(3))
+        self.assertEqual(len(url), 500)
+        self.assertEqual(url, generate_url(500, keywords, 0.5, random.Random(3)))
+        self.assertTrue(any(keyword in url for keyword in keywords))
+
+        self.assertEqual(
+            generate_url(200, keywords, 0.0, random.Random(3)).strip(
+                'abcdefghijklmnopqrstuvwxyz0123456789/.?=&'), '')
+        self.assertRaises(ValueError, generate_url, 10, keywords, 2, random.Random(3))
+
+    def test_benchmark_prefilter(self):
+        curve = benchmark_prefilter([5, 2000], [(TRIE_WALK_ENGINE, NODE_BACKEND)], 1, 0, 3, 2)
+
+        self.assertEqual([point['value'] for point in curve], [5, 2000])
+        results = [point['results'][f'{TRIE_WALK_ENGINE}/{NODE_BACKEND}'] for point in curve]
+        self.assertGreater(results[0]['selectivity'], results[1]['selectivity'])
+        self.assertTrue(all(result['speedup'] > 0 for result in results))
+
+
+class TestMatchingServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        trie_builder = TrieBuilder(engine=AHO_CORASICK_ENGINE)
+        trie_builder.file_name = 'test_keywords.txt'
+        self.trie = trie_builder.build_trie_from_file()[0]
+        self.generations = TrieGenerations(self.trie)
+        self.matching_server = MatchingServer(
+            self.generations, batch_size=8, max_pending_urls=4, max_line_length=64)
+        server = await self.matching_server.start_tcp('127.0.0.1', 0)
+        self.port = server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.matching_server.close()
+
+    async def send_urls(self, urls):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(''.join(f"{url}\n" for url in urls).encode('utf-8'))
+        await writer.drain()
+        writer.write_eof()
+
+        responses = [json.loads(line) async for line in reader]
+        writer.close()
+        await writer.wait_closed()
+        return responses
+
+    async def test_pipelined_clients(self):
+        with open('substring_matcher/data/test_urls.txt', 'r', encoding='utf-8') as urls_file:
+            urls = [url.strip() for url in urls_file]
+
+        first_responses, second_responses = await asyncio.gather(
+            self.send_urls(urls), self.send_urls(list(reversed(urls))))
+
+        self.assertEqual([response['url'] for response in first_responses], urls)
+        self.assertEqual([response['url'] for response in second_responses], list(reversed(urls)))
+
+        for response in first_responses + second_responses:
+            self.assertEqual(set(response['matches']),
+                             set(self.trie.find_matching_substrings(response['url'])))
+
+    def test_batch_uses_one_generation(self):
+        trie = self.generations.trie
+        match_many = trie.match_many
+
+        def match_many_then_swap(urls):
+            matches = match_many(urls)
+            self.generations.update_keywords(keywords_to_remove=['arm'])
+            return matches
+
+        with mock.patch.object(trie, 'match_many', side_effect=match_many_then_swap):
+            batch_matches = self.matching_server.match_batch(['army'])
+
+        self.assertIn('arm', batch_matches[0])
+        self.assertNotIn(None, batch_matches[0])
+
+    async def test_uses_latest_generation(self):
+        self.generations.update_keywords(['example'])
+        responses = await self.send_urls(['http://www.example.com/woman'])
+        self.assertEqual(set(responses[0]['matches']), {'example', 'man', 'woman'})
+
+    async def test_skips_long_lines(self):
+        responses = await self.send_urls(['woman.com', 'w' * 200, 'arm.com/' + 'x' * 100, 'cat.org'])
+
+        self.assertEqual([response['url'] for response in responses], ['woman.com', None, None, 'cat.org'])
+        self.assertIn('woman', responses[0]['matches'])
+        self.assertIn('longer than 64 bytes', responses[1]['error'])
+        self.assertIn('error', responses[2])
+        self.assertEqual(responses[3]['matches'], ['cat'])
+
+    async def test_failed_batch_only_fails_its_urls(self):
+        with mock.patch.object(self.matching_server, 'match_batch', side_effect=RuntimeError('broken')):
+            responses = await self.send_urls(['woman.com'])
+        self.assertEqual(responses, [{'url': 'woman.com', 'error': 'broken'}])
+
+        responses = await self.send_urls(['woman.com'])
+        self.assertIn('woman', responses[0]['matches'])
+
+    def test_build_warm_trie(self):
+        generations = build_warm_trie(os.path.join(os.path.dirname(__file__), 'data', 'test_keywords.txt'))
+
+        self.assertIsNotNone(generations.trie.transition_table)
+        self.assertFalse(generations.trie.is_automaton_built)
@@ -0,0 +1,351 @@
+from array import array
+from bisect import bisect_right
+from collections import deque
+from typing import Dict, Iterator, List, Set, Tuple
+
+# Joins the packed URLs. It never appears in a keyword, so
+# the automaton always returns to the root between URLs.
+URL_SEPARATOR: bytes = b'\n'
+
+
+def pack_urls(urls: List[str]) -> Tuple[bytes, array]:
+    """
+    Packs the URLs into one contiguous UTF-8 buffer and returns it
+    along with the offset where each URL starts.
+    """
+    url_offsets: array = array('Q')
+    encoded_urls: List[bytes] = []
+    current_offset: int = 0
+
+    for url in urls:
+        if not isinstance(url, str):
+            raise TypeError
+
+        encoded_url: bytes = url.encode('utf-8')
+        url_offsets.append(current_offset)
+        encoded_urls.append(encoded_url)
+        current_offset += len(encoded_url) + len(URL_SEPARATOR)
+
+    return (URL_SEPARATOR.join(encoded_urls), url_offsets)
+
+
+class TransitionTable:
+    """
+    A dense Aho-Corasick automaton over bytes. Every byte is first
+    mapped to a small class id (all bytes that never appear in a
+    keyword share class 0), so the table only needs one column per
+    distinct keyword byte instead of 256. Uppercase ASCII letters map
+    to the same class as their lowercase letter, which folds case
+    without copying the URL.
+    """
+
+    def __init__(self, keywords: List[str]):
+        # removed keywords are left as None to keep the ids in place
+        encoded_keywords: List[bytes] = [
+            keyword.encode('utf-8') if keyword is not None else b'' for keyword in keywords]
+        alphabet: List[int] = sorted({
+            byte_value for encoded_keyword in encoded_keywords for byte_value in encoded_keyword})
+
+        byte_classes: bytearray = bytearray(256)
+        for class_id, byte_value in enumerate(alphabet, start=1):
+            byte_classes[byte_value] = class_id
+
+        for byte_value in range(ord('A'), ord('Z') + 1):
+            byte_classes[byte_value] = byte_classes[byte_value + 32]
+
+        self.byte_classes: bytes = bytes(byte_classes)
+        self.width: int = len(alphabet) + 1
+        self.build_states(encoded_keywords)
+
+    def build_states(self, encoded_keywords: List[bytes]):
+        """
+        Builds the goto trie, then fills in every missing transition
+        with the transition of the failure state (breadth first).
+        """
+        byte_classes: bytes = self.byte_classes
+        width: int = self.width
+        children: List[dict] = [{}]
+        keyword_ids: List[list] = [[]]
+        depths: array = array('I', [0])
+
+        for keyword_id, encoded_keyword in enumerate(encoded_keywords):
+            if not encoded_keyword:
+                continue
+
+            state: int = 0
+            for byte_value in encoded_keyword:
+                class_id: int = byte_classes[byte_value]
+                if class_id not in children[state]:
+                    children[state][class_id] = len(children)
+                    children.append({})
+                    keyword_ids.append([])
+                    depths.append(depths[state] + 1)
+                state = children[state][class_id]
+            keyword_ids[state].append(keyword_id)
+
+        # States are stored premultiplied by the width, so the next
+        # state is transitions[state + class_id] with no multiply.
+        transitions: array = array('I', [0]) * (len(children) * width)
+        failure_links: array = array('I', [0]) * len(children)
+        queue: deque = deque()
+
+        for class_id, child_state in children[0].items():
+            transitions[class_id] = child_state * width
+            queue.append(child_state)
+
+        while queue:
+            state = queue.popleft()
+            failure_state: int = failure_links[state]
+            # the failure state is shallower, so its list is already complete
+            keyword_ids[state].extend(keyword_ids[failure_state])
+
+            for class_id in range(1, width):
+                child_state = children[state].get(class_id)
+                if child_state is None:
+                    transitions[state * width + class_id] = transitions[failure_state * width + class_id]
+                else:
+                    failure_links[child_state] = transitions[failure_state * width + class_id] // width
+                    transitions[state * width + class_id] = child_state * width
+                    queue.append(child_state)
+
+        self.transitions: array = transitions
+        # The failure links and depths are kept for add_keyword and
+        # remove_keyword. A transition to a state one deeper is a goto
+        # edge, so the goto trie itself does not need to be kept.
+        self.failure_links: array = failure_links
+        self.depths: array = depths
+        # premultiplied state -> ids of the keywords reported there
+        # (its own and those of the states on its failure chain)
+        self.output_keyword_ids: Dict[int, List[int]] = {
+            state * width: state_keyword_ids
+            for state, state_keyword_ids in enumerate(keyword_ids) if state_keyword_ids}
+        # rows of removed states, handed out again by add_state
+        self.free_states: List[int] = []
+        self.failure_children: Dict[int, Set[int]] = None
+
+    @property
+    def state_count(self) -> int:
+        return len(self.depths) - len(self.free_states)
+
+    def covers(self, encoded_keyword: bytes) -> bool:
+        """
+        Whether every byte of the keyword already has a class. A
+        keyword that does not has to be added by building the table
+        again, since it needs a new column in every row.
+        """
+        return all(self.byte_classes[byte_value] for byte_value in encoded_keyword)
+
+    def get_child_state(self, state: int, class_id: int) -> int:
+        """Returns the goto child of the state for the class, or None."""
+        child_state: int = self.transitions[state * self.width + class_id] // self.width
+        if child_state and self.depths[child_state] == self.depths[state] + 1:
+            return child_state
+
+        return None
+
+    def get_failure_children(self) -> Dict[int, Set[int]]:
+        """
+        Maps each state to the states whose failure link points at it.
+        Only the incremental updates need it, so it is built on the
+        first one and then kept up to date.
+        """
+        if self.failure_children is None:
+            self.failure_children = {}
+            for state in range(1, len(self.depths)):
+                self.failure_children.setdefault(self.failure_links[state], set()).add(state)
+
+        return self.failure_children
+
+    def iterate_failure_subtree(self, state: int) -> Iterator[int]:
+        """Yields the state and every state whose failure chain passes through it."""
+        failure_children: Dict[int, Set[int]] = self.get_failure_children()
+        states: List[int] = [state]
+
+        while states:
+            suffix_state: int = states.pop()
+            yield suffix_state
+            states.extend(failure_children.get(suffix_state, ()))
+
+    def move_failure_link(self, state: int, failure_state: int):
+        failure_children: Dict[int, Set[int]] = self.get_failure_children()
+        old_siblings: Set[int] = failure_children.get(self.failure_links[state])
+
+        if old_siblings is not None:
+            old_siblings.discard(state)
+            if not old_siblings:
+                del failure_children[self.failure_links[state]]
+
+        self.failure_links[state] = failure_state
+        failure_children.setdefault(failure_state, set()).add(state)
+
+    def add_keyword(self, keyword_id: int, encoded_keyword: bytes):
+        """
+        Adds a keyword without building the table again: each missing
+        state is added as a leaf by add_state, then the keyword id is
+        added to the states whose failure chain reaches its state.
+        Every byte of the keyword must already have a class (see covers).
+        """
+        if not self.covers(encoded_keyword):
+            raise ValueError("The keyword has bytes that the transition table has no class for")
+
+        state: int = 0
+        for byte_value in encoded_keyword:
+            class_id: int = self.byte_classes[byte_value]
+            child_state: int = self.get_child_state(state, class_id)
+            if child_state is None:
+                child_state = self.add_state(state, class_id)
+            state = child_state
+
+        for suffix_state in self.iterate_failure_subtree(state):
+            self.output_keyword_ids.setdefault(suffix_state * self.width, []).append(keyword_id)
+
+    def add_state(self, parent_state: int, class_id: int) -> int:
+        """
+        Adds a leaf state under the parent and patches only the rows
+        that change: the parent's goto, and the transitions on the
+        class of the states that end with the parent and have no goto
+        on it themselves. The states below those (their goto children)
+        get the new state as their failure state instead.
+        """
+        width: int = self.width
+        transitions: array = self.transitions
+        failure_children: Dict[int, Set[int]] = self.get_failure_children()
+        failure_state: int = 0
+        if parent_state != 0:
+            failure_state = transitions[self.failure_links[parent_state] * width + class_id] // width
+
+        state: int = self.free_states.pop() if self.free_states else len(self.depths)
+        transitions[parent_state * width + class_id] = state * width
+        # A leaf has no goto edges, so its row is the failure state's
+        # row. The failure state can be the parent (as for 'aa' under
+        # 'a'), so the row is copied after the parent's goto is set.
+        failure_row: array = transitions[failure_state * width:(failure_state + 1) * width]
+
+        if state < len(self.depths):
+            transitions[state * width:(state + 1) * width] = failure_row
+            self.failure_links[state] = failure_state
+            self.depths[state] = self.depths[parent_state] + 1
+        else:
+            transitions.extend(failure_row)
+            self.failure_links.append(failure_state)
+            self.depths.append(self.depths[parent_state] + 1)
+
+        if failure_state * width in self.output_keyword_ids:
+            self.output_keyword_ids[state * width] = list(self.output_keyword_ids[failure_state * width])
+
+        suffix_states: List[int] = list(failure_children.get(parent_state, ()))
+
+        while suffix_states:
+            suffix_state: int = suffix_states.pop()
+            child_state: int = self.get_child_state(suffix_state, class_id)
+            if child_state is None:
+                transitions[suffix_state * width + class_id] = state * width
+                suffix_states.extend(failure_children.get(suffix_state, ()))
+            else:
+                self.move_failure_link(child_state, state)
+
+        failure_children.setdefault(failure_state, set()).add(state)
+
+        return state
+
+    def remove_keyword(self, keyword_id: int, encoded_keyword: bytes):
+        """
+        Removes a keyword without building the table again: the keyword
+        id is dropped from the states whose failure chain reaches its
+        state, then the states that no longer lead to any keyword are
+        removed by remove_state, deepest first.
+        """
+        path: List[Tuple[int, int]] = []
+        state: int = 0
+
+        for byte_value in encoded_keyword:
+            class_id: int = self.byte_classes[byte_value]
+            child_state: int = self.get_child_state(state, class_id) if class_id else None
+            if child_state is None:
+                return
+            path.append((state, class_id))
+            state = child_state
+
+        for suffix_state in self.iterate_failure_subtree(state):
+            suffix_keyword_ids: List[int] = self.output_keyword_ids[suffix_state * self.width]
+            suffix_keyword_ids.remove(keyword_id)
+            if not suffix_keyword_ids:
+                del self.output_keyword_ids[suffix_state * self.width]
+
+        for parent_state, class_id in reversed(path):
+            # a state has keywords of its own if it reports more than its failure state
+            own_keyword_count: int = (
+                len(self.output_keyword_ids.get(state * self.width, ()))
+                - len(self.output_keyword_ids.get(self.failure_links[state] * self.width, ())))
+            if own_keyword_count or any(
+                    self.get_child_state(state, child_class_id) is not None
+                    for child_class_id in range(1, self.width)):
+                break
+            self.remove_state(parent_state, class_id, state)
+            state = parent_state
+
+    def remove_state(self, parent_state: int, class_id: int, state: int):
+        """
+        Removes a leaf state that no keyword ends at. The states that
+        failed to it now fail to its failure state, and the transitions
+        that led to it are filled in again from their failure states,
+        parents first, just as build_states fills them in.
+        """
+        width: int = self.width
+        transitions: array = self.transitions
+        failure_children: Dict[int, Set[int]] = self.get_failure_children()
+        failure_state: int = self.failure_links[state]
+
+        for suffix_state in list(failure_children.get(state, ())):
+            self.move_failure_link(suffix_state, failure_state)
+        failure_children.pop(state, None)
+        failure_children[failure_state].discard(state)
+        if not failure_children[failure_state]:
+            del failure_children[failure_state]
+
+        if parent_state == 0:
+            transitions[class_id] = 0
+        else:
+            transitions[parent_state * width + class_id] = (
+                transitions[self.failure_links[parent_state] * width + class_id])
+
+        suffix_states: List[int] = list(failure_children.get(parent_state, ()))
+        while suffix_states:
+            suffix_state: int = suffix_states.pop()
+            if self.get_child_state(suffix_state, class_id) is None:
+                transitions[suffix_state * width + class_id] = (
+                    transitions[self.failure_links[suffix_state] * width + class_id])
+                suffix_states.extend(failure_children.get(suffix_state, ()))
+
+        self.output_keyword_ids.pop(state * width, None)
+        self.free_states.append(state)
+
+    def match_buffer(self, buffer: bytes, url_offsets: array, keyword_count: int) -> Tuple[array, array]:
+        """
+        Runs the automaton over the whole packed buffer in one loop.
+        Returns parallel arrays of URL indexes and keyword ids, with
+        each (URL, keyword) pair reported once.
+        """
+        classes: bytes = buffer.translate(self.byte_classes)
+        transitions: array = self.transitions
+        output_keyword_ids: Dict[int, List[int]] = self.output_keyword_ids
+        # last_url_for_keyword[k] is one more than the last URL index
+        # that reported keyword k, so no set is needed per URL.
+        last_url_for_keyword: array = array('Q', [0]) * keyword_count
+        url_indexes: array = array('I')
+        keyword_ids: array = array('I')
+        state: int = 0
+
+        for position, class_id in enumerate(classes):
+            state = transitions[state + class_id]
+            if state not in output_keyword_ids:
+                continue
+
+            url_index: int = bisect_right(url_offsets, position) - 1
+            for keyword_id in output_keyword_ids[state]:
+                if last_url_for_keyword[keyword_id] != url_index + 1:
+                    last_url_for_keyword[keyword_id] = url_index + 1
+                    url_indexes.append(url_index)
+                    keyword_ids.append(keyword_id)
+
+        return (url_indexes, keyword_ids)
@@ -1,4 +1,15 @@
-from typing import Set
+from array import array
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from substring_matcher.constants import (
+    AHO_CORASICK_ENGINE,
+    ALL_MATCHES,
+    MATCHING_ENGINES,
+    TRIE_WALK_ENGINE
+)
+from substring_matcher.match_spans import Span, select_matching_spans
+from substring_matcher.transition_table import TransitionTable, pack_urls
 
 
 class TrieNode:
@@ -11,13 +22,40 @@ class TrieNode:
         self.letter: str = letter
         self.children: dict = {}
         self.is_end_of_word: bool = False
+        self.keyword: str = None
+        self.keyword_id: int = None
+        self.failure_link: TrieNode = None
+        self.output_link: TrieNode = None
 
 
 class Trie:
     """Each instances represents the Trie tree that gets created"""
 
-    def __init__(self):
+    def __init__(self, *, engine: str = TRIE_WALK_ENGINE):
+        if not isinstance(engine, str):
+            raise TypeError
+
+        if engine not in MATCHING_ENGINES:
+            raise ValueError(f"Engine must be one of {MATCHING_ENGINES}")
+
         self.root: TrieNode = TrieNode("*")
+        self.engine: str = engine
+        self.is_automaton_built: bool = False
+        self.keywords: List[str] = []
+        self.transition_table: TransitionTable = None
+        # built by update_keywords (see get_failure_children)
+        self.failure_children: Dict[TrieNode, Set[TrieNode]] = None
+        # bumped whenever a keyword is added or removed, so that
+        # caches of match results can tell they are out of date
+        self.keyword_set_version: int = 0
+
+    @property
+    def keyword_count(self) -> int:
+        """
+        The number of keyword ids handed out so far. Removed
+        keywords still count, since their ids are not reused.
+        """
+        return len(self.keywords)
 
     def add_keyword(self, keyword: str):
         """
@@ -35,7 +73,307 @@ class Trie:
                 current_node.children[letter]: TrieNode = TrieNode(letter)
             current_node = current_node.children[letter]
 
+        if not current_node.is_end_of_word:
+            current_node.keyword_id = len(self.keywords)
+            self.keywords.append(keyword.lower())
+            self.keyword_set_version += 1
+
         current_node.is_end_of_word = True
+        current_node.keyword = keyword.lower()
+        self.is_automaton_built = False
+        self.transition_table = None
+
+    def add_sorted_keywords(self, keywords: List[str]):
+        """
+        Adds many lowercase keywords at once. When the keywords are
+        sorted, each one shares its prefix with the one before it, so
+        the walk starts from the node where the previous keyword left
+        off instead of at the root. Any order still gives the right
+        trie, just with less of the walk skipped.
+        """
+        if not isinstance(keywords, list):
+            raise TypeError
+
+        path: List[TrieNode] = [self.root]
+        previous_keyword: str = ""
+
+        for keyword in keywords:
+            if not isinstance(keyword, str):
+                raise TypeError
+
+            shared_length: int = 0
+            shortest_length: int = min(len(keyword), len(previous_keyword))
+            while shared_length < shortest_length and keyword[shared_length] == previous_keyword[shared_length]:
+                shared_length += 1
+
+            del path[shared_length + 1:]
+            current_node: TrieNode = path[shared_length]
+
+            for letter in keyword[shared_length:]:
+                child_node: TrieNode = current_node.children.get(letter)
+                if child_node is None:
+                    child_node = current_node.children[letter] = TrieNode(letter)
+                current_node = child_node
+                path.append(current_node)
+
+            if not current_node.is_end_of_word:
+                current_node.is_end_of_word = True
+                current_node.keyword = keyword
+                current_node.keyword_id = len(self.keywords)
+                self.keywords.append(keyword)
+                self.keyword_set_version += 1
+
+            previous_keyword = keyword
+
+        self.is_automaton_built = False
+        self.transition_table = None
+
+    def remove_keyword(self, keyword: str) -> bool:
+        """
+        Removes the keyword from the Trie and prunes the nodes that
+        no longer lead to any keyword. Returns False if the keyword
+        was not in the Trie. The keyword's id is not handed out again,
+        so ids stay stable for the keywords that remain.
+        """
+        if not isinstance(keyword, str):
+            raise TypeError
+
+        path: List[Tuple[TrieNode, str]] = []
+        current_node: TrieNode = self.root
+
+        for letter in keyword.lower():
+            if letter not in current_node.children:
+                return False
+            path.append((current_node, letter))
+            current_node = current_node.children[letter]
+
+        if not current_node.is_end_of_word:
+            return False
+
+        if current_node.keyword_id is not None:
+            self.keywords[current_node.keyword_id] = None
+
+        current_node.is_end_of_word = False
+        current_node.keyword = None
+        current_node.keyword_id = None
+
+        for parent_node, letter in reversed(path):
+            child_node: TrieNode = parent_node.children[letter]
+            if child_node.children or child_node.is_end_of_word:
+                break
+            del parent_node.children[letter]
+
+        # The failure and output links can point at any node, so
+        # they are recomputed (without rebuilding the trie itself)
+        # before the next automaton search.
+        self.is_automaton_built = False
+        self.transition_table = None
+        self.keyword_set_version += 1
+
+        return True
+
+    def update_keywords(self, keywords_to_add: Iterable[str] = (), keywords_to_remove: Iterable[str] = ()):
+        """
+        Removes and then adds keywords the way remove_keyword and
+        add_keyword do, but keeps the automaton links and the transition
+        table when they are built, patching only the nodes that a changed
+        keyword reaches (see link_new_node and unlink_pruned_node). A
+        keyword with a byte that no keyword had before still drops the
+        transition table, since every row needs a new column for it.
+        """
+        transition_table: TransitionTable = self.transition_table
+
+        for keyword in keywords_to_remove:
+            if not isinstance(keyword, str):
+                raise TypeError
+
+            path: List[TrieNode] = [self.root]
+            for letter in keyword.lower():
+                path.append(path[-1].children.get(letter))
+                if path[-1] is None:
+                    break
+
+            keyword_node: TrieNode = path[-1]
+            if keyword_node is None or keyword_node is self.root or not keyword_node.is_end_of_word:
+                continue
+
+            if keyword_node.keyword_id is not None:
+                if transition_table is not None:
+                    transition_table.remove_keyword(keyword_node.keyword_id, keyword_node.keyword.encode('utf-8'))
+                self.keywords[keyword_node.keyword_id] = None
+            if self.is_automaton_built:
+                self.relink_outputs(keyword_node, keyword_node.output_link)
+
+            keyword_node.is_end_of_word = False
+            keyword_node.keyword = None
+            keyword_node.keyword_id = None
+
+            for parent_node, child_node in zip(reversed(path[:-1]), reversed(path[1:])):
+                if child_node.children or child_node.is_end_of_word:
+                    break
+                del parent_node.children[child_node.letter]
+                if self.is_automaton_built:
+                    self.unlink_pruned_node(child_node)
+
+            self.keyword_set_version += 1
+
+        for keyword in keywords_to_add:
+            if not isinstance(keyword, str):
+                raise TypeError
+
+            current_node: TrieNode = self.root
+            for letter in keyword.lower():
+                child_node: TrieNode = current_node.children.get(letter)
+                if child_node is None:
+                    child_node = TrieNode(letter)
+                    if self.is_automaton_built:
+                        self.link_new_node(current_node, child_node)
+                    current_node.children[letter] = child_node
+                current_node = child_node
+
+            if current_node is self.root or current_node.is_end_of_word:
+                continue
+
+            current_node.is_end_of_word = True
+            current_node.keyword = keyword.lower()
+            current_node.keyword_id = len(self.keywords)
+            self.keywords.append(current_node.keyword)
+            self.keyword_set_version += 1
+
+            if self.is_automaton_built:
+                self.relink_outputs(current_node, current_node)
+            if transition_table is not None:
+                encoded_keyword: bytes = current_node.keyword.encode('utf-8')
+                if transition_table.covers(encoded_keyword):
+                    transition_table.add_keyword(current_node.keyword_id, encoded_keyword)
+                else:
+                    transition_table = None
+
+        self.transition_table = transition_table
+
+    def get_failure_children(self) -> Dict[TrieNode, Set[TrieNode]]:
+        """
+        Maps each node to the nodes whose failure link points at it.
+        Only update_keywords needs it, so it is built on its first call
+        and kept up to date from then on, until build_automaton runs.
+        """
+        if self.failure_children is None:
+            self.failure_children = {}
+            nodes: List[TrieNode] = [self.root]
+
+            while nodes:
+                current_node: TrieNode = nodes.pop()
+                for child_node in current_node.children.values():
+                    self.failure_children.setdefault(child_node.failure_link, set()).add(child_node)
+                    nodes.append(child_node)
+
+        return self.failure_children
+
+    def move_failure_link(self, node: TrieNode, failure_node: TrieNode):
+        failure_children: Dict[TrieNode, Set[TrieNode]] = self.get_failure_children()
+        old_siblings: Set[TrieNode] = failure_children.get(node.failure_link)
+
+        if old_siblings is not None:
+            old_siblings.discard(node)
+            if not old_siblings:
+                del failure_children[node.failure_link]
+
+        node.failure_link = failure_node
+        failure_children.setdefault(failure_node, set()).add(node)
+
+    def link_new_node(self, parent_node: TrieNode, new_node: TrieNode):
+        """
+        Links a leaf that is about to be added under the parent (nothing
+        here reads the parent's children). Its own links are computed as
+        in build_automaton. Then the nodes that end with
+        the parent's text are visited (through the failure links, in
+        reverse), and those with a child for the new letter now fail to
+        the new node. The walk stops below them, since the nodes further
+        down already fail to something longer.
+        """
+        root: TrieNode = self.root
+        letter: str = new_node.letter
+        failure_children: Dict[TrieNode, Set[TrieNode]] = self.get_failure_children()
+        failure_node: TrieNode = root
+
+        if parent_node is not root:
+            fallback_node: TrieNode = parent_node.failure_link
+            while fallback_node is not root and letter not in fallback_node.children:
+                fallback_node = fallback_node.failure_link
+            failure_node = fallback_node.children.get(letter, root)
+
+        new_node.failure_link = failure_node
+        if failure_node is not root and failure_node.is_end_of_word:
+            new_node.output_link = failure_node
+        else:
+            new_node.output_link = failure_node.output_link
+
+        suffix_nodes: List[TrieNode] = list(failure_children.get(parent_node, ()))
+        while suffix_nodes:
+            suffix_node: TrieNode = suffix_nodes.pop()
+            child_node: TrieNode = suffix_node.children.get(letter)
+            if child_node is None:
+                suffix_nodes.extend(failure_children.get(suffix_node, ()))
+            else:
+                self.move_failure_link(child_node, new_node)
+
+        failure_children.setdefault(failure_node, set()).add(new_node)
+
+    def unlink_pruned_node(self, pruned_node: TrieNode):
+        """
+        Unlinks a leaf that was just pruned. No keyword ended at it, so
+        only the nodes that failed to it change: they fail to its own
+        failure node, the next longest suffix of their text.
+        """
+        failure_children: Dict[TrieNode, Set[TrieNode]] = self.get_failure_children()
+
+        for suffix_node in list(failure_children.get(pruned_node, ())):
+            self.move_failure_link(suffix_node, pruned_node.failure_link)
+
+        failure_children.pop(pruned_node, None)
+        siblings: Set[TrieNode] = failure_children[pruned_node.failure_link]
+        siblings.discard(pruned_node)
+        if not siblings:
+            del failure_children[pruned_node.failure_link]
+
+    def relink_outputs(self, keyword_node: TrieNode, output_node: TrieNode):
+        """
+        Points the output links that lead past the keyword node at the
+        output node: the keyword node itself when a keyword now ends at
+        it, or its own output link when its keyword is removed. Nodes
+        where another keyword ends, and the nodes below them, are not
+        visited, since their output links stop before the keyword node.
+        """
+        failure_children: Dict[TrieNode, Set[TrieNode]] = self.get_failure_children()
+        suffix_nodes: List[TrieNode] = list(failure_children.get(keyword_node, ()))
+
+        while suffix_nodes:
+            suffix_node: TrieNode = suffix_nodes.pop()
+            suffix_node.output_link = output_node
+            if not suffix_node.is_end_of_word:
+                suffix_nodes.extend(failure_children.get(suffix_node, ()))
+
+    def copy(self) -> 'Trie':
+        """
+        Returns a copy of the Trie with the same keyword ids.
+        The automaton links are not copied, since they get built
+        again for the copy.
+        """
+        new_trie = Trie(engine=self.engine)
+        new_trie.keywords = list(self.keywords)
+        nodes_to_copy: List[Tuple[TrieNode, TrieNode]] = [(self.root, new_trie.root)]
+
+        while nodes_to_copy:
+            current_node, new_node = nodes_to_copy.pop()
+            new_node.is_end_of_word = current_node.is_end_of_word
+            new_node.keyword = current_node.keyword
+            new_node.keyword_id = current_node.keyword_id
+
+            for letter, child_node in current_node.children.items():
+                new_node.children[letter] = TrieNode(letter)
+                nodes_to_copy.append((child_node, new_node.children[letter]))
+
+        return new_trie
 
     def does_word_exist(self, word: str) -> bool:
         """
@@ -57,7 +395,7 @@ class Trie:
 
         return current_node.is_end_of_word
 
-    def find_matching_substrings(self, url: str) -> list:
+    def find_matching_substrings(self, url: str, *, search_steps: List[int] = None) -> list:
         """
         Creates a list/array to determine all of the matching substrings
         from the URL that is passed to it.
@@ -69,38 +407,264 @@ class Trie:
         if url == "":
             return {}
 
-        url = url.lower()
-        current_substring: str = ''
-        matching_keywords: Set[str] = set()
-        parent_node: TrieNode = self.root
+        return {node.keyword for node, _ in self.iterate_matching_nodes(url.lower(), search_steps)}
 
-        for index, outer_character in enumerate(url):
-            if outer_character in parent_node.children:
-                current_substring += outer_character
-                parent_node = parent_node.children[outer_character]
-                remaining_url = url[index+1:]
+    def find_matching_keyword_ids(self, url: str, *, url_is_lowercase: bool = False,
+                                  search_steps: List[int] = None) -> Set[int]:
+        """
+        Works like find_matching_substrings, but returns the ids of the
+        matching keywords, so no strings get built while matching.
+        Use get_keyword to turn an id back into its keyword.
 
-                # Iterates over the remaining part of the string
-                # instead of starting at the beginning.
-                for inner_character in remaining_url:
-                    if parent_node.is_end_of_word:
-                        matching_keywords.add(current_substring)
+        Wrappers that have lowercased the URL already (see
+        KeywordPrefilter) pass url_is_lowercase, so it is
+        not lowercased a second time. InstrumentedTrie passes
+        search_steps to count the steps of the search (see
+        iterate_matching_nodes).
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if url == "":
+            return set()
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        return {node.keyword_id for node, _ in self.iterate_matching_nodes(url, search_steps)}
+
+    def get_keyword(self, keyword_id: int) -> str:
+        """Returns the keyword that was given the id."""
+        return self.keywords[keyword_id]
+
+    def find_matching_spans(self, url: str, match_kind: str = ALL_MATCHES, *,
+                            url_is_lowercase: bool = False, search_steps: List[int] = None) -> List[Span]:
+        """
+        Returns a (start, end, keyword_id) span for every match in the
+        (lowercase) URL, sorted by where they start. The match_kind
+        picks which of the overlapping matches are kept (see
+        select_matching_spans), and they all come out of the same
+        single search.
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        spans: List[Span] = [
+            (end - len(node.keyword), end, node.keyword_id)
+            for node, end in self.iterate_matching_nodes(url, search_steps)
+        ]
+
+        return select_matching_spans(spans, match_kind)
+
+    def has_any_match(self, url: str, *, url_is_lowercase: bool = False,
+                      search_steps: List[int] = None) -> bool:
+        """
+        Checks whether any keyword is in the URL, and stops
+        searching at the first one it finds.
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        if not url_is_lowercase:
+            url = url.lower()
 
-                    if inner_character in parent_node.children:
-                        current_substring += inner_character
-                        parent_node = parent_node.children[inner_character]
+        matching_nodes: Iterator[Tuple[TrieNode, int]] = self.iterate_matching_nodes(url, search_steps)
+        any_match: bool = next(matching_nodes, None) is not None
+        matching_nodes.close()
 
-                    # resets variable values and breaks out of the inner loop
-                    else:
+        return any_match
+
+    def find_matching_nodes(self, url: str) -> Set[TrieNode]:
+        """
+        Returns the end-of-word nodes of every keyword found in
+        the (lowercase) URL using the trie's engine.
+        """
+        return {node for node, _ in self.iterate_matching_nodes(url)}
+
+    def iterate_matching_nodes(self, url: str,
+                               search_steps: List[int] = None) -> Iterator[Tuple[TrieNode, int]]:
+        """
+        Yields (node, end) for every keyword in the (lowercase) URL as
+        the engine finds it, overlapping and repeated ones included,
+        where node is the keyword's end-of-word node and the keyword
+        ends just before url[end]. Every search above runs on it.
+
+        Only when given a [transitions, root_restarts] list as
+        search_steps does the search count its steps into it (see
+        walk_matching_nodes_counting_steps), so the searches that do
+        not ask for the counts pay nothing for them.
+        """
+        if search_steps is not None:
+            return self.walk_matching_nodes_counting_steps(url, search_steps)
+
+        return self.walk_matching_nodes(url)
+
+    def walk_matching_nodes(self, url: str) -> Iterator[Tuple[TrieNode, int]]:
+        """
+        The trie walk engine walks the trie from the root at every
+        character of the URL. The Aho-Corasick engine finds every
+        keyword in a single pass, since a mismatch follows a failure
+        link instead of restarting at the root.
+        """
+        root: TrieNode = self.root
+
+        if self.engine != AHO_CORASICK_ENGINE:
+            url_length: int = len(url)
+
+            for start in range(url_length):
+                current_node: TrieNode = root.children.get(url[start])
+                position: int = start
+
+                # Iterates over the remaining part of the string
+                # without copying it.
+                while current_node is not None:
+                    if current_node.is_end_of_word:
+                        yield (current_node, position + 1)
+
+                    position += 1
+                    if position == url_length:
                         break
+                    current_node = current_node.children.get(url[position])
+            return
+
+        if not self.is_automaton_built:
+            self.build_automaton()
+
+        current_node = root
+
+        for position, character in enumerate(url):
+            while current_node is not root and character not in current_node.children:
+                current_node = current_node.failure_link
+            current_node = current_node.children.get(character, root)
+
+            if current_node is root:
+                continue
+
+            matched_node: TrieNode = (
+                current_node if current_node.is_end_of_word else current_node.output_link)
+
+            # every keyword on the output chain ends here
+            while matched_node is not None:
+                yield (matched_node, position + 1)
+                matched_node = matched_node.output_link
+
+    def walk_matching_nodes_counting_steps(self, url: str,
+                                           search_steps: List[int]) -> Iterator[Tuple[TrieNode, int]]:
+        """
+        Works like walk_matching_nodes, but also adds how many trie
+        transitions the search took (failure links included) and how
+        many times it started over at the root to search_steps, even
+        when the caller stops early. It is only used for instrumentation.
+        """
+        root: TrieNode = self.root
+        transitions: int = 0
+        root_restarts: int = 0
+
+        try:
+            if self.engine != AHO_CORASICK_ENGINE:
+                url_length: int = len(url)
+
+                for start in range(url_length):
+                    root_restarts += 1
+                    current_node: TrieNode = root.children.get(url[start])
+                    position: int = start
+
+                    while current_node is not None:
+                        transitions += 1
+                        if current_node.is_end_of_word:
+                            yield (current_node, position + 1)
+
+                        position += 1
+                        if position == url_length:
+                            break
+                        current_node = current_node.children.get(url[position])
+                return
+
+            if not self.is_automaton_built:
+                self.build_automaton()
+
+            current_node = root
+
+            for position, character in enumerate(url):
+                while current_node is not root and character not in current_node.children:
+                    current_node = current_node.failure_link
+                    transitions += 1
+                current_node = current_node.children.get(character, root)
+
+                if current_node is root:
+                    root_restarts += 1
+                    continue
+                transitions += 1
+
+                matched_node: TrieNode = (
+                    current_node if current_node.is_end_of_word else current_node.output_link)
+
+                while matched_node is not None:
+                    yield (matched_node, position + 1)
+                    matched_node = matched_node.output_link
+        finally:
+            search_steps[0] += transitions
+            search_steps[1] += root_restarts
+
+    def build_automaton(self):
+        """
+        Computes the failure and output links for every node with a
+        breadth-first pass. It runs once after the keywords are added
+        and again only if more keywords are added later.
+        """
+        root: TrieNode = self.root
+        root.failure_link = root
+        root.output_link = None
+        queue: deque = deque()
+
+        for child_node in root.children.values():
+            child_node.failure_link = root
+            child_node.output_link = None
+            queue.append(child_node)
+
+        while queue:
+            current_node: TrieNode = queue.popleft()
+
+            for letter, child_node in current_node.children.items():
+                fallback_node: TrieNode = current_node.failure_link
+                while fallback_node is not root and letter not in fallback_node.children:
+                    fallback_node = fallback_node.failure_link
+
+                failure_node: TrieNode = fallback_node.children.get(letter, root)
+                child_node.failure_link = failure_node
+
+                if failure_node is not root and failure_node.is_end_of_word:
+                    child_node.output_link = failure_node
                 else:
-                    if current_substring and parent_node.is_end_of_word:
-                        matching_keywords.add(current_substring)
+                    child_node.output_link = failure_node.output_link
+
+                queue.append(child_node)
+
+        self.is_automaton_built = True
+        self.failure_children = None
+
+    def match_many(self, urls: List[str]) -> Tuple[array, array]:
+        """
+        Matches a batch of URLs at once. The URLs are packed into one
+        buffer and a dense transition table runs over all of it in a
+        single loop, which avoids the per-URL call overhead on short
+        URLs. Returns two parallel arrays: the index of the URL and
+        the id of the keyword (see self.keywords) for each match.
+        Case is only folded for ASCII letters.
+        """
+        buffer, url_offsets = pack_urls(urls)
+
+        return self.get_transition_table().match_buffer(buffer, url_offsets, len(self.keywords))
 
-                current_substring = ''
-                parent_node = self.root
+    def get_transition_table(self) -> TransitionTable:
+        """Builds the dense transition table the first time it is needed."""
+        if self.transition_table is None:
+            self.transition_table = TransitionTable(self.keywords)
 
-        return matching_keywords
+        return self.transition_table
 
     def build_trie_word_list(self, node: TrieNode) -> list:
         """
@@ -1,19 +1,57 @@
-from substring_matcher.constants import SUBSTRING_MATCHER_DATA_PATH
+from substring_matcher.compact_trie import NO_NODE, CompactTrie
+from substring_matcher.dawg import Dawg
+from substring_matcher.constants import (
+    AHO_CORASICK_ENGINE,
+    COMPACT_BACKEND,
+    DAWG_BACKEND,
+    NODE_BACKEND,
+    SUBSTRING_MATCHER_DATA_PATH,
+    TRIE_BACKENDS,
+    TRIE_WALK_ENGINE
+)
 from substring_matcher.utils.file_paths import resource_path
 from substring_matcher.trie import Trie
+import gc
+from itertools import groupby
+import multiprocessing
 import os
 import re
-from typing import Set
+import time
+from typing import List, Pattern, Set
+
+# A valid keyword contains only alpha characters,
+# underscores, and/or hyphens.
+VALID_KEYWORD_PATTERN: Pattern = re.compile("[A-Za-z_-]*")
 
 
 class TrieBuilder:
 
-    def __init__(self):
+    def __init__(self, *, engine: str = TRIE_WALK_ENGINE, backend: str = NODE_BACKEND):
+        if backend not in TRIE_BACKENDS:
+            raise ValueError(f"Backend must be one of {TRIE_BACKENDS}")
+
         self.file_name: str = ""
         self.user_keywords: Set[str] = set()
         self.invalid_keywords: Set[str] = set()
-        self.trie: Trie = Trie()
+        self.engine: str = engine
+        self.backend: str = backend
+        self.trie: Trie = self.create_trie()
         self.current_normalized_keyword: str = ""
+        self.build_stats: dict = {}
+
+    def create_trie(self):
+        """
+        Creates an empty trie for the builder's engine. The compact
+        backend stores the nodes in flat arrays instead of TrieNodes,
+        and the dawg backend also merges the nodes of shared suffixes.
+        """
+        if self.backend == COMPACT_BACKEND:
+            return CompactTrie(engine=self.engine)
+
+        if self.backend == DAWG_BACKEND:
+            return Dawg(engine=self.engine)
+
+        return Trie(engine=self.engine)
 
     def build_trie_from_file(self) -> tuple:
         """
@@ -33,11 +71,166 @@ class TrieBuilder:
 
         keywords_file_path: str = resource_path(
             f"{SUBSTRING_MATCHER_DATA_PATH}/{self.file_name}")
+
+        return self.build_trie_from_file_path(keywords_file_path)
+
+    def build_trie_from_file_path(self, keywords_file_path: str) -> tuple:
+        """
+        Works like build_trie_from_file, but takes the path to a
+        keywords file anywhere on disk instead of a file name
+        inside of the data folder.
+        """
+        if not isinstance(keywords_file_path, str):
+            raise TypeError
+
         self.process_keywords_file(keywords_file_path)
         self.reset_current_normalized_keyword()
 
         return (self.trie, self.invalid_keywords)
 
+    def bulk_load_trie_from_file_path(self, keywords_file_path: str) -> tuple:
+        """
+        Works like build_trie_from_file_path, but is built for huge
+        keyword files. The whole file is read in one go, the keywords
+        are deduplicated and validated together, and the valid ones
+        are added in sorted order with trie.add_sorted_keywords, so
+        keywords that share a prefix also share the walk down to it.
+
+        Blank lines are skipped, and the keyword ids follow the sorted
+        order (like build_trie_from_list) instead of the file order.
+        The counts and throughput end up in self.build_stats.
+        """
+        start_time: int = time.perf_counter_ns()
+        keywords: List[str] = self.read_keywords_file_in_bulk(keywords_file_path)
+        number_of_keywords_before: int = self.trie.keyword_count
+
+        # Every new TrieNode counts towards the garbage collector's
+        # next pass, and with millions of them it would scan the whole
+        # (still growing) trie over and over, so it waits until the end.
+        was_gc_enabled: bool = gc.isenabled()
+        gc.disable()
+        try:
+            self.trie.add_sorted_keywords(keywords)
+        finally:
+            if was_gc_enabled:
+                gc.enable()
+
+        self.finish_build_stats(start_time, number_of_keywords_before)
+
+        return (self.trie, self.invalid_keywords)
+
+    def build_trie_in_parallel_from_file_path(self, keywords_file_path: str,
+                                              number_of_workers: int) -> tuple:
+        """
+        Works like bulk_load_trie_from_file_path, but splits the
+        keywords by their first character and builds the sub-tries in
+        a pool of worker processes. Each sub-trie is then grafted under
+        the root, and the Aho-Corasick links (for that engine) are built
+        in one final pass over the whole trie.
+
+        Only the compact backend is supported, since its flat arrays
+        are cheap to send back from the workers, while pickling a tree
+        of TrieNodes takes longer than building it.
+
+        When the trie already has keywords, the partitions whose first
+        character is already a child of the root cannot be grafted, so
+        they are added to the trie directly before anything is grafted.
+        """
+        if not isinstance(number_of_workers, int):
+            raise TypeError
+
+        if number_of_workers < 1:
+            raise ValueError("The number of workers must be at least 1")
+
+        if self.backend != COMPACT_BACKEND:
+            raise ValueError(f"Building in parallel needs the {COMPACT_BACKEND} backend")
+
+        start_time: int = time.perf_counter_ns()
+        keywords: List[str] = self.read_keywords_file_in_bulk(keywords_file_path)
+        number_of_keywords_before: int = self.trie.keyword_count
+        partitions: List[List[str]] = partition_keywords_by_first_character(keywords)
+        grafted_partitions: List[List[str]] = []
+
+        for partition in partitions:
+            if self.trie.find_unpacked_child(0, ord(partition[0][0])) == NO_NODE:
+                grafted_partitions.append(partition)
+            else:
+                self.trie.add_sorted_keywords(partition)
+
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+
+        # The size of each sub-trie follows from the sorted keywords, so
+        # the workers can also renumber the nodes before sending them
+        # back, and grafting only has to join the arrays.
+        partition_arguments: List[tuple] = []
+        node_offset: int = self.trie.node_count - 1
+        keyword_offset: int = self.trie.keyword_count
+
+        for partition in grafted_partitions:
+            partition_arguments.append((partition, node_offset, keyword_offset))
+            node_offset += count_partition_nodes(partition)
+            keyword_offset += len(partition)
+
+        with context.Pool(min(number_of_workers, max(len(grafted_partitions), 1))) as pool:
+            for partition_trie in pool.starmap(build_keyword_partition, partition_arguments):
+                self.trie.graft(partition_trie)
+
+        if self.engine == AHO_CORASICK_ENGINE:
+            self.trie.build_automaton()
+
+        self.finish_build_stats(start_time, number_of_keywords_before)
+        self.build_stats['number_of_partitions'] = len(partitions)
+
+        return (self.trie, self.invalid_keywords)
+
+    def read_keywords_file_in_bulk(self, keywords_file_path: str) -> List[str]:
+        """
+        Reads the whole keywords file and returns its unique, valid
+        keywords in sorted order. The invalid ones are added to
+        self.invalid_keywords, and the counts go into self.build_stats.
+        """
+        if not isinstance(keywords_file_path, str):
+            raise TypeError
+
+        with open(keywords_file_path, 'r', encoding='utf-8') as keywords_file:
+            lines: List[str] = keywords_file.read().lower().splitlines()
+
+        keywords: Set[str] = set(map(str.strip, lines))
+        keywords.discard("")
+        number_of_unique_keywords: int = len(keywords)
+        invalid_keywords: Set[str] = set()
+
+        # One regular expression call over all of the keywords joined
+        # together tells whether every one of them is valid. Only when
+        # it fails is each keyword checked on its own.
+        if not VALID_KEYWORD_PATTERN.fullmatch("".join(keywords)):
+            invalid_keywords = {
+                keyword for keyword in keywords if not VALID_KEYWORD_PATTERN.fullmatch(keyword)}
+            keywords -= invalid_keywords
+            self.invalid_keywords.update(invalid_keywords)
+
+        self.build_stats = {
+            'number_of_lines': len(lines),
+            'number_of_unique_keywords': number_of_unique_keywords,
+            'number_of_invalid_keywords': len(invalid_keywords)
+        }
+
+        return sorted(keywords)
+
+    def finish_build_stats(self, start_time: int, number_of_keywords_before: int):
+        # the rate only counts the keywords that made it into the trie,
+        # not the blank, repeated or invalid lines that were skipped
+        build_seconds: float = (time.perf_counter_ns() - start_time) / 1e9
+        number_of_keywords_added: int = self.trie.keyword_count - number_of_keywords_before
+        self.build_stats.update({
+            'number_of_keywords_added': number_of_keywords_added,
+            'build_seconds': build_seconds,
+            'keywords_per_second': number_of_keywords_added / build_seconds if build_seconds else None
+        })
+
     def process_keywords_file(self, keywords_file_path: str):
         """
         Opens the file and processes the keywords by adding 
@@ -52,12 +245,14 @@ class TrieBuilder:
     def build_trie_from_list(self) -> tuple:
         """
         Iterates through the provided set of keywords
-        and adds each one to the Trie.
+        and adds each one to the Trie. The keywords are added
+        in sorted order, so that each one gets the same keyword
+        id every time (set order changes between runs).
         """
         if not isinstance(self.user_keywords, set):
             raise TypeError
 
-        for keyword in self.user_keywords:
+        for keyword in sorted(self.user_keywords):
             self.current_normalized_keyword = keyword.lower().strip()
             self.add_keyword_to_appropriate_structure()
 
@@ -69,6 +264,8 @@ class TrieBuilder:
         """
         Adds valid keywords to the trie and
         move invalid keywords to a separate set.
+        The trie gives each new keyword the next
+        keyword id, in the order they are added.
         """
         if not isinstance(self.current_normalized_keyword, str):
             raise TypeError
@@ -88,7 +285,49 @@ class TrieBuilder:
         if not isinstance(self.current_normalized_keyword, str):
             raise TypeError
 
-        return bool(re.match("^[A-Za-z_-]*$", self.current_normalized_keyword))
+        return bool(VALID_KEYWORD_PATTERN.fullmatch(self.current_normalized_keyword))
 
     def reset_current_normalized_keyword(self):
         self.current_normalized_keyword = ""
+
+
+def partition_keywords_by_first_character(sorted_keywords: List[str]) -> List[List[str]]:
+    """
+    Splits the sorted keywords into lists that each share their
+    first character, so each list becomes its own branch of the root.
+    """
+    return [list(partition) for _, partition in groupby(sorted_keywords, key=lambda keyword: keyword[0])]
+
+
+def count_partition_nodes(sorted_keywords: List[str]) -> int:
+    """
+    Counts the nodes below the root that the sorted keywords need:
+    one for every byte past the prefix shared with the previous one.
+    """
+    node_count: int = 0
+    previous_keyword: bytes = b''
+
+    for keyword in sorted_keywords:
+        keyword_bytes: bytes = keyword.encode('utf-8')
+        shared_length: int = 0
+        shortest_length: int = min(len(keyword_bytes), len(previous_keyword))
+        while (shared_length < shortest_length
+               and keyword_bytes[shared_length] == previous_keyword[shared_length]):
+            shared_length += 1
+
+        node_count += len(keyword_bytes) - shared_length
+        previous_keyword = keyword_bytes
+
+    return node_count
+
+
+def build_keyword_partition(sorted_keywords: List[str], node_offset: int, keyword_offset: int) -> CompactTrie:
+    """
+    Builds the sub-trie for one partition in a worker process, and
+    renumbers it for the trie it gets grafted onto (see CompactTrie.shift_ids).
+    """
+    partition_trie = CompactTrie()
+    partition_trie.add_sorted_keywords(sorted_keywords)
+    partition_trie.shift_ids(node_offset, keyword_offset)
+
+    return partition_trie
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from substring_matcher.constants import NODE_BACKEND, TRIE_CACHE_SIZE, TRIE_WALK_ENGINE
+import hashlib
+import os
+from typing import Iterable, Optional, Set, Tuple
+
+
+def fingerprint_keywords(
+        keywords: Iterable[str],
+        keywords_file_path: str = None,
+        *,
+        engine: str = TRIE_WALK_ENGINE,
+        backend: str = NODE_BACKEND) -> str:
+    """
+    Returns a hash that identifies the trie these keywords would
+    build. The keywords are normalized the same way TrieBuilder
+    normalizes them, so order, case and surrounding whitespace do
+    not matter. When the keywords come from a file, its path, size
+    and modification time are part of the hash, so editing the file
+    gives a new fingerprint without the file having to be read.
+    """
+    fingerprint = hashlib.sha256(f"{engine}\0{backend}\0".encode('utf-8'))
+
+    if keywords_file_path is not None:
+        file_stats = os.stat(keywords_file_path)
+        fingerprint.update(
+            f"{os.path.abspath(keywords_file_path)}\0{file_stats.st_size}\0{file_stats.st_mtime_ns}\0".encode('utf-8'))
+
+    for keyword in sorted({keyword.lower().strip() for keyword in keywords}):
+        fingerprint.update(keyword.encode('utf-8'))
+        fingerprint.update(b'\n')
+
+    return fingerprint.hexdigest()
+
+
+class TrieCache:
+    """
+    Keeps the most recently used tries, keyed on their keyword
+    fingerprint, so that a round with the same keywords can skip
+    building the trie. The least recently used trie is dropped once
+    more than max_size tries are cached.
+    """
+
+    def __init__(self, max_size: int = TRIE_CACHE_SIZE):
+        if not isinstance(max_size, int):
+            raise TypeError
+
+        if max_size < 1:
+            raise ValueError("The cache must hold at least one trie")
+
+        self.max_size: int = max_size
+        self.tries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.tries)
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return fingerprint in self.tries
+
+    def get(self, fingerprint: str) -> Optional[Tuple[object, Set[str]]]:
+        """
+        Returns the cached (trie, invalid_keywords) pair for the
+        fingerprint, or None if it has not been built yet.
+        """
+        if fingerprint not in self.tries:
+            return None
+
+        self.tries.move_to_end(fingerprint)
+        trie, invalid_keywords = self.tries[fingerprint]
+
+        return (trie, set(invalid_keywords))
+
+    def put(self, fingerprint: str, trie, invalid_keywords: Set[str]):
+        self.tries[fingerprint] = (trie, frozenset(invalid_keywords))
+        self.tries.move_to_end(fingerprint)
+
+        while len(self.tries) > self.max_size:
+            self.tries.popitem(last=False)
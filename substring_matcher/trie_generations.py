@@ -0,0 +1,138 @@
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from substring_matcher.constants import AHO_CORASICK_ENGINE
+from substring_matcher.trie import Trie
+
+
+class TrieGenerations:
+    """
+    Holds the Trie that searches run against and swaps in new
+    generations of it. Two copies of the Trie are kept: searches run
+    against the current one, while each update is applied to the other
+    one (see Trie.update_keywords, which only patches the nodes and
+    table rows the changed keywords reach) and then swapped in. So
+    searches that already started keep running against the old
+    generation, and the first search after a swap does not pay for
+    building anything. The old generation catches up with the update
+    at the start of the next one, once its searches have finished
+    (see searching).
+    """
+
+    def __init__(self, trie: Trie):
+        if not isinstance(trie, Trie):
+            raise TypeError
+
+        self.update_lock: threading.Lock = threading.Lock()
+        self.readers_changed: threading.Condition = threading.Condition()
+        self.generation: int = 0
+        self.trie: Trie = self.prepare_trie(trie)
+        self.standby_trie: Trie = self.prepare_trie(trie.copy())
+        # the number of searches running against each of the two copies
+        self.reader_counts: Dict[Trie, int] = {self.trie: 0, self.standby_trie: 0}
+        # the keywords (to add, to remove) of the last update, which
+        # the standby Trie has not had yet
+        self.pending_update: Tuple[List[str], List[str]] = ([], [])
+
+    @staticmethod
+    def prepare_trie(trie: Trie) -> Trie:
+        """
+        Builds anything the Trie would otherwise build during its first
+        search: the Aho-Corasick links for find_matching_* (with that
+        engine) and the transition table for match_many.
+        """
+        if trie.engine == AHO_CORASICK_ENGINE and not trie.is_automaton_built:
+            trie.build_automaton()
+
+        trie.get_transition_table()
+
+        return trie
+
+    @contextmanager
+    def searching(self) -> Iterator[Trie]:
+        """
+        Yields the current generation and keeps it from being updated
+        until the block exits, so that several calls can be made
+        against the same generation (e.g. match_many, then get_keyword
+        for the ids it returned).
+        """
+        with self.readers_changed:
+            trie: Trie = self.trie
+            self.reader_counts[trie] += 1
+
+        try:
+            yield trie
+        finally:
+            with self.readers_changed:
+                # replace_trie drops the counts of the Tries it replaces
+                if trie in self.reader_counts:
+                    self.reader_counts[trie] -= 1
+                    self.readers_changed.notify_all()
+
+    def update_keywords(self, keywords_to_add: Iterable[str] = (),
+                        keywords_to_remove: Iterable[str] = ()) -> int:
+        """
+        Adds and removes keywords in a new generation, then swaps it
+        in. Returns the number of the new generation.
+
+        The cost grows with the number of nodes the changed keywords
+        reach through the failure links, not with the size of the
+        keyword set, and is paid twice: once for the new generation and
+        once when the old one catches up. Keeping the two copies doubles
+        the memory, and a keyword with a byte that no keyword had before
+        still builds the transition table again.
+        """
+        keywords_to_add = list(keywords_to_add)
+        keywords_to_remove = list(keywords_to_remove)
+
+        with self.update_lock:
+            standby_trie: Trie = self.standby_trie
+            with self.readers_changed:
+                self.readers_changed.wait_for(lambda: self.reader_counts[standby_trie] == 0)
+
+            standby_trie.update_keywords(*self.pending_update)
+            standby_trie.update_keywords(keywords_to_add, keywords_to_remove)
+            self.pending_update = (keywords_to_add, keywords_to_remove)
+
+            return self.swap_in(self.prepare_trie(standby_trie), self.trie)
+
+    def replace_trie(self, trie: Trie) -> int:
+        """Swaps in a Trie that was built separately (e.g. by a TrieBuilder)."""
+        if not isinstance(trie, Trie):
+            raise TypeError
+
+        with self.update_lock:
+            self.pending_update = ([], [])
+
+            return self.swap_in(self.prepare_trie(trie), self.prepare_trie(trie.copy()))
+
+    def swap_in(self, trie: Trie, standby_trie: Trie) -> int:
+        # Searches take the current Trie under the same lock, so each
+        # one runs against either the old generation or the new one,
+        # never a mix.
+        with self.readers_changed:
+            self.reader_counts = {
+                kept_trie: self.reader_counts.get(kept_trie, 0) for kept_trie in (trie, standby_trie)}
+            self.trie = trie
+            self.standby_trie = standby_trie
+            self.generation += 1
+
+        return self.generation
+
+    def find_matching_substrings(self, url: str) -> Set[str]:
+        with self.searching() as trie:
+            return trie.find_matching_substrings(url)
+
+    def find_matching_keyword_ids(self, url: str) -> Set[int]:
+        with self.searching() as trie:
+            return trie.find_matching_keyword_ids(url)
+
+    def match_many(self, urls: List[str]) -> Tuple[array, array]:
+        with self.searching() as trie:
+            return trie.match_many(urls)
+
+    def get_keyword(self, keyword_id: int) -> str:
+        with self.searching() as trie:
+            return trie.get_keyword(keyword_id)
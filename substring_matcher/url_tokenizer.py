@@ -0,0 +1,178 @@
+from functools import lru_cache
+from substring_matcher.constants import ALL_MATCHES, URL_COMPONENTS
+import re
+from typing import Dict, List, Pattern, Set, Tuple
+from urllib.parse import urlsplit
+
+# Valid keywords never contain a space, so joining the runs with one
+# keeps a keyword from matching across the end of one run and the
+# start of the next.
+KEYWORD_RUN_SEPARATOR: str = ' '
+
+
+@lru_cache(maxsize=None)
+def compile_keyword_run_pattern(minimum_length: int) -> Pattern:
+    """
+    Compiles a pattern for runs of the characters a valid keyword
+    can contain (see TrieBuilder.is_valid_keyword) that are at
+    least minimum_length characters long.
+    """
+    return re.compile(f"[a-z_-]{{{minimum_length},}}")
+
+
+def find_keyword_runs(url: str, minimum_length: int = 1) -> List[str]:
+    """
+    Splits the (lowercase) URL at every character no keyword can
+    contain ('/', '.', ':', '?', digits, ...) and returns the runs
+    that are long enough to hold a keyword.
+    """
+    return compile_keyword_run_pattern(minimum_length).findall(url)
+
+
+def split_url_into_components(url: str) -> List[Tuple[str, str]]:
+    """
+    Splits the URL into (component, text) pairs for the non-empty
+    components in URL_COMPONENTS. A URL without a scheme (e.g.
+    'www.arm.com/arms') is read as starting with the host.
+    """
+    url_parts = urlsplit(url)
+
+    if '://' not in url and (not url_parts.scheme or '.' in url_parts.scheme):
+        url_parts = urlsplit(f"//{url}")
+
+    return [
+        (component, text)
+        for component, text in zip(URL_COMPONENTS, (
+            url_parts.scheme, url_parts.netloc, url_parts.path,
+            url_parts.query, url_parts.fragment))
+        if text
+    ]
+
+
+class UrlTokenMatcher:
+    """
+    Matches only the parts of a URL that can hold a keyword. Since
+    valid keywords are made of letters, underscores and hyphens, no
+    match can cross a separator or a digit. The URL is split into
+    runs of keyword characters, runs shorter than the shortest
+    keyword are dropped, and the trie searches what is left in one
+    pass. Long stretches without any keyword characters (e.g. base64
+    payloads full of digits and '/') are skipped by the regular
+    expression instead of being walked character by character.
+
+    It has the same find_matching_* and get_keyword methods as the
+    tries, so it can be used wherever a trie is searched. Keywords
+    added to a trie directly (without TrieBuilder's validation) that
+    contain other characters will not be found in this mode.
+    """
+
+    def __init__(self, trie):
+        self.trie = trie
+        self.minimum_run_length: int = 1
+        self.minimum_run_length_version: int = None
+
+    @property
+    def keyword_set_version(self) -> int:
+        return self.trie.keyword_set_version
+
+    @property
+    def keyword_count(self) -> int:
+        return self.trie.keyword_count
+
+    def get_keyword(self, keyword_id: int) -> str:
+        return self.trie.get_keyword(keyword_id)
+
+    def get_minimum_run_length(self) -> int:
+        """
+        Returns the length of the shortest keyword, worked out again
+        only when the trie's keywords have changed.
+        """
+        if self.minimum_run_length_version != self.trie.keyword_set_version:
+            keyword_lengths: List[int] = [
+                len(self.trie.get_keyword(keyword_id))
+                for keyword_id in range(self.trie.keyword_count)
+                if self.trie.get_keyword(keyword_id)
+            ]
+            self.minimum_run_length = min(keyword_lengths, default=1)
+            self.minimum_run_length_version = self.trie.keyword_set_version
+
+        return self.minimum_run_length
+
+    def extract_searchable_text(self, url: str, url_is_lowercase: bool = False) -> str:
+        """
+        Returns the runs of the URL that could hold a keyword, joined
+        together. The runs come from the lowercase URL, so the trie is
+        told not to lowercase them again.
+        """
+        if not url_is_lowercase:
+            url = url.lower()
+
+        return KEYWORD_RUN_SEPARATOR.join(find_keyword_runs(url, self.get_minimum_run_length()))
+
+    def find_matching_keyword_ids(self, url: str, *, url_is_lowercase: bool = False) -> Set[int]:
+        if not isinstance(url, str):
+            raise TypeError
+
+        searchable_text: str = self.extract_searchable_text(url, url_is_lowercase)
+
+        if searchable_text == "":
+            return set()
+
+        return self.trie.find_matching_keyword_ids(searchable_text, url_is_lowercase=True)
+
+    def find_matching_substrings(self, url: str) -> Set[str]:
+        return {
+            self.trie.get_keyword(keyword_id)
+            for keyword_id in self.find_matching_keyword_ids(url)
+        }
+
+    def find_matching_spans(self, url: str, match_kind: str = ALL_MATCHES, *,
+                            url_is_lowercase: bool = False) -> List[Tuple[int, int, int]]:
+        """
+        Works like Trie.find_matching_spans, with the spans over the
+        whole (lowercase) URL. Each run is searched on its own, and
+        since no match crosses from one run into the next, picking the
+        leftmost matches run by run picks the same ones.
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        spans: List[Tuple[int, int, int]] = []
+        run_pattern: Pattern = compile_keyword_run_pattern(self.get_minimum_run_length())
+
+        if not url_is_lowercase:
+            url = url.lower()
+
+        for run in run_pattern.finditer(url):
+            spans.extend(
+                (run.start() + start, run.start() + end, keyword_id)
+                for start, end, keyword_id in self.trie.find_matching_spans(
+                    run.group(), match_kind, url_is_lowercase=True))
+
+        return spans
+
+    def has_any_match(self, url: str, *, url_is_lowercase: bool = False) -> bool:
+        if not isinstance(url, str):
+            raise TypeError
+
+        searchable_text: str = self.extract_searchable_text(url, url_is_lowercase)
+
+        return searchable_text != "" and self.trie.has_any_match(searchable_text, url_is_lowercase=True)
+
+    def find_matching_substrings_by_component(self, url: str) -> Dict[str, Set[str]]:
+        """
+        Works like find_matching_substrings, but tags each match with
+        the URL component it was found in (e.g. {'host': {'arm'},
+        'path': {'arms'}}). Components without matches are left out.
+        """
+        if not isinstance(url, str):
+            raise TypeError
+
+        matches_by_component: Dict[str, Set[str]] = {}
+
+        for component, text in split_url_into_components(url.lower()):
+            matches: Set[str] = self.find_matching_substrings(text)
+            if matches:
+                matches_by_component[component] = matches
+
+        return matches_by_component
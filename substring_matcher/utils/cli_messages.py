@@ -137,16 +137,6 @@ def display_search_results_summary(total_number_of_urls: int, number_of_urls_wit
     user_input = input("Press the 'Enter' or 'Return' key to continue.")
 
 
-def display_url_keyword_match_data_in_file(url, matches, runtime):
-    print("\n######################################")
-    print(f"URL: {url}")
-    print("\nMATCHING KEYWORDS:")
-    print(matches)
-    print(f"\nRuntime: {runtime}")
-    print("\n######################################")
-    print("\n-----------------------------------------------------------------\n")
-
-
 def display_waiting_message_during_keyword_matching():
     print("\nSEARCHING----------SEARCHING----------SEARCHING----------SEARCHING")
     print("\nOne moment while we search the URLs for keyword matches...\n")